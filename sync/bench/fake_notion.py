@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+本地 Notion API 替身（性能测试用）
+
+实现 NotionSync 用到的接口：
+- POST   /v1/databases/{id}/query     分页，支持 last_edited_time 过滤（含 and 组合）和倒序
+- GET    /v1/blocks/{id}/children     分页
+- PATCH  /v1/blocks/{id}/children     追加子 block（支持 after）
+- PATCH  /v1/blocks/{id}、DELETE /v1/blocks/{id}
+- POST   /v1/pages、GET /v1/pages/{id}、PATCH /v1/pages/{id}（修改属性 / 归档）
+测试用接口：GET /_stats（请求计数）、POST /_mutate（随机修改 / 归档页面）
+
+每个请求先等待 latency 秒，再按 rate_429 的概率返回 429；设置 rate_limit
+时超过每秒请求数也返回 429，Retry-After 为 retry_after（整数秒，和 Notion 一样；
+urllib3 不接受小数）。
+FakeNotion 在子进程里运行服务，服务端的内存和 CPU 不算进测试进程。
+"""
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bench.workspace import Workspace, NotFound
+
+ID_RE = re.compile(r'[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}')
+MAX_PAGE_SIZE = 100
+
+
+class Throttle:
+    """服务端限流：令牌桶，取不到令牌时返回 False（对应 429）"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class FakeNotionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, workspace, latency=0.0, rate_429=0.0, retry_after=1, rate_limit=None):
+        super().__init__(address, NotionHandler)
+        self.workspace = workspace
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.throttle = Throttle(rate_limit) if rate_limit else None
+        self.random = random.Random(0)
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.rate_limited = 0
+
+    def should_throttle(self):
+        with self._lock:
+            injected = self.rate_429 and self.random.random() < self.rate_429
+        return injected or (self.throttle is not None and not self.throttle.allow())
+
+    def count(self, key, throttled=False):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if throttled:
+                self.rate_limited += 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": dict(self.counts), "rate_limited": self.rate_limited,
+                    "pages": self.workspace.live_pages()}
+
+
+class NotionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive，和真实 API 一样复用连接
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self, method):
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        body = self.read_json()
+        server = self.server
+
+        if path.startswith('/_'):
+            return self.control(method, path, body)
+
+        endpoint = f"{method} {ID_RE.sub('{id}', path)}"
+        if server.latency:
+            time.sleep(server.latency)
+        if server.should_throttle():
+            server.count(endpoint, throttled=True)
+            return self.send_json(429, {"object": "error", "status": 429, "code": "rate_limited"},
+                                  headers={"Retry-After": str(server.retry_after)})
+        server.count(endpoint)
+
+        try:
+            status, result = self.route(method, path, query, body)
+        except NotFound as e:
+            status, result = 404, {"object": "error", "status": 404,
+                                   "code": "object_not_found", "message": str(e)}
+        self.send_json(status, result)
+
+    def route(self, method, path, query, body):
+        ws = self.server.workspace
+        segments = path.strip('/').split('/')
+        if segments[:1] != ['v1'] or len(segments) < 2:
+            raise NotFound(path)
+        resource, rest = segments[1], segments[2:]
+
+        if resource == 'databases' and len(rest) == 2 and rest[1] == 'query' and method == 'POST':
+            since, before = time_range(body.get('filter'))
+            descending = bool(body.get('sorts'))
+            page_ids = ws.query(rest[0], since=since, before=before, descending=descending)
+            return 200, paginate(page_ids, body.get('start_cursor'), body.get('page_size'), ws.page_object)
+
+        if resource == 'blocks' and len(rest) == 2 and rest[1] == 'children':
+            if method == 'GET':
+                blocks = ws.children(rest[0])
+                return 200, paginate(blocks, query.get('start_cursor'), query.get('page_size'))
+            if method == 'PATCH':
+                created = ws.append(rest[0], body.get('children', []), after=body.get('after'))
+                return 200, {"object": "list", "results": created, "has_more": False, "next_cursor": None}
+
+        if resource == 'blocks' and len(rest) == 1:
+            if method == 'PATCH':
+                return 200, ws.update_block(rest[0], body)
+            if method == 'DELETE':
+                return 200, ws.delete_block(rest[0])
+
+        if resource == 'pages' and not rest and method == 'POST':
+            database_id = (body.get('parent') or {}).get('database_id', '')
+            return 200, ws.create_page(database_id, body.get('properties', {}), body.get('children', []))
+
+        if resource == 'pages' and len(rest) == 1 and method == 'GET':
+            return 200, ws.page_object(rest[0])
+
+        if resource == 'pages' and len(rest) == 1 and method == 'PATCH':
+            return 200, ws.update_page(rest[0], properties=body.get('properties'), archived=body.get('archived'))
+
+        raise NotFound(f"{method} {path}")
+
+    def control(self, method, path, body):
+        if path == '/_stats' and method == 'GET':
+            return self.send_json(200, self.server.stats())
+        if path == '/_mutate' and method == 'POST':
+            return self.send_json(200, self.server.workspace.mutate(**body))
+        self.send_json(404, {"error": path})
+
+
+def time_range(query_filter):
+    """last_edited_time 过滤条件（单个或 and 组合）→ (on_or_after, on_or_before)"""
+    since = before = None
+    for item in (query_filter or {}).get('and', [query_filter] if query_filter else []):
+        condition = item.get('last_edited_time') or {}
+        since = condition.get('on_or_after', since)
+        before = condition.get('on_or_before', before)
+    return since, before
+
+
+def paginate(items, start_cursor=None, page_size=None, render=None):
+    offset = int(start_cursor or 0)
+    size = min(int(page_size or MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+    batch = items[offset:offset + size]
+    has_more = offset + size < len(items)
+    return {
+        "object": "list",
+        "results": [render(item) for item in batch] if render else batch,
+        "has_more": has_more,
+        "next_cursor": str(offset + size) if has_more else None
+    }
+
+
+def _serve(conn, workspace_options, server_options):
+    workspace = Workspace(**workspace_options)
+    server = FakeNotionServer(('127.0.0.1', 0), workspace, **server_options)
+    conn.send({"port": server.server_address[1], "databases": workspace.databases})
+    conn.close()
+    server.serve_forever()
+
+
+class FakeNotion:
+    """在子进程中运行的 Notion 替身
+
+    with FakeNotion(pages=10_000, latency=0.05) as notion:
+        sync_service.NOTION_API = notion.url
+        config['notion']['databases'] = notion.databases
+    """
+
+    def __init__(self, pages, seed=0, latency=0.0, rate_429=0.0, retry_after=1, rate_limit=None):
+        self.workspace_options = {"pages": pages, "seed": seed}
+        self.server_options = {"latency": latency, "rate_429": rate_429,
+                               "retry_after": retry_after, "rate_limit": rate_limit}
+        self.process = None
+        self.port = None
+        self.databases = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        parent, child = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=_serve, args=(child, self.workspace_options, self.server_options),
+            name='fake-notion', daemon=True)
+        self.process.start()
+        info = parent.recv()
+        self.port, self.databases = info["port"], info["databases"]
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(f"http://127.0.0.1:{self.port}{path}", data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return json.loads(resp.read())
+
+    def stats(self):
+        """{"requests": {"METHOD /path": 次数}, "rate_limited": 429 次数, "pages": 未归档页面数}"""
+        return self._call('GET', '/_stats')
+
+    def mutate(self, edit=0, archive=0, database=None, seed=None):
+        """随机修改 edit 个页面的正文、归档 archive 个页面，返回受影响的页面 ID"""
+        return self._call('POST', '/_mutate', {"edit": edit, "archive": archive,
+                                               "database": database, "seed": seed})
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+NotionSync 离线性能测试
+
+子进程里启动本地 Notion 替身（bench/fake_notion.py）和合成工作区，状态库 /
+向量库 / 镜像 / WebUI 数据库都放在临时目录，依次跑下面几个阶段，输出每个阶段的
+耗时、吞吐、Notion 请求数（按接口）和内存峰值，前后两次提交的数字可以直接对比。
+
+- cold         空状态首次 sync_all：笔记双向同步 + 全部数据库全量向量化
+- warm         什么都没改再跑 sync_all：增量查询，几乎不应该有请求
+- notes        修改一批 AI笔记 页面和 WebUI 笔记后单独跑 sync_notes_bidirectional
+- incremental  修改 / 归档一批各数据库的页面后跑 sync_all
+- resume       在子进程里从空状态跑 sync_all，--kill-after 秒后 SIGKILL，再在本进程续跑，
+               报告被杀前已完成的页面数、续跑抓取的页面数，并核对向量库缺页和重复创建的笔记
+               （代替 cold 使用，如 --stages resume,warm）
+- legacy       先按旧版代码的方式（不指定 embedding function）建好 notion / blog collection，
+               再从空状态跑 sync_all，检查能打开已部署的向量库（代替 cold 使用，如 --stages legacy,warm）
+
+用法（在 sync/ 目录下）：
+    python -m bench.run --size 1k
+    python -m bench.run --size 10k --latency 0.05 --rate-429 0.01
+    python -m bench.run --size 50k --trace-memory --json bench-50k.json
+    python -m bench.run --size 2k --stages resume,warm --kill-after 20
+    python -m bench.run --size 1k --stages legacy,warm
+
+默认用哈希向量代替 ONNX 模型（不联网、只测同步本身），--embedding onnx 使用
+真实模型（需要本地已有模型缓存）。自动总结需要 Ollama，测试中关闭。
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import resource
+import sqlite3
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import chromadb
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sync_service
+from bench.fake_notion import FakeNotion
+from bench.workspace import build_webui_db, mutate_webui_db
+
+STAGES = ('cold', 'warm', 'notes', 'incremental', 'resume', 'legacy')
+EMBEDDING_DIM = 384
+
+
+class HashEmbeddingFunction:
+    """确定性的伪向量：文本的 SHAKE-128 摘要映射到 [-0.5, 0.5)，计算量可以忽略"""
+    MODEL_NAME = 'bench-hash-384'
+
+    def __call__(self, input):
+        return [[b / 256 - 0.5 for b in hashlib.shake_128(text.encode()).digest(EMBEDDING_DIM)]
+                for text in input]
+
+
+def parse_size(value):
+    value = value.lower().strip()
+    if value.endswith('k'):
+        return int(float(value[:-1]) * 1000)
+    return int(value)
+
+
+def counter_delta(metric, before, group):
+    """两次 Counter.snapshot() 的差值，按 group(标签值元组) 汇总"""
+    totals = {}
+    for key, value in metric.snapshot().items():
+        diff = value - before.get(key, 0)
+        if diff:
+            name = group(key)
+            totals[name] = totals.get(name, 0) + diff
+    return totals
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 单位是 KB（macOS 是字节）
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def make_syncer(args, notion_url, databases, workdir):
+    """把 sync_service 的数据文件指向临时目录、Notion 请求发到本地替身，返回 NotionSync"""
+    sync_service.NOTION_API = notion_url
+    sync_service.SYNC_STATE_DB_PATH = workdir / 'sync_state.db'
+    sync_service.SYNC_STATE_PATH = workdir / 'sync_state.json'
+    sync_service.CHROMA_PATH = workdir / 'vector-db'
+    sync_service.EMBEDDING_CACHE_PATH = workdir / 'embedding_cache.db'
+    sync_service.PAGE_MIRROR_PATH = workdir / 'page_mirror.db'
+    sync_service.LEXICAL_INDEX_PATH = workdir / 'lexical_index.db'
+    sync_service.WEBUI_DB_PATH = str(workdir / 'webui.db')
+    sync_service.state_store = None
+    if args.embedding == 'hash':
+        sync_service.embedding_functions = SimpleNamespace(DefaultEmbeddingFunction=HashEmbeddingFunction)
+        sync_service.EMBEDDING_MODEL = HashEmbeddingFunction.MODEL_NAME
+    if not args.verbose:
+        sync_service.log = lambda msg: None
+
+    config = {
+        'notion': {'token': 'bench', 'rate_limit': args.notion_rate, 'databases': databases},
+        'notes': {'flow': 'bidirectional'},
+        'review': {'auto_summary': False},
+        'sync': {'fetch_workers': args.workers, 'checkpoint_pages': args.checkpoint_pages,
+                 'checkpoint_seconds': args.checkpoint_seconds}
+    }
+    syncer = sync_service.NotionSync(config)
+    # 替身是 http://，沿用生产环境 https:// 的 adapter（重试策略和连接池大小一致）
+    syncer.session.mount('http://', syncer.session.get_adapter('https://api.notion.com'))
+    return syncer
+
+
+def run_until_killed(args, notion_url, databases, workdir):
+    """resume 阶段的子进程：跑 sync_all，等父进程 SIGKILL"""
+    make_syncer(args, notion_url, databases, workdir).sync_all()
+
+
+class Bench:
+    def __init__(self, args, notion, workdir):
+        self.args = args
+        self.notion = notion
+        self.workdir = workdir
+        self.results = []
+        build_webui_db(workdir / 'webui.db', args.notes, seed=args.seed)
+        self.syncer = make_syncer(args, notion.url, notion.databases, workdir)
+
+    def run_stage(self, name, fn):
+        api_before = self.syncer.get_api_stats()
+        requests_before = sync_service.NOTION_REQUESTS.snapshot()
+        pages_before = sync_service.SYNC_PAGES.snapshot()
+        server_before = self.notion.stats()
+        if self.args.trace_memory:
+            tracemalloc.reset_peak()
+
+        error = None
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        try:
+            fn()
+        except Exception as e:
+            error = str(e)
+        seconds = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+        api = self.syncer.get_api_stats()
+        pages = counter_delta(sync_service.SYNC_PAGES, pages_before, lambda key: key[1])
+        server = self.notion.stats()
+        examined = pages.get('fetched', 0) + pages.get('skipped', 0) + pages.get('failed', 0)
+        result = {
+            "stage": name,
+            "seconds": round(seconds, 2),
+            "cpu_seconds": round(cpu, 2),
+            "pages": examined,
+            "fetched": pages.get('fetched', 0),
+            "upserted": pages.get('upserted', 0),
+            "failed": pages.get('failed', 0),
+            "pages_per_second": round(examined / seconds, 1) if seconds else None,
+            "fetched_per_second": round(pages.get('fetched', 0) / seconds, 1) if seconds else None,
+            "api": {key: api[key] - api_before[key] for key in ('requests', 'rate_limited', 'retried', 'failed')},
+            "endpoints": counter_delta(sync_service.NOTION_REQUESTS, requests_before,
+                                       lambda key: f"{key[0]} {key[1]}"),
+            "server_requests": sum(server['requests'].values()) - sum(server_before['requests'].values()),
+            "server_rate_limited": server['rate_limited'] - server_before['rate_limited'],
+            "peak_rss_mb": peak_rss_mb(),
+            "error": error
+        }
+        if self.args.trace_memory:
+            result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        self.results.append(result)
+        print_stage(result)
+        return result
+
+    def run(self, stages):
+        args = self.args
+        changes = max(1, int(args.size * args.change_ratio))
+        for stage in stages:
+            if stage == 'cold' or stage == 'warm':
+                self.run_stage(stage, self.syncer.sync_all)
+            elif stage == 'notes':
+                self.notion.mutate(edit=changes, database='AI笔记', seed=args.seed + 1)
+                note_changes = max(1, int(args.notes * args.change_ratio))
+                mutate_webui_db(sync_service.WEBUI_DB_PATH, edit=note_changes, add=note_changes,
+                                delete=note_changes, seed=args.seed + 2)
+                self.run_stage(stage, self.syncer.sync_notes_bidirectional)
+            elif stage == 'incremental':
+                self.notion.mutate(edit=changes, archive=max(1, changes // 10), seed=args.seed + 3)
+                self.run_stage(stage, self.syncer.sync_all)
+            elif stage == 'resume':
+                self.run_resume()
+            elif stage == 'legacy':
+                self.run_legacy()
+
+    def run_legacy(self):
+        """旧版代码建的 collection 持久化的是 Chroma 默认的 embedding function，同步要能直接打开它"""
+        if self.syncer.chroma is not None:
+            print("    ⚠️ legacy 需要作为第一个阶段运行（向量库已经打开），跳过", flush=True)
+            return
+        client = chromadb.PersistentClient(path=str(sync_service.CHROMA_PATH))
+        for name in ('notion', 'blog'):
+            client.get_or_create_collection(name).add(
+                ids=['legacy_doc'], documents=['旧版写入的文档'],
+                embeddings=[[0.0] * EMBEDDING_DIM], metadatas=[{"database": "旧版"}])
+        # 几篇博客，让 sync_all 也写入 blog collection
+        blogs = self.workdir / 'blogs'
+        blogs.mkdir(exist_ok=True)
+        for i in range(5):
+            (blogs / f'post{i}.md').write_text(f"# 博客 {i}\n\n正文 {i}\n", encoding='utf-8')
+        self.syncer.blog_path = blogs
+        result = self.run_stage('legacy', self.syncer.sync_all)
+        kept = result['error'] is None and all(
+            collection.get(ids=['legacy_doc'])['ids']
+            for collection in (self.syncer.collection, self.syncer.blog_collection))
+        result["legacy_doc_kept"] = kept
+        print(f"    旧版 collection {'打开成功' if result['error'] is None else '打开失败'}，"
+              f"原有文档{'保留' if kept else '丢失'}", flush=True)
+
+    def run_resume(self):
+        """子进程同步到一半被 SIGKILL，本进程从检查点续跑，然后核对结果"""
+        # spawn：子进程自己打开向量库和各个 SQLite，不继承本进程的线程和连接
+        context = multiprocessing.get_context('spawn')
+        child = context.Process(target=run_until_killed, name='bench-killed',
+                                args=(self.args, self.notion.url, self.notion.databases, self.workdir))
+        started = time.perf_counter()
+        child.start()
+        child.join(self.args.kill_after)
+        finished = not child.is_alive()
+        if not finished:
+            child.kill()
+            child.join()
+        killed_after = round(time.perf_counter() - started, 2)
+        synced_before = self.synced_pages()
+
+        result = self.run_stage('resume', self.syncer.sync_all)
+        live = self.notion.stats()['pages']
+        synced = self.synced_pages()
+        result.update({
+            "killed_after": None if finished else killed_after,
+            "synced_before_kill": synced_before,
+            "live_pages": live,
+            "missing_pages": live - synced,
+            "duplicate_notes": self.duplicate_notes()
+        })
+        print(f"    {'子进程在被杀前已完成' if finished else f'{killed_after}s 时 SIGKILL'}，"
+              f"被杀前已写入 {synced_before} 页，续跑抓取 {result['fetched']} 页；"
+              f"Notion {live} 页，向量库缺 {result['missing_pages']} 页，"
+              f"重复笔记 {result['duplicate_notes']}", flush=True)
+
+    def synced_pages(self):
+        """状态库里已写入向量库的页面数"""
+        state = self.syncer.state
+        return sum(len(state.database_pages(name)) for name in self.notion.databases)
+
+    def duplicate_notes(self):
+        """同一标题在 AI笔记 数据库或 WebUI 里出现多次的条数（合成数据的标题不重复）"""
+        pages = self.syncer.query_database_all(self.notion.databases['AI笔记'])
+        notion_titles = Counter(self.syncer.get_page_title(page) for page in pages)
+        with sqlite3.connect(str(self.workdir / 'webui.db')) as conn:
+            webui_titles = Counter(row[0] for row in conn.execute("SELECT title FROM note"))
+        return sum(count - 1 for titles in (notion_titles, webui_titles)
+                   for count in titles.values() if count > 1)
+
+
+def print_stage(r):
+    line = (f"[{r['stage']:<11}] {r['seconds']:>8.2f}s  CPU {r['cpu_seconds']:>7.2f}s  "
+            f"页面 {r['pages']:>6} (抓取 {r['fetched']}, {r['pages_per_second'] or 0:.1f} 页/s)  "
+            f"请求 {r['api']['requests']:>6}  429 {r['server_rate_limited']} (客户端 {r['api']['rate_limited']})  "
+            f"RSS 峰值 {r['peak_rss_mb']} MB")
+    if 'peak_traced_mb' in r:
+        line += f"  堆峰值 {r['peak_traced_mb']} MB"
+    print(line, flush=True)
+    for endpoint, count in sorted(r['endpoints'].items(), key=lambda item: -item[1]):
+        print(f"    {count:>7}  {endpoint}")
+    if r['error']:
+        print(f"    ❌ {r['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NotionSync 离线性能测试')
+    parser.add_argument('--size', default='1k', help='Notion 页面总数，如 1k / 10k / 50k')
+    parser.add_argument('--notes', type=int, help='WebUI 笔记数（默认页面数的 10%%）')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'逗号分隔，可选 {", ".join(STAGES)}')
+    parser.add_argument('--latency', type=float, default=0.0, help='替身每个请求的延迟（秒）')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='随机返回 429 的概率')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应的 Retry-After（整数秒，和 Notion 一致）')
+    parser.add_argument('--server-rate', type=float, help='替身每秒最多处理的请求数，超出返回 429')
+    parser.add_argument('--notion-rate', type=float, default=1000, help='客户端限流 notion.rate_limit')
+    parser.add_argument('--workers', type=int, default=8, help='sync.fetch_workers')
+    parser.add_argument('--change-ratio', type=float, default=0.02, help='notes / incremental 阶段修改的比例')
+    parser.add_argument('--kill-after', type=float, default=10, help='resume 阶段子进程运行多少秒后被杀')
+    parser.add_argument('--checkpoint-pages', type=int, default=500, help='sync.checkpoint_pages')
+    parser.add_argument('--checkpoint-seconds', type=float, default=30, help='sync.checkpoint_seconds')
+    parser.add_argument('--embedding', choices=('hash', 'onnx'), default='hash')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true', help='用 tracemalloc 统计每个阶段的 Python 堆峰值（较慢）')
+    parser.add_argument('--json', help='结果另存为 JSON')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录')
+    parser.add_argument('--verbose', action='store_true', help='输出同步日志')
+    args = parser.parse_args()
+    args.size = parse_size(args.size)
+    if args.notes is None:
+        args.notes = args.size // 10
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"未知阶段: {', '.join(sorted(unknown))}")
+
+    workdir = Path(tempfile.mkdtemp(prefix='notion-bench-'))
+    notion = FakeNotion(args.size, seed=args.seed, latency=args.latency, rate_429=args.rate_429,
+                        retry_after=args.retry_after, rate_limit=args.server_rate)
+    print(f"📦 工作区: {args.size} 页, WebUI 笔记 {args.notes} 条, 延迟 {args.latency}s, "
+          f"429 概率 {args.rate_429}, 目录 {workdir}", flush=True)
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        with notion:
+            bench = Bench(args, notion, workdir)
+            bench.run(stages)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"args": vars(args), "stages": bench.results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
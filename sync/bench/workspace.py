@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+合成 Notion 工作区和 WebUI 笔记库（性能测试用）
+
+Workspace(pages) 按 DATABASE_SHARES 把页面分到 4 个数据库。页面正文不预先生成：
+GET children 时按 (页面 ID, 版本号) 确定性地生成，只有被写过的页面才把
+block 列表保存在内存里，5 万页的工作区也只占页面元数据的内存。
+生成的 block ID 前 20 位取自页面 ID，写 block 时据此找到所属页面；
+写入时新建的 block 用随机 ID，另外记录所属页面。
+
+build_webui_db() / mutate_webui_db() 生成和修改 Open WebUI 的 user / note 表。
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+DATABASE_SHARES = {"AI笔记": 0.4, "复盘": 0.3, "闪念": 0.2, "目标": 0.1}
+CATEGORIES = ["交易", "学习", "健康", "工作", "生活"]
+WORDS = [
+    "复盘", "交易", "仓位", "止损", "情绪", "计划", "执行", "市场", "趋势", "回撤",
+    "笔记", "模型", "向量", "同步", "阅读", "目标", "习惯", "健身", "睡眠", "预算",
+    "AAPL", "NVDA", "BTC", "python", "notion", "ollama", "sqlite", "embedding",
+]
+BLOCK_TYPES = ["paragraph"] * 6 + ["heading_2", "bulleted_list_item", "bulleted_list_item", "toggle"]
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class NotFound(Exception):
+    pass
+
+
+def format_time(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f"{dt.microsecond // 1000:03d}Z"
+
+
+def now_time():
+    return format_time(datetime.now(timezone.utc))
+
+
+def make_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def make_text(rng, min_words=8, max_words=60):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ''.join(w if not w.isascii() else f" {w} " for w in words).strip() + "。"
+
+
+def rich_text(text):
+    return [{"type": "text", "text": {"content": text}, "plain_text": text}]
+
+
+def normalize_rich_text(items):
+    """客户端写入的 rich_text 补上 plain_text"""
+    result = []
+    for item in items or []:
+        text = item.get('plain_text') or (item.get('text') or {}).get('content', '')
+        result.append({"type": "text", "text": {"content": text}, "plain_text": text})
+    return result
+
+
+class Workspace:
+    def __init__(self, pages, seed=0, blocks=(5, 30)):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.blocks_range = blocks
+        self._lock = threading.RLock()
+        self.databases = {name: make_id(rng) for name in DATABASE_SHARES}
+        self.pages = {}         # page_id → 页面元数据
+        self.by_prefix = {}     # page_id 去掉横线的前 20 位 → page_id
+        self.written = {}       # page_id → 被写过的页面的 block 列表
+        self.block_owner = {}   # 写入时创建的 block（随机 ID）→ page_id
+        self._queries = {}      # (database_id, since, before, descending) → 页面 ID 列表，写入时清空
+
+        names = list(DATABASE_SHARES)
+        counts = [int(pages * DATABASE_SHARES[name]) for name in names]
+        counts[0] += pages - sum(counts)
+        minute = 0
+        for name, count in zip(names, counts):
+            for _ in range(count):
+                self._add_page(make_id(rng), self.databases[name],
+                               title=f"{name} {minute:06d}",
+                               category=rng.choice(CATEGORIES) if name == "AI笔记" else None,
+                               last_edited=format_time(BASE_TIME + timedelta(minutes=minute)))
+                minute += 1
+
+    def _add_page(self, page_id, database_id, title, category, last_edited, version=0):
+        self.pages[page_id] = {
+            "database_id": database_id, "title": title, "category": category,
+            "created": last_edited, "last_edited": last_edited,
+            "version": version, "archived": False, "extra": {}
+        }
+        self.by_prefix[page_id.replace('-', '')[:20]] = page_id
+
+    def live_pages(self):
+        with self._lock:
+            return sum(1 for p in self.pages.values() if not p["archived"])
+
+    def _page(self, page_id):
+        page_id = format_id(page_id)
+        page = self.pages.get(page_id)
+        if page is None:
+            raise NotFound(page_id)
+        return page_id, page
+
+    def _touch(self, page):
+        page["last_edited"] = now_time()
+        self._queries.clear()
+        return page["last_edited"]
+
+    # ==================== 读 ====================
+
+    def query(self, database_id, since=None, before=None, descending=False):
+        database_id = format_id(database_id)
+        key = (database_id, since, before, descending)
+        with self._lock:
+            cached = self._queries.get(key)
+            if cached is None:
+                cached = [pid for pid, p in self.pages.items()
+                          if p["database_id"] == database_id and not p["archived"]
+                          and (not since or p["last_edited"] >= since)
+                          and (not before or p["last_edited"] <= before)]
+                if descending:
+                    cached.sort(key=lambda pid: self.pages[pid]["last_edited"], reverse=True)
+                self._queries[key] = cached
+            return cached
+
+    def page_object(self, page_id):
+        with self._lock:
+            page_id, page = self._page(page_id)
+            properties = {
+                "名称": {"id": "title", "type": "title", "title": rich_text(page["title"])},
+                "分类": {"id": "category", "type": "select",
+                         "select": {"name": page["category"]} if page["category"] else None},
+            }
+            properties.update(page["extra"])
+            return {
+                "object": "page", "id": page_id,
+                "created_time": page["created"], "last_edited_time": page["last_edited"],
+                "archived": page["archived"],
+                "parent": {"type": "database_id", "database_id": page["database_id"]},
+                "properties": properties
+            }
+
+    def children(self, block_id):
+        block_id = format_id(block_id)
+        with self._lock:
+            if block_id in self.written:
+                return list(self.written[block_id])
+            if block_id in self.pages:
+                return self._generate_page_blocks(block_id)
+        return self._generate_toggle_children(block_id)
+
+    def _generate_page_blocks(self, page_id):
+        page = self.pages[page_id]
+        rng = random.Random(f"{self.seed}:{page_id}:{page['version']}")
+        prefix = page_id.replace('-', '')[:20]
+        blocks = []
+        for i in range(rng.randint(*self.blocks_range)):
+            block_type = rng.choice(BLOCK_TYPES)
+            text = make_text(rng, 2, 8) if block_type == "heading_2" else make_text(rng)
+            block_id = format_id(f"{prefix}{page['version']:04x}{i:08x}")
+            blocks.append(make_block(block_id, block_type, text, page["last_edited"],
+                                     has_children=block_type == "toggle"))
+        return blocks
+
+    def _generate_toggle_children(self, block_id):
+        rng = random.Random(f"{self.seed}:{block_id}")
+        return [make_block(make_id(rng), "paragraph", make_text(rng), format_time(BASE_TIME))
+                for _ in range(rng.randint(1, 4))]
+
+    # ==================== 写 ====================
+
+    def _owner(self, block_id):
+        """block 所在页面的 ID（只支持页面的直接子 block）"""
+        page_id = self.block_owner.get(block_id) or self.by_prefix.get(block_id.replace('-', '')[:20])
+        if page_id is None:
+            raise NotFound(block_id)
+        return page_id
+
+    def _materialize(self, page_id):
+        if page_id not in self.written:
+            self.written[page_id] = self._generate_page_blocks(page_id)
+        return self.written[page_id]
+
+    def create_page(self, database_id, properties, children):
+        with self._lock:
+            page_id = str(uuid.uuid4())
+            title = ''.join(t.get('text', {}).get('content', '') for t in properties.get('名称', {}).get('title', []))
+            category = (properties.get('分类', {}).get('select') or {}).get('name')
+            self._add_page(page_id, format_id(database_id), title, category, now_time())
+            self._queries.clear()
+            self.written[page_id] = []
+            self.append(page_id, children)
+            return self.page_object(page_id)
+
+    def update_page(self, page_id, properties=None, archived=None):
+        with self._lock:
+            page_id, page = self._page(page_id)
+            for name, value in (properties or {}).items():
+                if name == '名称':
+                    page["title"] = ''.join(t.get('text', {}).get('content', '') for t in value.get('title', []))
+                elif name == '分类':
+                    page["category"] = (value.get('select') or {}).get('name')
+                elif 'rich_text' in value:
+                    page["extra"][name] = {"type": "rich_text", "rich_text": normalize_rich_text(value['rich_text'])}
+            if archived is not None:
+                page["archived"] = bool(archived)
+            self._touch(page)
+            return self.page_object(page_id)
+
+    def append(self, parent_id, children, after=None):
+        with self._lock:
+            parent_id, page = self._page(parent_id)
+            blocks = self._materialize(parent_id)
+            edited = self._touch(page)
+            created = [make_block(str(uuid.uuid4()), child.get('type', 'paragraph'),
+                                  ''.join(t['plain_text'] for t in normalize_rich_text(
+                                      child.get(child.get('type', 'paragraph'), {}).get('rich_text'))),
+                                  edited)
+                       for child in children]
+            position = len(blocks)
+            if after:
+                position = next((i + 1 for i, b in enumerate(blocks) if b["id"] == format_id(after)), position)
+            blocks[position:position] = created
+            self.block_owner.update((b["id"], parent_id) for b in created)
+            return created
+
+    def update_block(self, block_id, payload):
+        with self._lock:
+            block_id = format_id(block_id)
+            page_id = self._owner(block_id)
+            blocks = self._materialize(page_id)
+            block = next((b for b in blocks if b["id"] == block_id), None)
+            if block is None:
+                raise NotFound(block_id)
+            content = payload.get(block["type"])
+            if content is not None:
+                block[block["type"]] = {"rich_text": normalize_rich_text(content.get('rich_text'))}
+            block["last_edited_time"] = self._touch(self.pages[page_id])
+            return block
+
+    def delete_block(self, block_id):
+        with self._lock:
+            block_id = format_id(block_id)
+            page_id = self._owner(block_id)
+            blocks = self._materialize(page_id)
+            for i, block in enumerate(blocks):
+                if block["id"] == block_id:
+                    del blocks[i]
+                    block["last_edited_time"] = self._touch(self.pages[page_id])
+                    return dict(block, archived=True)
+            raise NotFound(block_id)
+
+    def mutate(self, edit=0, archive=0, database=None, seed=None):
+        """模拟用户在 Notion 里的编辑：edit 个页面换一版正文，archive 个页面归档"""
+        with self._lock:
+            rng = random.Random(seed)
+            database_id = self.databases.get(database) if database else None
+            candidates = [pid for pid, p in self.pages.items()
+                          if not p["archived"] and (database_id is None or p["database_id"] == database_id)]
+            chosen = rng.sample(candidates, min(len(candidates), edit + archive))
+            for page_id in chosen[:edit]:
+                page = self.pages[page_id]
+                page["version"] += 1
+                self.written.pop(page_id, None)
+                self._touch(page)
+            for page_id in chosen[edit:]:
+                page = self.pages[page_id]
+                page["archived"] = True
+                self._touch(page)
+            return {"edited": chosen[:edit], "archived": chosen[edit:]}
+
+
+def format_id(raw_id):
+    clean = raw_id.replace('-', '')
+    if len(clean) == 32:
+        return f"{clean[:8]}-{clean[8:12]}-{clean[12:16]}-{clean[16:20]}-{clean[20:]}"
+    return raw_id
+
+
+def make_block(block_id, block_type, text, edited, has_children=False):
+    return {
+        "object": "block", "id": block_id, "type": block_type,
+        "created_time": edited, "last_edited_time": edited,
+        "has_children": has_children, "archived": False,
+        block_type: {"rich_text": rich_text(text)}
+    }
+
+
+# ==================== WebUI 笔记库 ====================
+
+def build_webui_db(path, notes, seed=0):
+    """生成只有 user / note 两张表的 WebUI 数据库，返回用户 ID"""
+    rng = random.Random(seed)
+    user_id = make_id(rng)
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        CREATE TABLE user (id TEXT PRIMARY KEY, name TEXT, email TEXT, role TEXT, created_at BIGINT);
+        CREATE TABLE note (
+            id TEXT PRIMARY KEY, user_id TEXT, title TEXT, data JSON, meta JSON,
+            access_control JSON, created_at BIGINT, updated_at BIGINT
+        );
+    """)
+    conn.execute("INSERT INTO user VALUES (?, 'bench', 'bench@example.com', 'admin', ?)",
+                 (user_id, int(time.time())))
+    now = int(time.time() * 1_000_000_000)
+    conn.executemany(
+        "INSERT INTO note (id, user_id, title, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        ((make_id(rng), user_id, f"【{rng.choice(CATEGORIES)}】笔记 {i:06d}",
+          note_data(rng), now - i, now - i) for i in range(notes)))
+    conn.commit()
+    conn.close()
+    return user_id
+
+
+def mutate_webui_db(path, edit=0, add=0, delete=0, seed=None):
+    """模拟用户在 WebUI 里编辑 / 新建 / 删除笔记，返回各自的数量"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(str(path))
+    ids = [row[0] for row in conn.execute("SELECT id FROM note ORDER BY id")]
+    user_id = conn.execute("SELECT id FROM user LIMIT 1").fetchone()[0]
+    chosen = rng.sample(ids, min(len(ids), edit + delete))
+    now = int(time.time() * 1_000_000_000)
+    conn.executemany("UPDATE note SET data = ?, updated_at = ? WHERE id = ?",
+                     ((note_data(rng), now, note_id) for note_id in chosen[:edit]))
+    conn.executemany("DELETE FROM note WHERE id = ?", ((note_id,) for note_id in chosen[edit:]))
+    conn.executemany(
+        "INSERT INTO note (id, user_id, title, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        ((make_id(rng), user_id, f"【{rng.choice(CATEGORIES)}】新笔记 {i:06d}", note_data(rng), now, now)
+         for i in range(add)))
+    conn.commit()
+    conn.close()
+    return {"edited": len(chosen[:edit]), "deleted": len(chosen[edit:]), "added": add}
+
+
+def note_data(rng):
+    content = '\n\n'.join(make_text(rng) for _ in range(rng.randint(2, 8)))
+    return json.dumps({"content": {"md": content}}, ensure_ascii=False)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+博客目录增量索引
+
+docker-compose 把博客仓库只读挂载到 /blogs，其中的 Markdown 写入 blog collection。
+状态库的 blog_files 表是 manifest（路径 → size / mtime / 内容哈希 / 块 ID）：
+- scan_markdown(root)           : 只 stat 不读文件，返回 {相对路径: (size, mtime_ns)}
+- scan_paths(root, paths)       : 只 stat 给定的文件 / 目录（文件监听报告的路径）
+- diff_manifest(files, manifest): size 或 mtime 变了的文件、已删除的文件
+- parse_files(root, paths)      : 读取并解析变化的文件，文件多时用进程池；
+                                  内容哈希没变的（只是 touch 过）由调用方只更新 manifest
+parse_markdown() 去掉 front matter，按标题 / 空行切成 chunker 使用的 [(block_type, text)]。
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+SKIP_DIRS = {'node_modules', '__pycache__'}
+POOL_THRESHOLD = 16     # 变化的文件少于这个数时直接在当前进程解析，不值得起进程池
+
+FRONT_MATTER_RE = re.compile(r'\A---\s*\n(.*?)\n---\s*(?:\n|\Z)', re.S)
+FRONT_TITLE_RE = re.compile(r'^title:\s*["\']?(.*?)["\']?\s*$', re.M)
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+FENCE_RE = re.compile(r'^(```|~~~)')
+
+
+def scan_markdown(root):
+    """递归列出 root 下的 Markdown 文件（跳过隐藏目录），返回 {相对路径: (size, mtime_ns)}"""
+    files = {}
+    root = str(root)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIP_DIRS:
+                    stack.append(entry.path)
+            elif entry.name.lower().endswith(MARKDOWN_SUFFIXES):
+                stat = entry.stat()
+                files[os.path.relpath(entry.path, root)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def scan_paths(root, paths):
+    """只扫描给定的相对路径，返回 (files, covers)
+
+    files 同 scan_markdown；covers(path) 判断 manifest 里的某个文件是否在扫描范围内
+    （不在 files 里又在范围内的就是被删除了）。'' 表示整个目录。
+    """
+    paths = set(paths)
+    if '' in paths:
+        return scan_markdown(root), lambda path: True
+    files = {}
+    for path in paths:
+        if any(part.startswith('.') or part in SKIP_DIRS for part in path.split(os.sep)):
+            continue
+        full_path = os.path.join(str(root), path)
+        if os.path.isdir(full_path):
+            files.update({os.path.join(path, sub): stat for sub, stat in scan_markdown(full_path).items()})
+        elif path.lower().endswith(MARKDOWN_SUFFIXES) and os.path.isfile(full_path):
+            stat = os.stat(full_path)
+            files[path] = (stat.st_size, stat.st_mtime_ns)
+    prefixes = tuple(path + os.sep for path in paths)
+    return files, lambda path: path in paths or path.startswith(prefixes)
+
+
+def diff_manifest(files, manifest):
+    """返回 (changed, removed)：新增或 size / mtime 变化的路径，manifest 里有但已删除的路径"""
+    changed = [path for path, (size, mtime_ns) in files.items()
+               if path not in manifest
+               or manifest[path]['size'] != size or manifest[path]['mtime_ns'] != mtime_ns]
+    removed = [path for path in manifest if path not in files]
+    return sorted(changed), sorted(removed)
+
+
+def parse_markdown(path):
+    """读取一个 Markdown 文件，返回 {content_hash, title, segments}，失败时返回 {error}
+
+    在进程池里执行，只能用模块级函数和可 pickle 的返回值
+    """
+    try:
+        raw = Path(path).read_bytes()
+    except OSError as e:
+        return {"error": str(e)}
+    text = raw.decode('utf-8', errors='replace').replace('\r\n', '\n')
+
+    title = None
+    front = FRONT_MATTER_RE.match(text)
+    if front:
+        match = FRONT_TITLE_RE.search(front.group(1))
+        if match and match.group(1):
+            title = match.group(1)
+        text = text[front.end():]
+
+    segments = []
+    paragraph = []
+    in_fence = False
+
+    def flush():
+        if paragraph:
+            segments.append(('paragraph', '\n'.join(paragraph)))
+            paragraph.clear()
+
+    for line in text.split('\n'):
+        if FENCE_RE.match(line.strip()):
+            in_fence = not in_fence
+            paragraph.append(line)
+            if not in_fence:
+                flush()
+            continue
+        if in_fence:
+            paragraph.append(line)
+            continue
+        heading = HEADING_RE.match(line)
+        if heading:
+            flush()
+            level = min(len(heading.group(1)), 3)
+            segments.append((f'heading_{level}', heading.group(2)))
+            if title is None and level == 1:
+                title = heading.group(2)
+        elif not line.strip():
+            flush()
+        else:
+            paragraph.append(line)
+    flush()
+
+    return {
+        "content_hash": hashlib.sha1(raw).hexdigest(),
+        "title": title or Path(path).stem,
+        "segments": segments
+    }
+
+
+def parse_files(root, paths, workers=4):
+    """按输入顺序产出 (相对路径, parse_markdown 的结果)
+
+    进程池用 spawn 启动：同步服务里线程很多（任务、监听、限流、SQLite / Chroma），
+    fork 会把其他线程持有的锁一起复制进子进程，子进程可能卡死
+    """
+    full_paths = [os.path.join(str(root), path) for path in paths]
+    if len(paths) < POOL_THRESHOLD or workers <= 1:
+        for path, full_path in zip(paths, full_paths):
+            yield path, parse_markdown(full_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from zip(paths, pool.map(parse_markdown, full_paths, chunksize=8))
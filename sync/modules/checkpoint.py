@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+检查点节奏
+
+长时间的同步每处理 every 个单位（页面 / 笔记）或每隔 seconds 秒保存一次进度，
+进程被杀或请求超时后下次从最近的检查点继续：
+
+    timer = CheckpointTimer(every=500, seconds=30)
+    for page in pages:
+        if timer.tick():
+            save_progress()
+        process(page)
+"""
+import time
+
+
+class CheckpointTimer:
+    def __init__(self, every=500, seconds=30.0, clock=time.monotonic):
+        self.every = max(1, int(every))
+        self.seconds = float(seconds)
+        self.clock = clock
+        self._count = 0
+        self._last = clock()
+
+    def tick(self, n=1):
+        """计数 +n，到达 every 个或距上次检查点超过 seconds 秒时返回 True 并重新计时"""
+        self._count += n
+        now = self.clock()
+        if self._count >= self.every or now - self._last >= self.seconds:
+            self._count = 0
+            self._last = now
+            return True
+        return False
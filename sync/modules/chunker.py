@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+页面分块
+
+把 Notion 页面的 block 段落切成适合 embedding 的小块：
+- 标题（heading_1/2/3）开始新的一节，节内每个块都以标题开头
+- 节内按段落累积，切分点由段落内容决定（段落哈希选中时在它之后切分，平均块长约
+  max_chars / 2），超过 max_chars 时才强制切分；超长段落按字符切开
+  这样改动一个段落只影响它所在的块（最多到下一个内容切分点），其余块 ID 不变
+- 同一节内相邻块之间保留 overlap 字符左右的重叠段落（overlap 最多为 max_chars 的一半）
+
+块 ID 由页面 ID + 内容哈希构成，内容不变 ID 就不变，
+同步时只需要对新出现的 ID 做 embedding，消失的 ID 删除即可。
+"""
+import hashlib
+
+HEADING_TYPES = {'heading_1', 'heading_2', 'heading_3'}
+
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def clamp_overlap(max_chars, overlap):
+    """overlap 限制在 [0, max_chars // 2]：不小于 max_chars 时切分窗口不前进或每次只前进一个字符"""
+    return max(0, min(int(overlap), int(max_chars) // 2))
+
+
+def chunk_segments(segments, max_chars=800, overlap=150):
+    """[(block_type, text)] → [chunk_text]"""
+    max_chars = max(1, int(max_chars))
+    overlap = clamp_overlap(max_chars, overlap)
+    sections = []
+    heading, paragraphs = None, []
+    for block_type, text in segments:
+        text = text.strip()
+        if not text:
+            continue
+        if block_type in HEADING_TYPES:
+            if heading or paragraphs:
+                sections.append((heading, paragraphs))
+            heading, paragraphs = text, []
+        else:
+            paragraphs.extend(_split_long(text, max_chars, overlap))
+    if heading or paragraphs:
+        sections.append((heading, paragraphs))
+
+    chunks = []
+    for heading, paragraphs in sections:
+        chunks.extend(_pack_section(heading, paragraphs, max_chars, overlap))
+    return chunks
+
+
+def _split_long(text, max_chars, overlap):
+    if len(text) <= max_chars:
+        return [text]
+    step = max_chars - overlap
+    return [text[i:i + max_chars] for i in range(0, len(text) - overlap, step)]
+
+
+def _is_boundary(para, target):
+    """是否在这个段落之后切分：只看段落本身的内容，选中概率约为 len(para) / target"""
+    h = int(hashlib.sha1(para.encode()).hexdigest()[:8], 16)
+    return h % 10_000 < 10_000 * len(para) / target
+
+
+def _pack_section(heading, paragraphs, max_chars, overlap):
+    if not paragraphs:
+        return [heading]
+
+    target = max(max_chars // 2, 1)
+    chunks = []
+    current = []
+    size = 0
+    fresh = False   # current 里是否有上一块没有的段落（不只是带过来的重叠段落）
+
+    def cut():
+        nonlocal current, size, fresh
+        chunks.append(_join(heading, current))
+        # 从上一块末尾带上不超过 overlap 的段落
+        carried = []
+        carried_size = 0
+        for prev in reversed(current):
+            if carried_size + len(prev) > overlap:
+                break
+            carried.insert(0, prev)
+            carried_size += len(prev)
+        current, size, fresh = carried, carried_size, False
+
+    for para in paragraphs:
+        if size + len(para) > max_chars:
+            if fresh:
+                cut()
+            if size + len(para) > max_chars:
+                # 重叠段落放不下就不带
+                current, size = [], 0
+        current.append(para)
+        size += len(para)
+        fresh = True
+        if _is_boundary(para, target):
+            cut()
+    if fresh:
+        chunks.append(_join(heading, current))
+    return chunks
+
+
+def _join(heading, paragraphs):
+    return '\n'.join(([heading] if heading else []) + paragraphs)
+
+
+def chunk_ids(prefix, chunks):
+    """块内容 → 稳定 ID，同一页面内重复的块加序号区分"""
+    seen = {}
+    ids = []
+    for text in chunks:
+        h = chunk_hash(text)
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        ids.append(f"{prefix}_{h}" if n == 0 else f"{prefix}_{h}_{n}")
+    return ids
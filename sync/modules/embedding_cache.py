@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Embedding 缓存
+
+同样的文本会被反复 embedding（重新同步只改了时间戳的页面、重建 collection、
+多个数据库里相同的段落）。EmbeddingCache 以 (模型名, 文本哈希) 为键把向量
+存进 SQLite，按最近使用时间做 LRU 淘汰；CachedEmbeddingFunction 包在 Chroma
+的 embedding function 外面，只把没命中的文本交给 ONNX 模型。
+
+模型名必须由调用方明确给出（模型 + 版本）：换了模型而模型名不变，缓存会继续返回旧模型的向量。
+
+CachedEmbeddingFunction 不绑定到 collection（没有 name() / 配置，Chroma 1.x 会认为和
+已持久化的 default 冲突），由调用方算好向量后通过 embeddings= / query_embeddings= 传入。
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+from chromadb.api.types import EmbeddingFunction
+
+
+def text_key(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path, max_entries=200_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def get_many(self, model, keys):
+        """返回 {hash: [float]}，并刷新命中项的使用时间"""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, key) for key in found]
+                )
+                self._conn.commit()
+            self.stats["hits"] += sum(1 for key in keys if key in found)
+            self.stats["misses"] += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, model, items):
+        """items: [(hash, vector)]"""
+        now = time.time()
+        rows = [(model, key, array('f', vector).tobytes(), now) for key, vector in items]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # 一次多淘汰 10%，避免每次写入都触发
+        target = int(self.max_entries * 0.9)
+        excess = self._size - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._size = target
+        self.stats["evicted"] += excess
+
+    def snapshot(self):
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=self._size, max_entries=self.max_entries,
+                        hit_ratio=round(self.stats["hits"] / total, 4) if total else None)
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """带缓存的 embedding function，inner 为实际计算向量的 Chroma embedding function
+
+    model_name 是缓存键的一部分，不能为空；on_compute(batch_size, seconds) 在每次实际调用
+    inner 之后回调（用于监控）
+    """
+
+    def __init__(self, inner, cache, model_name, on_compute=None):
+        if not model_name:
+            raise ValueError("CachedEmbeddingFunction 需要明确的模型名（模型 + 版本）")
+        self.inner = inner
+        self.cache = cache
+        self.model_name = model_name
+        self.on_compute = on_compute
+
+    def __call__(self, input):
+        keys = [text_key(text) for text in input]
+        found = self.cache.get_many(self.model_name, keys)
+
+        missing = {}
+        for key, text in zip(keys, input):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            started = time.monotonic()
+            vectors = self.inner(list(missing.values()))
+            if self.on_compute:
+                self.on_compute(len(missing), time.monotonic() - started)
+            computed = list(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            for key, vector in computed:
+                found[key] = [float(x) for x in vector]
+
+        return [found[key] for key in keys]
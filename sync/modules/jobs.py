@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+后台任务和定时调度
+
+- JobRunner.submit(kind) 把任务放进队列立即返回 Job；同类任务正在排队或执行时
+  直接返回那个任务（合并请求），不会重复启动。merge_running=False 时只合并到排队中的
+  任务：正在执行的任务可能已经读过数据，新的变化需要再跑一次（文件监听）
+- 单个工作线程按顺序执行任务，执行函数通过 job.update() 上报各阶段进度
+- schedule(kind, interval) 每隔 interval 秒自动提交一次任务
+"""
+import copy
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+
+class Job:
+    def __init__(self, kind, source):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.source = source
+        self.status = 'pending'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.coalesced = 0      # 合并进来的重复请求数
+        self.progress = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def update(self, phase, database=None, **info):
+        """上报进度：update('vector', database='复盘', done=10, total=50)"""
+        with self._lock:
+            entry = self.progress.setdefault(phase, {})
+            if database:
+                entry = entry.setdefault('databases', {}).setdefault(database, {})
+            entry.update(info)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def active(self):
+        return self.status in ('pending', 'running')
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "source": self.source,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+                "error": self.error,
+                "coalesced": self.coalesced,
+                "progress": copy.deepcopy(self.progress)
+            }
+
+
+class JobRunner:
+    def __init__(self, handlers, log=print, history=50):
+        self.handlers = handlers        # kind → fn(job)，返回值记为 job.result
+        self.log = log
+        self.history = history
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+
+    def start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='job-runner', daemon=True)
+                self._worker.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+
+    def submit(self, kind, source='api', merge_running=True):
+        """返回 (job, coalesced)"""
+        if kind not in self.handlers:
+            raise ValueError(f"未知任务类型: {kind}")
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.kind == kind and (job.status == 'pending' or merge_running and job.active):
+                    job.coalesced += 1
+                    return job, True
+
+            job = Job(kind, source)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.active:
+                    break
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def schedule(self, kind, interval):
+        """每隔 interval 秒提交一次 kind 任务，interval <= 0 时不调度"""
+        if not interval or interval <= 0:
+            return None
+
+        def loop():
+            while not self._stop.wait(interval):
+                job, coalesced = self.submit(kind, source='schedule')
+                if coalesced:
+                    self.log(f"⏰ 定时{kind}：上一次任务 {job.id} 仍在进行，跳过")
+
+        thread = threading.Thread(target=loop, name=f'schedule-{kind}', daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self._queue.get()
+            if job is None:
+                break
+            job.status = 'running'
+            job.started_at = datetime.now().isoformat()
+            started = time.monotonic()
+            try:
+                job.result = self.handlers[job.kind](job)
+                job.status = 'done'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                self.log(f"❌ 任务 {job.kind} ({job.id}) 失败: {e}")
+                traceback.print_exc()
+            finally:
+                job.finished_at = datetime.now().isoformat()
+                job.update('total', seconds=round(time.monotonic() - started, 2))
+                job._done.set()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+BM25 关键词索引（SQLite）
+
+向量检索对人名、股票代码、单号这类精确词经常召回不到。LexicalIndex 为
+notion collection 的每个块建一份倒排索引：
+- 分词：中日韩文字按相邻两字切分（bigram），字母数字按连续串切分并转小写
+- 存储：postings(term, doc_id, tf, impact) + docs(doc_id, length, database, last_edited_ts)
+  + terms(term, df)，持久化在 SQLite；df 随写入 / 删除增减，查询不用再数 postings
+- 打分：impact 是去掉 idf 的 BM25 词项得分，写入时按参考平均长度算好，
+  实际平均长度偏离参考值超过 AVG_LENGTH_DRIFT 时整体重算；倒排按 impact 降序读取，
+  剩下的 posting 不可能让文档进入前 limit 名时提前停止（top-k 提前终止），
+  常见词不再把几万条 posting 全部读出来打分
+- 更新：和 Chroma collection 同样的 upsert(ids, documents, metadatas) / update(ids, metadatas)
+  / delete(ids) 接口，由 UpsertBuffer 在写 Chroma 的同时写入，保持一致
+- 过滤：search(query, limit, where) 的 where 是 search_where() 生成的 Chroma 条件
+  （database、last_edited_ts），在 SQL 里先过滤再排名，limit 不会被其他数据库的文档占满
+
+rrf_fuse() 用于把 BM25 和向量检索的排名融合成一个结果。
+"""
+import heapq
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[a-z0-9]+')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+AVG_LENGTH_DRIFT = 0.25
+POSTINGS_BATCH = 256
+SQL_OPERATORS = {'$eq': '=', '$gte': '>=', '$gt': '>', '$lte': '<=', '$lt': '<'}
+
+
+def tokenize(text):
+    tokens = []
+    for run in TOKEN_RE.findall(text.lower()):
+        if run[0].isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def rrf_fuse(rankings, k=RRF_K):
+    """倒数排名融合：每个排名列表中第 r 名得 1 / (k + r) 分，返回按总分排序的 ID"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def impact(tf, length, avg_length):
+    """BM25 词项得分中与 idf 无关的部分，上界为 BM25_K1 + 1"""
+    return tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+
+
+def idf(n, df):
+    return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+
+def where_sql(where):
+    """search_where() 生成的 Chroma 条件 → (" AND ..." SQL 片段, 参数)"""
+    if not where:
+        return '', []
+    clauses = where['$and'] if '$and' in where else [where]
+    sql = []
+    params = []
+    for clause in clauses:
+        (field, condition), = clause.items()
+        if field not in ('database', 'last_edited_ts'):
+            raise ValueError(f"关键词索引不支持按 {field} 过滤")
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        (op, value), = condition.items()
+        if op == '$in':
+            sql.append(f"d.{field} IN ({','.join('?' * len(value))})")
+            params.extend(value)
+        elif op in SQL_OPERATORS:
+            sql.append(f"d.{field} {SQL_OPERATORS[op]} ?")
+            params.append(value)
+        else:
+            raise ValueError(f"关键词索引不支持 {op}")
+    return ''.join(f" AND {clause}" for clause in sql), params
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        postings = {row[1] for row in self._conn.execute("PRAGMA table_info(postings)")}
+        if postings and 'impact' not in postings:
+            # 旧版倒排没有 impact：清空，由 ensure_lexical_index 从向量库重建
+            self._conn.execute("DROP TABLE postings")
+            self._conn.execute("DELETE FROM docs")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                database TEXT,
+                last_edited_ts REAL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                impact REAL NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+            CREATE INDEX IF NOT EXISTS idx_postings_impact ON postings(term, impact DESC);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value REAL
+            );
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(docs)")}
+        if 'database' not in columns:
+            # 旧版索引没有过滤用的 metadata：清空，由 ensure_lexical_index 从向量库重建
+            self._conn.execute("ALTER TABLE docs ADD COLUMN database TEXT")
+            self._conn.execute("ALTER TABLE docs ADD COLUMN last_edited_ts REAL")
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+        self._conn.execute("DELETE FROM terms WHERE NOT EXISTS (SELECT 1 FROM postings LIMIT 1)")
+        if self._conn.execute("SELECT 1 FROM postings LIMIT 1").fetchone() and \
+                not self._conn.execute("SELECT 1 FROM terms LIMIT 1").fetchone():
+            self._conn.execute("INSERT INTO terms (term, df) SELECT term, COUNT(*) FROM postings GROUP BY term")
+        self._conn.commit()
+        self._count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        self._total_length = total
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'avg_length'").fetchone()
+        self._avg_length = row[0] if row else 0
+
+    def count(self):
+        with self._lock:
+            return self._count
+
+    def _remove(self, doc_ids):
+        """删除文档（调用方持锁）"""
+        for doc_id in doc_ids:
+            row = self._conn.execute("SELECT length FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute(
+                "UPDATE terms SET df = df - 1 WHERE term IN (SELECT term FROM postings WHERE doc_id = ?)",
+                (doc_id,))
+            self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+            self._count -= 1
+            self._total_length -= row[0]
+        self._conn.execute("DELETE FROM terms WHERE df <= 0")
+
+    def _rescale(self):
+        """实际平均长度偏离参考值太多时，按新的平均长度重算全部 impact（调用方持锁）"""
+        avg_length = self._total_length / self._count if self._count else 0
+        if self._avg_length and abs(avg_length / self._avg_length - 1) <= AVG_LENGTH_DRIFT:
+            return
+        self._avg_length = avg_length or 1
+        self._conn.execute(
+            "UPDATE postings SET impact = tf * ? / (tf + ? * (1 - ? + ? * "
+            "(SELECT length FROM docs WHERE docs.doc_id = postings.doc_id) / ?))",
+            (BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, self._avg_length))
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('avg_length', ?)",
+                           (self._avg_length,))
+
+    def upsert(self, ids, documents, metadatas=None):
+        docs = []
+        counts = []
+        for doc_id, text, metadata in zip(ids, documents, metadatas or [None] * len(ids)):
+            tokens = tokenize(text or '')
+            metadata = metadata or {}
+            docs.append((doc_id, len(tokens), metadata.get('database'), metadata.get('last_edited_ts')))
+            counts.append(Counter(tokens))
+        with self._lock:
+            self._remove(ids)
+            if not self._avg_length:
+                self._avg_length = sum(doc[1] for doc in docs) / len(docs) if docs else 0
+            avg_length = self._avg_length or 1
+            rows = [(term, doc[0], tf, impact(tf, doc[1], avg_length))
+                    for doc, counter in zip(docs, counts) for term, tf in counter.items()]
+            self._conn.executemany(
+                "INSERT INTO docs (doc_id, length, database, last_edited_ts) VALUES (?, ?, ?, ?)", docs)
+            self._conn.executemany("INSERT INTO postings (term, doc_id, tf, impact) VALUES (?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                [(row[0],) for row in rows])
+            self._count += len(docs)
+            self._total_length += sum(doc[1] for doc in docs)
+            self._rescale()
+            self._conn.commit()
+
+    def update(self, ids, metadatas):
+        """只更新过滤用的 metadata（对应 collection.update）"""
+        rows = [((metadata or {}).get('database'), (metadata or {}).get('last_edited_ts'), doc_id)
+                for doc_id, metadata in zip(ids, metadatas)]
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE docs SET database = ?, last_edited_ts = ? WHERE doc_id = ?", rows)
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            self._remove(ids)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.commit()
+            self._count = 0
+            self._total_length = 0
+            self._avg_length = 0
+
+    def search(self, query, limit=10, where=None):
+        """返回 [(doc_id, score)]，按 BM25 分数降序，只包含满足 where 的文档
+
+        idf 按全部文档计算，过滤只决定哪些文档参与排名。
+        词项按 idf 从高到低处理，每个词的倒排按 impact 降序分批读取：
+        文档在之前的词上最多拿到 prior 分、之后的词最多拿到 rest 分，
+        当 prior + 这一条的得分 + rest 已经低于当前第 limit 名时，这个词剩下的 posting 都不用读。
+        返回的文档分数是完整的 BM25 分数。
+        """
+        terms = set(tokenize(query))
+        if not terms or limit <= 0:
+            return []
+        condition, params = where_sql(where)
+        join = " JOIN docs d ON d.doc_id = p.doc_id" if condition else ""
+        scores = defaultdict(float)
+        with self._lock:
+            if not self._count:
+                return []
+            n = self._count
+            rows = self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", list(terms)
+            ).fetchall()
+            weights = sorted(((idf(n, df), term) for term, df in rows if df > 0), reverse=True)
+            bounds = [weight * (BM25_K1 + 1) for weight, _ in weights]
+            for i, (weight, term) in enumerate(weights):
+                rest = sum(bounds[i + 1:])
+                prior = max(scores.values(), default=0.0)
+                threshold = 0.0
+                cursor = self._conn.execute(
+                    f"SELECT p.doc_id, p.impact FROM postings p{join} "
+                    f"WHERE p.term = ?{condition} ORDER BY p.impact DESC",
+                    (term, *params)
+                )
+                while True:
+                    batch = cursor.fetchmany(POSTINGS_BATCH)
+                    for doc_id, value in batch:
+                        scores[doc_id] += weight * value
+                    if len(batch) < POSTINGS_BATCH:
+                        break
+                    if len(scores) >= limit:
+                        threshold = heapq.nlargest(limit, scores.values())[-1]
+                    if prior + weight * batch[-1][1] + rest < threshold:
+                        break
+                cursor.close()
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+并发受限的 Ollama 客户端
+
+submit(prompt) 把请求交给固定大小的线程池，立即返回 Future；
+线程池大小即同时发给 Ollama 的请求数（ai.concurrency），
+和 Ollama 的 OLLAMA_NUM_PARALLEL 一致时 GPU/CPU 能保持满载。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class OllamaError(Exception):
+    pass
+
+
+class OllamaClient:
+    def __init__(self, url, model, concurrency=2, timeout=120):
+        self.url = url.rstrip('/')
+        self.model = model
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='ollama')
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "failed": 0, "seconds": 0.0}
+
+    def generate(self, prompt, **options):
+        """同步调用 /api/generate，失败时抛出 OllamaError"""
+        try:
+            response = self.session.post(
+                f"{self.url}/api/generate",
+                json={"model": self.model, "prompt": prompt, "stream": False, "options": options},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            self._count(failed=True)
+            raise OllamaError(str(e)) from e
+        if response.status_code != 200:
+            self._count(failed=True)
+            raise OllamaError(f"HTTP {response.status_code}")
+        body = response.json()
+        self._count(seconds=body.get('total_duration', 0) / 1e9)
+        return body.get('response', '').strip()
+
+    def submit(self, prompt, **options):
+        return self.pool.submit(self.generate, prompt, **options)
+
+    def _count(self, failed=False, seconds=0.0):
+        with self._lock:
+            self.stats["requests"] += 1
+            if failed:
+                self.stats["failed"] += 1
+            self.stats["seconds"] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, seconds=round(self.stats["seconds"], 1),
+                        model=self.model, concurrency=self.concurrency)
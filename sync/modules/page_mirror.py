@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Notion 页面本地镜像（SQLite, WAL）
+
+笔记同步和向量同步都要读 AI笔记 的页面正文，以前各自从 API 拉一遍。
+PageMirror 以 (page_id, last_edited_time) 为键保存页面的标题、分类、
+段落和纯文本：last_edited_time 没变就直接读本地，变了才重新请求 API。
+"""
+import json
+import sqlite3
+import threading
+
+
+class PageMirror:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                database_id TEXT,
+                last_edited TEXT NOT NULL,
+                title TEXT,
+                category TEXT,
+                segments TEXT NOT NULL,
+                content TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_database ON pages(database_id)")
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+
+    def get(self, page_id, last_edited):
+        """last_edited 一致时返回 {title, category, segments, content}，否则 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title, category, segments, content FROM pages WHERE page_id = ? AND last_edited = ?",
+                (page_id, last_edited)
+            ).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        if not row:
+            return None
+        title, category, segments, content = row
+        return {
+            "title": title,
+            "category": category,
+            "segments": [tuple(s) for s in json.loads(segments)],
+            "content": content
+        }
+
+    def put(self, page_id, last_edited, segments, content, title=None, category=None, database_id=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(page_id, database_id, last_edited, title, category, segments, content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (page_id, database_id, last_edited, title, category,
+                 json.dumps(segments, ensure_ascii=False), content)
+            )
+            self._conn.commit()
+            self.stats["stored"] += 1
+
+    def retime(self, page_id, last_edited, new_last_edited):
+        """页面被自己写回（比如总结属性）后，把镜像的键改成新的 last_edited_time，正文不变"""
+        with self._lock:
+            self._conn.execute("UPDATE pages SET last_edited = ? WHERE page_id = ? AND last_edited = ?",
+                               (new_last_edited, page_id, last_edited))
+            self._conn.commit()
+
+    def page_ids(self, database_id):
+        with self._lock:
+            rows = self._conn.execute("SELECT page_id FROM pages WHERE database_id = ?", (database_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, page_ids):
+        page_ids = list(page_ids)
+        with self._lock:
+            self._conn.executemany("DELETE FROM pages WHERE page_id = ?", [(p,) for p in page_ids])
+            self._conn.commit()
+
+    def snapshot(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            total = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=size,
+                        hit_ratio=round(self.stats["hits"] / total, 4) if total else None)
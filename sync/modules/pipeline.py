@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+流式处理的公共阶段
+
+- prefetch(iterable, maxsize)：后台线程消费 iterable 放进有界队列，下游边读边处理；
+  队列满时生产者阻塞，内存只和 maxsize 有关。生产者的异常在下游读到该位置时重新抛出，
+  下游提前结束（generator 被 close）时生产者随之停止
+- batched(iterable, n)：每 n 个一组（Python 3.12 之前没有 itertools.batched）
+- collect(generator)：全部取出，返回 (列表, generator 的 return 值)
+"""
+import queue
+import threading
+from itertools import islice
+
+
+class _End:
+    def __init__(self, error=None):
+        self.error = error
+
+
+def prefetch(iterable, maxsize=100, name='prefetch'):
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_End(e))
+            return
+        put(_End())
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, _End):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def batched(iterable, n):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, n))
+        if not batch:
+            return
+        yield batch
+
+
+def collect(generator):
+    items = []
+    while True:
+        try:
+            items.append(next(generator))
+        except StopIteration as stop:
+            return items, stop.value
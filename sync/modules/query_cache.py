@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+/search 的进程内缓存
+
+- LRUCache(maxsize)：线程安全的 LRU，get() 可以带 generation，
+  条目写入时的 generation 和当前不一致视为未命中（向量库变了，结果作废）
+- LatencyTracker：记录最近 N 次耗时，给 /status 报告平均值和分位数
+"""
+import threading
+from collections import OrderedDict, deque
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1000):
+        self.maxsize = max(1, int(maxsize))
+        self._data = OrderedDict()      # key → (generation, value)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key, generation=None):
+        """返回缓存值，未命中返回 MISSING"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    del self._data[key]
+                self.stats["misses"] += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            self._data[key] = (generation, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def snapshot(self):
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, size=len(self._data), max_size=self.maxsize,
+                        hit_ratio=round(self.stats["hits"] / total, 4) if total else None)
+
+
+class LatencyTracker:
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": len(samples),
+            "avg_ms": round(sum(samples) / len(samples), 2),
+            "p50_ms": round(samples[len(samples) // 2], 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2)
+        }
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+令牌桶限流器
+
+Notion API 对每个 integration 的平均限额约 3 次/秒，超出后返回 429 并带
+Retry-After。同一进程内所有 Notion 请求共用一个 TokenBucket：
+- acquire()       : 取一个令牌，不够时阻塞等待
+- pause(seconds)  : 收到 429 后暂停所有线程，直到 Retry-After 过期
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate=3.0, capacity=None):
+        self._lock = threading.Lock()
+        self.configure(rate, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self.stats = {
+            "acquired": 0,
+            "throttled": 0,       # 需要等待令牌的次数
+            "wait_seconds": 0.0,  # 累计等待时间
+            "paused": 0,          # 429 触发的全局暂停次数
+        }
+
+    def configure(self, rate, capacity=None):
+        with self._lock:
+            self.rate = max(float(rate), 0.1)
+            self.capacity = float(capacity) if capacity else max(self.rate, 1.0)
+            if hasattr(self, '_tokens'):
+                self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self):
+        """取一个令牌，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.stats["acquired"] += 1
+                    if waited:
+                        self.stats["throttled"] += 1
+                        self.stats["wait_seconds"] += waited
+                    return waited
+                else:
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """暂停发放令牌 seconds 秒（对所有线程生效）"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+            self._tokens = 0
+            self.stats["paused"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, rate=self.rate,
+                        wait_seconds=round(self.stats["wait_seconds"], 3))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+服务启动阶段
+
+HTTP 服务先起来，向量库和 embedding 模型在后台依次加载：
+starting → opening_index → index_ready → loading_model → ready
+index_ready 之后就可以检索（向量检索的第一个查询会等模型加载完），
+/status 通过 snapshot() 报告当前阶段、各阶段到达的时间（距启动秒数）和错误。
+"""
+import threading
+import time
+
+PHASES = ('starting', 'opening_index', 'index_ready', 'loading_model', 'ready')
+
+
+class Readiness:
+    def __init__(self, phases=PHASES):
+        self.phases = tuple(phases)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._reached = {self.phases[0]: 0.0}
+        self.phase = self.phases[0]
+        self.error = None
+
+    def advance(self, phase):
+        with self._lock:
+            self.phase = phase
+            self._reached.setdefault(phase, round(time.monotonic() - self._started, 3))
+            self.error = None
+
+    def fail(self, error):
+        with self._lock:
+            self.error = str(error)
+
+    def reached(self, phase):
+        with self._lock:
+            return phase in self._reached
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "phase": self.phase,
+                "ready": self.phase == self.phases[-1],
+                "error": self.error,
+                "seconds": dict(self._reached)
+            }
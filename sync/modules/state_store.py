@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+同步状态存储（SQLite, WAL）
+
+替代原来的 sync_state.json：每次修改只写变化的行，不再整份重写，
+同步中途崩溃时已提交的进度也不会丢。
+
+表结构：
+- note_mapping : WebUI 笔记 ↔ Notion 页面的双向映射（含 WebUI 侧的 updated_at）
+- pages        : 向量库中每个 Notion 页面的 last_edited_time 和分块 ID
+- watermarks   : 每个数据库的增量水位线和上次全量扫描时间
+- summary_done : 已把总结写回 Notion 的页面（及当时的内容哈希）
+- summaries    : 按内容哈希缓存的总结
+- blog_files   : 已索引的博客文件（size / mtime / 内容哈希 / 块 ID）
+- checkpoints  : 未完成的向量同步的进度（每个数据库一行，完成后删除）
+- note_pending : 已发出、但还没确认写进映射表的笔记创建（防止中断后重复创建）
+- meta         : 其他键值（last_sync 等）
+
+首次打开时如果存在旧的 sync_state.json，会导入后重命名为 .migrated。
+JSON 里没有页面所属的数据库，导入的页面 database 为空，由全量扫描后的
+sweep_orphans 按向量库里的归属补上（assign_database）。
+"""
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS note_mapping (
+    webui_id TEXT PRIMARY KEY,
+    notion_id TEXT,
+    webui_hash TEXT,
+    notion_timestamp TEXT,
+    title TEXT,
+    webui_updated_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_note_mapping_notion ON note_mapping(notion_id);
+
+CREATE TABLE IF NOT EXISTS pages (
+    page_id TEXT PRIMARY KEY,
+    database TEXT,
+    last_edited TEXT,
+    chunk_ids TEXT
+);
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    db_id TEXT PRIMARY KEY,
+    watermark TEXT,
+    last_full_scan TEXT
+);
+
+CREATE TABLE IF NOT EXISTS summary_done (
+    page_id TEXT PRIMARY KEY,
+    content_hash TEXT
+);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at TEXT,
+    PRIMARY KEY (content_hash, model)
+);
+
+CREATE TABLE IF NOT EXISTS blog_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    content_hash TEXT,
+    chunk_ids TEXT
+);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    db_id TEXT PRIMARY KEY,
+    full_scan INTEGER,
+    since TEXT,
+    before TEXT,
+    latest TEXT,
+    unsynced TEXT,
+    scanned INTEGER,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS note_pending (
+    webui_id TEXT PRIMARY KEY,
+    notion_id TEXT,
+    title TEXT,
+    started TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+NOTE_FIELDS = ('notion_id', 'webui_hash', 'notion_timestamp', 'title', 'webui_updated_at')
+CHECKPOINT_FIELDS = ('full_scan', 'since', 'before', 'latest', 'unsynced', 'scanned')
+PENDING_FIELDS = ('webui_id', 'notion_id', 'title', 'started')
+
+
+class StateStore:
+    def __init__(self, path, legacy_json=None):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._depth = 0
+        # isolation_level=None：不在 transaction() 里时每条语句自动提交
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        if legacy_json and Path(legacy_json).exists():
+            self._import_json(Path(legacy_json))
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(note_mapping)")}
+        if 'webui_updated_at' not in columns:
+            self._conn.execute("ALTER TABLE note_mapping ADD COLUMN webui_updated_at INTEGER")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(summary_done)")}
+        if 'content_hash' not in columns:
+            self._conn.execute("ALTER TABLE summary_done ADD COLUMN content_hash TEXT")
+
+    @contextmanager
+    def transaction(self):
+        """把多次写入合并成一个事务，可嵌套（以最外层为准）"""
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("COMMIT")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _executemany(self, sql, rows):
+        with self._lock:
+            return self._conn.executemany(sql, rows)
+
+    # ==================== 笔记映射 ====================
+
+    def note_mapping(self):
+        return NoteMapping(self)
+
+    def put_note(self, webui_id, info):
+        self._execute(
+            "INSERT OR REPLACE INTO note_mapping "
+            "(webui_id, notion_id, webui_hash, notion_timestamp, title, webui_updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (webui_id, *(info.get(f) for f in NOTE_FIELDS))
+        )
+
+    def delete_note(self, webui_id):
+        self._execute("DELETE FROM note_mapping WHERE webui_id = ?", (webui_id,))
+
+    def _load_notes(self):
+        rows = self._execute(
+            "SELECT webui_id, notion_id, webui_hash, notion_timestamp, title, webui_updated_at FROM note_mapping"
+        ).fetchall()
+        return {
+            row[0]: {f: v for f, v in zip(NOTE_FIELDS, row[1:]) if v is not None}
+            for row in rows
+        }
+
+    # ==================== 向量库页面 ====================
+
+    def page_timestamps(self, page_ids):
+        """{page_id: last_edited}，只返回给定页面中已同步过的"""
+        page_ids = list(page_ids)
+        result = {}
+        with self._lock:
+            for i in range(0, len(page_ids), 500):
+                batch = page_ids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT page_id, last_edited FROM pages WHERE page_id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                result.update(rows)
+        return result
+
+    def page_chunks(self, page_id):
+        row = self._execute("SELECT chunk_ids FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def mark_page_synced(self, page_id, last_edited, database=None, chunk_ids=None):
+        """记录页面已同步到向量库；chunk_ids 为 None 时保留原来的分块记录"""
+        self._execute(
+            "INSERT INTO pages (page_id, database, last_edited, chunk_ids) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(page_id) DO UPDATE SET "
+            "database = COALESCE(excluded.database, database), "
+            "last_edited = excluded.last_edited, "
+            "chunk_ids = COALESCE(excluded.chunk_ids, chunk_ids)",
+            (page_id, database, last_edited,
+             json.dumps(chunk_ids) if chunk_ids is not None else None)
+        )
+
+    def database_pages(self, database):
+        rows = self._execute("SELECT page_id FROM pages WHERE database = ?", (database,)).fetchall()
+        return [row[0] for row in rows]
+
+    def unassigned_pages(self):
+        """没有记录所属数据库的页面（从旧版 sync_state.json 导入，JSON 里没有这个信息）"""
+        rows = self._execute("SELECT page_id FROM pages WHERE database IS NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def assign_database(self, page_ids, database):
+        """给没有所属数据库的页面补上 database，已有的不改"""
+        with self.transaction():
+            self._executemany("UPDATE pages SET database = ? WHERE page_id = ? AND database IS NULL",
+                              [(database, page_id) for page_id in page_ids])
+
+    def forget_pages(self, page_ids):
+        """删除页面的同步记录（页面已从 Notion 删除 / 归档）"""
+        rows = [(page_id,) for page_id in page_ids]
+        with self.transaction():
+            self._executemany("DELETE FROM pages WHERE page_id = ?", rows)
+            self._executemany("DELETE FROM summary_done WHERE page_id = ?", rows)
+
+    # ==================== 博客文件 ====================
+
+    def blog_manifest(self):
+        """{path: {size, mtime_ns, content_hash, chunk_ids}}"""
+        rows = self._execute("SELECT path, size, mtime_ns, content_hash, chunk_ids FROM blog_files").fetchall()
+        return {
+            path: {"size": size, "mtime_ns": mtime_ns, "content_hash": digest,
+                   "chunk_ids": json.loads(ids) if ids else []}
+            for path, size, mtime_ns, digest, ids in rows
+        }
+
+    def put_blog_file(self, path, size, mtime_ns, content_hash, chunk_ids=None):
+        """记录文件已索引；chunk_ids 为 None 时保留原来的块 ID（内容没变、只是 mtime 变了）"""
+        self._execute(
+            "INSERT INTO blog_files (path, size, mtime_ns, content_hash, chunk_ids) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "content_hash = excluded.content_hash, chunk_ids = COALESCE(excluded.chunk_ids, chunk_ids)",
+            (path, size, mtime_ns, content_hash,
+             json.dumps(chunk_ids) if chunk_ids is not None else None)
+        )
+
+    def forget_blog_files(self, paths):
+        self._executemany("DELETE FROM blog_files WHERE path = ?", [(path,) for path in paths])
+
+    # ==================== 水位线 ====================
+
+    def watermark(self, db_id):
+        row = self._execute("SELECT watermark, last_full_scan FROM watermarks WHERE db_id = ?",
+                            (db_id,)).fetchone()
+        return row if row else (None, None)
+
+    def set_watermark(self, db_id, watermark):
+        self._execute(
+            "INSERT INTO watermarks (db_id, watermark) VALUES (?, ?) "
+            "ON CONFLICT(db_id) DO UPDATE SET watermark = excluded.watermark",
+            (db_id, watermark)
+        )
+
+    def set_last_full_scan(self, db_id, when):
+        self._execute(
+            "INSERT INTO watermarks (db_id, last_full_scan) VALUES (?, ?) "
+            "ON CONFLICT(db_id) DO UPDATE SET last_full_scan = excluded.last_full_scan",
+            (db_id, when)
+        )
+
+    # ==================== 检查点 ====================
+
+    def checkpoint(self, db_id):
+        """数据库未完成的向量同步进度，没有时返回 None
+
+        full_scan / since : 被中断的那次扫描的类型和增量水位线（续跑时沿用）
+        before            : 续跑查询的上界，编辑时间晚于它的页面都已写入向量库
+        latest / unsynced : 已扫描页面中最新的编辑时间、获取失败或总结未完成的最早编辑时间
+        scanned           : 已扫描的页面数
+        """
+        row = self._execute(f"SELECT {', '.join(CHECKPOINT_FIELDS)} FROM checkpoints WHERE db_id = ?",
+                            (db_id,)).fetchone()
+        if row is None:
+            return None
+        checkpoint = dict(zip(CHECKPOINT_FIELDS, row))
+        checkpoint['full_scan'] = bool(checkpoint['full_scan'])
+        return checkpoint
+
+    def save_checkpoint(self, db_id, checkpoint):
+        self._execute(
+            f"INSERT OR REPLACE INTO checkpoints (db_id, {', '.join(CHECKPOINT_FIELDS)}, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+            (db_id, int(bool(checkpoint['full_scan'])),
+             *(checkpoint.get(f) for f in CHECKPOINT_FIELDS[1:]))
+        )
+
+    def clear_checkpoint(self, db_id):
+        self._execute("DELETE FROM checkpoints WHERE db_id = ?", (db_id,))
+
+    # ==================== 待确认的笔记创建 ====================
+
+    def add_pending_note(self, webui_id, notion_id=None, title=None, started=None):
+        """创建请求发出前登记；notion_id 为空表示 WebUI 笔记正在创建对应的 Notion 页面"""
+        self._execute(
+            "INSERT OR REPLACE INTO note_pending (webui_id, notion_id, title, started) "
+            "VALUES (?, ?, ?, COALESCE(?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now')))",
+            (webui_id, notion_id, title, started)
+        )
+
+    def pending_notes(self):
+        rows = self._execute(f"SELECT {', '.join(PENDING_FIELDS)} FROM note_pending").fetchall()
+        return [dict(zip(PENDING_FIELDS, row)) for row in rows]
+
+    def clear_pending_note(self, webui_id):
+        self._execute("DELETE FROM note_pending WHERE webui_id = ?", (webui_id,))
+
+    # ==================== 总结 ====================
+
+    def summarized_pages(self, page_ids):
+        """{page_id: content_hash}，只返回给定页面中已写回总结的"""
+        page_ids = list(page_ids)
+        result = {}
+        with self._lock:
+            for i in range(0, len(page_ids), 500):
+                batch = page_ids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT page_id, content_hash FROM summary_done WHERE page_id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                result.update(rows)
+        return result
+
+    def mark_summarized(self, page_id, content_hash=None):
+        self._execute("INSERT OR REPLACE INTO summary_done (page_id, content_hash) VALUES (?, ?)",
+                      (page_id, content_hash))
+
+    def get_summary(self, content_hash, model):
+        row = self._execute("SELECT summary FROM summaries WHERE content_hash = ? AND model = ?",
+                            (content_hash, model)).fetchone()
+        return row[0] if row else None
+
+    def put_summary(self, content_hash, model, summary):
+        self._execute(
+            "INSERT OR REPLACE INTO summaries (content_hash, model, summary, created_at) "
+            "VALUES (?, ?, ?, datetime('now'))",
+            (content_hash, model, summary)
+        )
+
+    # ==================== 键值 ====================
+
+    def get(self, key, default=None):
+        row = self._execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                      (key, json.dumps(value, ensure_ascii=False)))
+
+    # ==================== 旧版 JSON 导入 ====================
+
+    def _import_json(self, json_path):
+        """导入旧版 sync_state.json，时间戳原样保留
+
+        只补状态库里还没有的行，不覆盖已有的记录：导入后、重命名前进程被杀时，
+        下次启动会再导入一遍，期间同步写入的新进度不会被旧 JSON 冲掉。
+        """
+        try:
+            with open(json_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        page_chunks = state.get('page_chunks', {})
+        with self.transaction():
+            self._executemany(
+                "INSERT OR IGNORE INTO note_mapping "
+                "(webui_id, notion_id, webui_hash, notion_timestamp, title, webui_updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(webui_id, *(info.get(f) for f in NOTE_FIELDS))
+                 for webui_id, info in state.get('note_mapping', {}).items()]
+            )
+            self._executemany(
+                "INSERT OR IGNORE INTO pages (page_id, last_edited, chunk_ids) VALUES (?, ?, ?)",
+                [(page_id, ts, json.dumps(page_chunks[page_id]) if page_id in page_chunks else None)
+                 for page_id, ts in state.get('page_timestamps', {}).items()]
+            )
+            self._executemany(
+                "INSERT INTO watermarks (db_id, watermark) VALUES (?, ?) "
+                "ON CONFLICT(db_id) DO UPDATE SET watermark = COALESCE(watermark, excluded.watermark)",
+                list(state.get('db_watermarks', {}).items())
+            )
+            self._executemany(
+                "INSERT INTO watermarks (db_id, last_full_scan) VALUES (?, ?) "
+                "ON CONFLICT(db_id) DO UPDATE SET last_full_scan = COALESCE(last_full_scan, excluded.last_full_scan)",
+                list(state.get('last_full_scan', {}).items())
+            )
+            self._executemany("INSERT OR IGNORE INTO summary_done (page_id) VALUES (?)",
+                              [(page_id,) for page_id in state.get('summary_done', [])])
+            if state.get('last_sync'):
+                self._execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('last_sync', ?)",
+                              (json.dumps(state['last_sync'], ensure_ascii=False),))
+
+        json_path.rename(json_path.with_name(json_path.name + '.migrated'))
+
+
+class NoteMapping(MutableMapping):
+    """note_mapping 的写穿字典：赋值 / 删除立即写入 SQLite
+
+    注意修改字段要用 update_fields()，直接改 mapping[id]['x'] 不会落盘。
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._data = store._load_notes()
+
+    def __getitem__(self, webui_id):
+        return self._data[webui_id]
+
+    def __setitem__(self, webui_id, info):
+        self._store.put_note(webui_id, info)
+        self._data[webui_id] = dict(info)
+
+    def __delitem__(self, webui_id):
+        self._store.delete_note(webui_id)
+        del self._data[webui_id]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def update_fields(self, webui_id, **fields):
+        self[webui_id] = dict(self._data[webui_id], **fields)
+
+    def notion_index(self):
+        """notion_id → webui_id"""
+        return {info['notion_id']: wid for wid, info in self._data.items() if info.get('notion_id')}
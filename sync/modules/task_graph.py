@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+小型任务依赖图
+
+    graph = TaskGraph()
+    graph.add('notes', sync_notes)
+    graph.add('vector:AI笔记', sync_ai_notes, deps=['notes'])
+    graph.add('vector:复盘', sync_review)
+    results = graph.run()
+
+依赖都完成的任务立即提交到线程池并发执行；依赖失败的任务不执行，
+error 记为依赖失败。run() 返回 {name: TaskResult(result, error, seconds)}。
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+TaskResult = namedtuple('TaskResult', ['result', 'error', 'seconds'])
+
+
+class TaskGraph:
+    def __init__(self):
+        self.tasks = {}     # name → (fn, deps)
+
+    def add(self, name, fn, deps=()):
+        if name in self.tasks:
+            raise ValueError(f"任务重复: {name}")
+        self.tasks[name] = (fn, tuple(deps))
+
+    def _check(self):
+        for name, (_, deps) in self.tasks.items():
+            for dep in deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"任务 {name} 依赖不存在的任务 {dep}")
+        # 拓扑排序检查环
+        remaining = {name: set(deps) for name, (_, deps) in self.tasks.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"任务依赖存在环: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def run(self, max_workers=None, on_start=None, on_done=None):
+        """执行全部任务，on_start(name) / on_done(name, TaskResult) 在任务开始 / 结束时回调"""
+        self._check()
+        results = {}
+        waiting = dict(self.tasks)
+        lock = threading.Lock()
+
+        def execute(name, fn):
+            if on_start:
+                on_start(name)
+            started = time.monotonic()
+            try:
+                outcome = TaskResult(fn(), None, time.monotonic() - started)
+            except Exception as e:
+                outcome = TaskResult(None, e, time.monotonic() - started)
+            with lock:
+                results[name] = outcome
+            if on_done:
+                on_done(name, outcome)
+            return outcome
+
+        with ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.tasks)),
+                                thread_name_prefix='sync-task') as pool:
+            running = set()
+            while waiting or running:
+                for name, (fn, deps) in list(waiting.items()):
+                    if any(dep not in results for dep in deps):
+                        continue
+                    del waiting[name]
+                    failed = [dep for dep in deps if results[dep].error is not None]
+                    if failed:
+                        skipped = TaskResult(None, RuntimeError(f"依赖任务失败: {', '.join(failed)}"), 0.0)
+                        with lock:
+                            results[name] = skipped
+                        if on_done:
+                            on_done(name, skipped)
+                        continue
+                    running.add(pool.submit(execute, name, fn))
+                if running:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    running = set(running)
+        return {name: results[name] for name in self.tasks}
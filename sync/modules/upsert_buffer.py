@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Chroma 批量写入缓冲
+
+逐条 upsert 时每条都要单独跑一次 embedding 和一次索引写入。
+UpsertBuffer 把文档攒够 batch_size 条再一次写入：
+- add(id, document, metadata, on_flushed)  : 加入缓冲，写入成功后回调
+- update_metadata(id, metadata)            : 只改 metadata（不重新 embedding）
+- delete(ids)                              : 删除文档
+- defer(fn)                                : 当前已加入的操作全部写入后回调
+- flush()                                  : 立即写入全部缓冲
+作为 with 语句使用时，退出（包括异常退出）前会写入剩余文档。
+transaction 为回调外层的上下文（如状态库事务），一次写入的回调合并提交。
+indexes 为需要和 collection 同步写入的其他索引（如 BM25 索引），
+需要提供 upsert(ids, documents, metadatas)、update(ids, metadatas) 和 delete(ids)。
+on_write(seconds) 在每次实际改动了向量库的写入之后调用（如让查询缓存失效），
+参数为这次写入的耗时。
+embed(documents) 返回文档的向量，设置时随 upsert 一起写入（embeddings=），
+collection 不再自己调用 embedding function。
+"""
+import threading
+import time
+from contextlib import nullcontext
+
+
+class UpsertBuffer:
+    def __init__(self, collection, batch_size=64, transaction=None, indexes=(), on_write=None, embed=None):
+        self.collection = collection
+        self.embed = embed
+        self.indexes = list(indexes)
+        self.on_write = on_write
+        self.transaction = transaction or nullcontext
+        self.batch_size = max(1, int(batch_size))
+        self._lock = threading.RLock()
+        self._items = {}        # doc_id → (document, metadata)，同一 id 只保留最后一次
+        self._metadata = {}     # doc_id → metadata
+        self._deletes = set()
+        self._callbacks = []
+        self.stats = {"added": 0, "flushed": 0, "batches": 0, "updated": 0, "deleted": 0}
+
+    def add(self, doc_id, document, metadata, on_flushed=None):
+        with self._lock:
+            self._items[doc_id] = (document, metadata)
+            if on_flushed:
+                self._callbacks.append(on_flushed)
+            self.stats["added"] += 1
+            if len(self._items) >= self.batch_size:
+                self.flush()
+
+    def update_metadata(self, doc_id, metadata):
+        with self._lock:
+            self._metadata[doc_id] = metadata
+            if len(self._metadata) >= self.batch_size:
+                self.flush()
+
+    def delete(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._deletes.add(doc_id)
+                self._items.pop(doc_id, None)
+                self._metadata.pop(doc_id, None)
+            if len(self._deletes) >= self.batch_size:
+                self.flush()
+
+    def defer(self, fn):
+        with self._lock:
+            if self.pending():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def flush(self):
+        with self._lock:
+            wrote = bool(self._deletes or self._items or self._metadata)
+            started = time.monotonic()
+            if self._deletes:
+                ids = sorted(self._deletes)
+                for i in range(0, len(ids), self.batch_size):
+                    self.collection.delete(ids=ids[i:i + self.batch_size])
+                for index in self.indexes:
+                    index.delete(ids)
+                self._deletes.clear()
+                self.stats["deleted"] += len(ids)
+
+            if self._items:
+                ids = list(self._items)
+                for i in range(0, len(ids), self.batch_size):
+                    batch = ids[i:i + self.batch_size]
+                    documents = [self._items[doc_id][0] for doc_id in batch]
+                    metadatas = [self._items[doc_id][1] for doc_id in batch]
+                    if self.embed:
+                        self.collection.upsert(ids=batch, documents=documents, metadatas=metadatas,
+                                               embeddings=self.embed(documents))
+                    else:
+                        self.collection.upsert(ids=batch, documents=documents, metadatas=metadatas)
+                    for index in self.indexes:
+                        index.upsert(batch, documents, metadatas)
+                    for doc_id in batch:
+                        del self._items[doc_id]
+                    self.stats["flushed"] += len(batch)
+                    self.stats["batches"] += 1
+
+            if self._metadata:
+                ids = list(self._metadata)
+                for i in range(0, len(ids), self.batch_size):
+                    batch = ids[i:i + self.batch_size]
+                    metadatas = [self._metadata[doc_id] for doc_id in batch]
+                    self.collection.update(ids=batch, metadatas=metadatas)
+                    for index in self.indexes:
+                        index.update(batch, metadatas)
+                self._metadata.clear()
+                self.stats["updated"] += len(ids)
+
+            if wrote and self.on_write:
+                self.on_write(time.monotonic() - started)
+            callbacks, self._callbacks = self._callbacks, []
+        if callbacks:
+            with self.transaction():
+                for fn in callbacks:
+                    fn()
+
+    def pending(self):
+        with self._lock:
+            return len(self._items) + len(self._metadata) + len(self._deletes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+文件变化监听
+
+DirectoryWatcher(root, on_change) 在后台线程监听 root 下的文件，把一段时间内
+变化的路径（相对 root）去抖后一次交给 on_change(paths)：
+- 最后一个事件之后安静 debounce 秒才触发，持续有事件时最多攒 max_delay 秒
+- match(name) 过滤文件名（如只要 .md、只要 webui.db / webui.db-wal），以 . 开头的文件和目录忽略
+- 目录被创建 / 删除 / 移动时报告目录本身的路径，由调用方按前缀处理；
+  事件队列溢出等无法确定范围的情况报告 ''（整个 root）
+
+后端：
+- inotify（Linux，ctypes 调用 libc，不需要额外依赖），递归监听时给新建的子目录补上监听
+- 轮询：每 poll_interval 秒 stat 一遍匹配的文件（inotify 不可用，或挂载的文件系统不产生事件时）
+mode 为 auto（优先 inotify，失败退回轮询）、inotify 或 poll。
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')     # wd, mask, cookie, len
+
+
+class InotifyBackend:
+    def __init__(self, root, recursive=True, match=None):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.root = os.path.abspath(root)
+        self.recursive = recursive
+        self.match = match
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.dirs = {}      # wd → 目录的绝对路径
+        self.add_tree(self.root)
+
+    def add_tree(self, path):
+        self.add_watch(path)
+        if not self.recursive:
+            return
+        for directory, subdirs, _ in os.walk(path):
+            subdirs[:] = [d for d in subdirs if not d.startswith('.')]
+            for name in subdirs:
+                self.add_watch(os.path.join(directory, name))
+
+    def add_watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if path == self.root:
+                raise OSError(error, f"inotify_add_watch {path}: {os.strerror(error)}")
+            return      # 子目录刚建就被删了，或超过 max_user_watches
+        self.dirs[wd] = path
+
+    def poll(self, timeout):
+        """等待最多 timeout 秒，返回变化的相对路径集合"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.add('')
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None or (name and name.startswith('.')):
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+            elif self.match and not self.match(name):
+                continue
+            changed.add(os.path.relpath(path, self.root) if path != self.root else '')
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    def __init__(self, root, recursive=True, match=None, interval=5.0):
+        self.root = os.path.abspath(root)
+        self.recursive = recursive
+        self.match = match
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        files = {}
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            stack.append(entry.path)
+                    elif not self.match or self.match(entry.name):
+                        stat = entry.stat()
+                        files[os.path.relpath(entry.path, self.root)] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+        return files
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = self.scan()
+        changed = {path for path, stat in current.items() if self.snapshot.get(path) != stat}
+        changed.update(path for path in self.snapshot if path not in current)
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class DirectoryWatcher:
+    def __init__(self, root, on_change, recursive=True, match=None, mode='auto',
+                 debounce=2.0, max_delay=30.0, poll_interval=5.0, name='watcher', log=print):
+        self.root = str(root)
+        self.on_change = on_change
+        self.recursive = recursive
+        self.match = match
+        self.mode = mode
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.name = name
+        self.log = log
+        self.backend = None
+        self.stats = {"events": 0, "batches": 0, "last_batch": None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def backend_name(self):
+        return {InotifyBackend: 'inotify', PollingBackend: 'poll'}.get(type(self.backend))
+
+    def open_backend(self):
+        if self.mode in ('auto', 'inotify'):
+            try:
+                return InotifyBackend(self.root, self.recursive, self.match)
+            except (OSError, AttributeError) as e:
+                # AttributeError：libc 没有 inotify 函数（非 Linux）
+                if self.mode == 'inotify':
+                    raise
+                self.log(f"⚠️ [{self.name}] inotify 不可用（{e}），改为每 {self.poll_interval} 秒轮询")
+        return PollingBackend(self.root, self.recursive, self.match, self.poll_interval)
+
+    def start(self):
+        self.backend = self.open_backend()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.backend is not None:
+            self.backend.close()
+
+    def _run(self):
+        pending = set()
+        first = last = None
+        while not self._stop.is_set():
+            timeout = self.debounce if pending else 1.0
+            try:
+                changed = self.backend.poll(timeout)
+            except OSError as e:
+                self.log(f"⚠️ [{self.name}] 监听出错: {e}")
+                self._stop.wait(self.poll_interval)
+                continue
+            now = time.monotonic()
+            if changed:
+                self.stats["events"] += len(changed)
+                pending |= changed
+                first = first or now
+                last = now
+            if pending and (now - last >= self.debounce or now - first >= self.max_delay):
+                batch, pending = pending, set()
+                first = last = None
+                self.stats["batches"] += 1
+                self.stats["last_batch"] = len(batch)
+                try:
+                    self.on_change(batch)
+                except Exception as e:
+                    self.log(f"❌ [{self.name}] 处理变化失败: {e}")
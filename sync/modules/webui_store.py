@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Open WebUI 笔记读写
+
+- 读：一个只读连接，先只查 id / updated_at，需要时再按 ID 取 data 并解析
+- 写：一个写连接，batch() 里的写入先在内存中排队，commit() 时在一个
+      BEGIN IMMEDIATE … COMMIT 短事务里一次写完。同步期间的 Notion 请求都在事务外，
+      Open WebUI 自己的写入不会因为同步长时间拿不到锁（database is locked）；
+      after_commit() 注册的回调（如更新映射表）在提交成功后才执行，
+      保证映射表不会指向未提交的笔记
+observe(op, seconds) 记录每次读 / 写 / 提交的耗时（op 为 read、write、commit）
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+
+class WebUINoteStore:
+    def __init__(self, path, transaction=None, observe=None):
+        self.path = str(path)
+        self.transaction = transaction or nullcontext
+        self.observe = observe
+        self._lock = threading.RLock()
+        self._reader = None
+        self._writer = None
+        self._in_batch = False
+        self._writes = []       # batch 内排队的 (sql, params)
+        self._callbacks = []
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _read_conn(self):
+        if self._reader is None:
+            self._reader = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        return self._reader
+
+    def _write_conn(self):
+        if self._writer is None:
+            # 自动提交模式，事务由 commit() 显式开始和结束
+            self._writer = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        return self._writer
+
+    @contextmanager
+    def _timed(self, op):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            if self.observe:
+                self.observe(op, time.monotonic() - started)
+
+    def close(self):
+        with self._lock:
+            for conn in (self._reader, self._writer):
+                if conn is not None:
+                    conn.close()
+            self._reader = self._writer = None
+
+    # ==================== 读 ====================
+
+    def note_versions(self):
+        """{note_id: updated_at}"""
+        with self._lock, self._timed('read'):
+            rows = self._read_conn().execute("SELECT id, updated_at FROM note").fetchall()
+        return dict(rows)
+
+    def fetch_notes(self, note_ids):
+        """按 ID 读取并解析笔记内容，返回 {note_id: note}"""
+        note_ids = list(note_ids)
+        notes = {}
+        with self._lock, self._timed('read'):
+            conn = self._read_conn()
+            for i in range(0, len(note_ids), 500):
+                batch = note_ids[i:i + 500]
+                rows = conn.execute(
+                    "SELECT id, user_id, title, data, updated_at FROM note "
+                    f"WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for note_id, user_id, title, data_json, updated_at in rows:
+                    notes[note_id] = {
+                        "id": note_id,
+                        "user_id": user_id,
+                        "title": title or "",
+                        "content": parse_note_content(data_json),
+                        "updated_at": updated_at
+                    }
+        return notes
+
+    def default_user_id(self):
+        with self._lock:
+            row = self._read_conn().execute("SELECT id FROM user LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    # ==================== 写 ====================
+
+    @contextmanager
+    def batch(self):
+        """batch 内的写入排队，结束时合并为一个事务提交，可嵌套（以最外层为准）
+
+        create_note / update_note 的返回值（ID、updated_at）在本地生成，排队时即可使用
+        """
+        with self._lock:
+            nested = self._in_batch
+            self._in_batch = True
+        if nested:
+            yield self
+            return
+        try:
+            yield self
+        except BaseException:
+            with self._lock:
+                self._in_batch = False
+                self._writes = []
+                self._callbacks = []
+            raise
+        with self._lock:
+            self._in_batch = False
+        self.commit()
+
+    def commit(self):
+        """写入排队的改动并执行提交后回调（batch 内可以调用，用作检查点）
+
+        写锁只在这里持有，事务内没有网络请求；失败时回滚，排队的写入和回调一起丢弃
+        """
+        with self._lock:
+            writes, self._writes = self._writes, []
+            callbacks, self._callbacks = self._callbacks, []
+            if writes:
+                conn = self._write_conn()
+                with self._timed('commit'):
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        for sql, params in writes:
+                            conn.execute(sql, params)
+                    except BaseException:
+                        conn.execute("ROLLBACK")
+                        raise
+                    conn.execute("COMMIT")
+        if callbacks:
+            with self.transaction():
+                for fn in callbacks:
+                    fn()
+
+    def after_commit(self, fn):
+        with self._lock:
+            if self._in_batch:
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def _write(self, sql, params):
+        with self._lock:
+            if self._in_batch:
+                self._writes.append((sql, params))
+                return
+            with self._timed('write'):
+                self._write_conn().execute(sql, params)
+
+    def create_note(self, user_id, title, content):
+        """返回 (note_id, updated_at)"""
+        note_id = str(uuid.uuid4())
+        now = int(time.time() * 1_000_000_000)
+        data = json.dumps({"content": {"md": content}})
+        self._write(
+            "INSERT INTO note (id, user_id, title, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (note_id, user_id, title, data, now, now)
+        )
+        return note_id, now
+
+    def update_note(self, note_id, title, content):
+        """返回新的 updated_at"""
+        now = int(time.time() * 1_000_000_000)
+        data = json.dumps({"content": {"md": content}})
+        self._write(
+            "UPDATE note SET title = ?, data = ?, updated_at = ? WHERE id = ?",
+            (title, data, now, note_id)
+        )
+        return now
+
+    def delete_note(self, note_id):
+        self._write("DELETE FROM note WHERE id = ?", (note_id,))
+        return True
+
+
+def parse_note_content(data_json):
+    try:
+        data = json.loads(data_json) if isinstance(data_json, str) else data_json
+        return data.get('content', {}).get('md', '') if isinstance(data, dict) else ''
+    except (TypeError, ValueError):
+        return ''
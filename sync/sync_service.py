@@ -12,29 +12,111 @@ Notion <-> Open WebUI 双向同步服务 v2.4
 """
 import os
 import sys
-import time
 import yaml
-import json
 import hashlib
-import sqlite3
+import difflib
+import threading
 import requests
 import re
-import uuid
-from datetime import datetime
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import chromadb
+from chromadb.utils import embedding_functions
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from modules.rate_limiter import TokenBucket
+from modules.upsert_buffer import UpsertBuffer
+from modules.chunker import chunk_segments, chunk_ids, chunk_hash, clamp_overlap
+from modules.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from modules.state_store import StateStore
+from modules.webui_store import WebUINoteStore
+from modules.page_mirror import PageMirror
+from modules.ollama_client import OllamaClient
+from modules.lexical_index import LexicalIndex, rrf_fuse
+from modules.query_cache import LRUCache, LatencyTracker, MISSING
+from modules.metrics import Registry
+from modules.jobs import JobRunner
+from modules.task_graph import TaskGraph
+from modules.readiness import Readiness
+from modules.pipeline import prefetch, batched, collect
+from modules.checkpoint import CheckpointTimer
+from modules.blog_index import scan_markdown, scan_paths, diff_manifest, parse_files, MARKDOWN_SUFFIXES
+from modules.watcher import DirectoryWatcher
 
 BASE_DIR = Path("/app") if Path("/app").exists() else Path.home() / "ai-system"
 DATA_DIR = BASE_DIR / "data"
 CONFIG_PATH = BASE_DIR / "config/notion.yaml"
-SYNC_STATE_PATH = DATA_DIR / "sync_state.json"
+SYNC_STATE_DB_PATH = DATA_DIR / "sync_state.db"
+SYNC_STATE_PATH = DATA_DIR / "sync_state.json"  # 旧版状态文件，启动时导入 SQLite
 CHROMA_PATH = DATA_DIR / "vector-db"
+EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache.db"
+PAGE_MIRROR_PATH = DATA_DIR / "page_mirror.db"
+LEXICAL_INDEX_PATH = DATA_DIR / "lexical_index.db"
 WEBUI_DB_PATH = "/webui-data/webui.db"
+BLOG_PATH = Path("/blogs")   # docker-compose 只读挂载的博客仓库
 
 NOTION_API = "https://api.notion.com/v1"
+NOTION_MAX_RETRIES = 5
+NOTION_CHILDREN_LIMIT = 100  # 单次请求最多写入的子 block 数
+NOTION_PAGE_SIZE = 100       # 数据库查询每页返回的页面数
+QUERY_PREFETCH = 200         # 向量同步时后台翻页最多领先处理进度的页面数
+# Chroma 默认 embedding 模型（ONNX 版 all-MiniLM-L6-v2），带上 chromadb 版本作为 embedding 缓存的键
+EMBEDDING_MODEL = f"all-MiniLM-L6-v2@chromadb-{chromadb.__version__}"
+
+# 进程内所有 Notion 请求共用的限流器（Notion 限额约 3 次/秒）
+NOTION_LIMITER = TokenBucket(rate=3)
+
+# ==================== 监控指标（/metrics） ====================
+
+METRICS = Registry()
+NOTION_REQUESTS = METRICS.counter(
+    'notion_requests_total', 'Notion API 请求数', ['method', 'endpoint', 'status'])
+NOTION_LATENCY = METRICS.histogram(
+    'notion_request_seconds', 'Notion API 请求耗时（不含限流等待）', ['method', 'endpoint'])
+NOTION_RATE_LIMITED = METRICS.counter(
+    'notion_rate_limited_total', 'Notion 返回 429 的次数', ['endpoint'])
+NOTION_RETRIES = METRICS.counter(
+    'notion_retries_total', '429 之后的重试次数', ['endpoint'])
+NOTION_LIMITER_WAIT = METRICS.counter(
+    'notion_limiter_wait_seconds_total', '本地限流器累计等待时间')
+SYNC_PAGES = METRICS.counter(
+    'sync_pages_total', '向量同步处理的页面数（fetched / skipped / upserted / failed）',
+    ['database', 'result'])
+EMBEDDING_BATCH_SIZE = METRICS.histogram(
+    'embedding_batch_size', '每次实际计算 embedding 的文本数', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+EMBEDDING_SECONDS = METRICS.histogram(
+    'embedding_seconds', '每批 embedding 计算耗时')
+EMBEDDING_CACHE = METRICS.counter(
+    'embedding_cache_lookups_total', 'embedding 缓存累计命中 / 未命中次数', ['result'])
+VECTOR_WRITE_SECONDS = METRICS.histogram(
+    'vector_write_seconds', '向量库（Chroma + BM25 索引）每次批量写入耗时')
+VECTOR_DOCUMENTS = METRICS.gauge(
+    'vector_documents', 'notion collection 文档数')
+WEBUI_DB_SECONDS = METRICS.histogram(
+    'webui_db_seconds', 'WebUI 数据库读 / 写 / 提交耗时', ['op'])
+SEARCH_SECONDS = METRICS.histogram(
+    'search_seconds', '/search 查询耗时', ['cache'])
+SYNC_RUNS = METRICS.counter(
+    'sync_runs_total', '同步次数', ['result'])
+SYNC_LAST_DURATION = METRICS.gauge(
+    'sync_last_duration_seconds', '最近一次同步各阶段耗时', ['task'])
+SYNC_LAST_SUCCESS = METRICS.gauge(
+    'sync_last_success_timestamp_seconds', '最近一次成功同步的时间')
+
+NOTION_ID_RE = re.compile(r'[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}')
+
+def notion_endpoint(url):
+    """https://api.notion.com/v1/blocks/<id>/children → /blocks/{id}/children"""
+    path = url[len(NOTION_API):] if url.startswith(NOTION_API) else url
+    return NOTION_ID_RE.sub('{id}', path.split('?')[0])
+
+SEARCH_MODES = ('vector', 'bm25', 'hybrid')
+SEARCH_BATCH_MAX = 100  # /search/batch 单次最多查询数
 
 app = Flask(__name__)
 
@@ -65,41 +147,99 @@ def format_title_with_category(title, category):
         return f"【{category}】{title}"
     return title
 
+TEXT_BLOCK_TYPES = {
+    'paragraph', 'heading_1', 'heading_2', 'heading_3',
+    'bulleted_list_item', 'numbered_list_item', 'to_do',
+    'toggle', 'quote', 'callout'
+}
+
+def block_text(block):
+    """block 的纯文本，非文本类 block 返回空字符串"""
+    block_type = block.get('type')
+    if block_type not in TEXT_BLOCK_TYPES:
+        return ''
+    rich_text = block.get(block_type, {}).get('rich_text', [])
+    return ''.join(t.get('plain_text', '') for t in rich_text)
+
+def segments_text(segments):
+    return '\n'.join(text for _, text in segments)
+
+def has_nested_blocks(block):
+    return block.get('has_children') and block.get('type') not in ('child_page', 'child_database')
+
+def split_content(content):
+    """按 Notion rich_text 上限切成 2000 字符的段"""
+    return [content[i:i + 2000] for i in range(0, len(content), 2000)]
+
+def paragraph_block(text):
+    return {
+        "object": "block",
+        "type": "paragraph",
+        "paragraph": {
+            "rich_text": [{"type": "text", "text": {"content": text}}]
+        }
+    }
+
+def iso_timestamp(value):
+    """ISO 时间 → Unix 时间戳（Chroma 的 $gte 只支持数字），不带时区的按 UTC"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def search_where(filters):
+    """搜索过滤条件 → Chroma where
+
+    filters: {"database": "复盘" 或 ["复盘", "目标"], "updated_after": "2024-01-01"}
+    updated_after 按页面在 Notion 的最后编辑时间过滤。格式错误时抛出 ValueError。
+    """
+    if filters and not isinstance(filters, dict):
+        raise ValueError("filters 必须是对象")
+    clauses = []
+    database = (filters or {}).get('database')
+    if isinstance(database, str) and database:
+        clauses.append({"database": database})
+    elif isinstance(database, list) and database:
+        clauses.append({"database": {"$in": [str(d) for d in database]}})
+    elif database:
+        raise ValueError("database 必须是字符串或字符串列表")
+    updated_after = (filters or {}).get('updated_after')
+    if updated_after:
+        clauses.append({"last_edited_ts": {"$gte": iso_timestamp(str(updated_after))}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def summary_prompt(text):
+    return f"请用中文总结以下复盘内容（100字以内），只输出总结：\n\n{text[:4000]}"
+
+def block_diff_key(block):
+    """diff 用的 block 标识：无子节点的段落按文本比较，其他 block 一律视为不同"""
+    if block.get('type') == 'paragraph' and not block.get('has_children'):
+        return ('paragraph', block_text(block))
+    return ('block', block.get('id'))
+
+def observe_embedding(batch_size, seconds):
+    EMBEDDING_BATCH_SIZE.observe(batch_size)
+    EMBEDDING_SECONDS.observe(seconds)
+
 def load_config():
     if not CONFIG_PATH.exists():
         return None
     with open(CONFIG_PATH, 'r') as f:
         return yaml.safe_load(f)
 
-def load_state():
-    if SYNC_STATE_PATH.exists():
-        try:
-            with open(SYNC_STATE_PATH, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    return {
-        "last_sync": None,
-        # 统一的双向映射表：webui_id ↔ notion_id
-        # 格式: { webui_id: { notion_id, webui_hash, notion_timestamp, title } }
-        "note_mapping": {},
-        # 反向索引：notion_id → webui_id（快速查找）
-        "notion_to_webui_index": {},
-        # 向量库相关
-        "page_timestamps": {},
-        "summary_done": []
-    }
+def get_state_store():
+    global state_store
+    if state_store is None:
+        state_store = StateStore(SYNC_STATE_DB_PATH, legacy_json=SYNC_STATE_PATH)
+    return state_store
+
+state_store = None
 
-def save_state(state):
-    # 重建反向索引
-    state["notion_to_webui_index"] = {}
-    for webui_id, info in state.get("note_mapping", {}).items():
-        notion_id = info.get("notion_id")
-        if notion_id:
-            state["notion_to_webui_index"][notion_id] = webui_id
-    
-    with open(SYNC_STATE_PATH, 'w') as f:
-        json.dump(state, f, indent=2, ensure_ascii=False)
+
+class NotionAPIError(Exception):
+    pass
 
 
 class NotionSync:
@@ -113,77 +253,360 @@ class NotionSync:
         }
         
         self.session = requests.Session()
-        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+        # 429 交给 api_request 处理（全局限流器暂停 + 计数），urllib3 不按 Retry-After 自行重试
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                      respect_retry_after_header=False)
         adapter = HTTPAdapter(max_retries=retry)
         self.session.mount('https://', adapter)
+        NOTION_LIMITER.configure(config['notion'].get('rate_limit', 3))
+        self.api_stats = {"requests": 0, "rate_limited": 0, "retried": 0, "failed": 0}
+        self.gc_stats = {"vectors": 0, "bytes": 0, "pages": 0, "last_run": None}
+        self._stats_lock = threading.Lock()
         
-        self.chroma = chromadb.PersistentClient(path=str(CHROMA_PATH))
-        self.collection = self.chroma.get_or_create_collection("notion")
+        # 所有 collection 共用带缓存的 embedding function，已经算过的文本不再跑 ONNX 模型
+        self.embedding_cache = EmbeddingCache(
+            EMBEDDING_CACHE_PATH,
+            max_entries=int((config.get('sync') or {}).get('embedding_cache_size', 200_000))
+        )
+        self.embedding_function = CachedEmbeddingFunction(
+            embedding_functions.DefaultEmbeddingFunction(), self.embedding_cache,
+            EMBEDDING_MODEL, on_compute=observe_embedding)
+        # 向量库在第一次用到时才打开，ONNX 模型由 warm_up() 在后台加载，启动不再等它们
+        self.chroma = None
+        self._collection = None
+        self._blog_collection = None
+        self.readiness = Readiness()
+        self._open_lock = threading.Lock()
+        self._warmup_lock = threading.Lock()
+        # notion collection 的 BM25 索引，和向量库同步写入
+        self.lexical = LexicalIndex(LEXICAL_INDEX_PATH)
+        self.search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search')
+        # /search 缓存：查询向量不会过期；结果按向量库版本号失效，每次写入向量库版本号 +1
+        query_cache_size = int((config.get('sync') or {}).get('query_cache_size', 1000))
+        self.query_embeddings = LRUCache(query_cache_size)
+        self.search_results = LRUCache(query_cache_size)
+        self.search_latency = {"hit": LatencyTracker(), "miss": LatencyTracker()}
+        self.generation = 0
+
+        NOTION_LIMITER_WAIT.set_function(lambda: NOTION_LIMITER.snapshot()['wait_seconds'])
+        EMBEDDING_CACHE.set_function(lambda: {
+            (result,): self.embedding_cache.stats[result] for result in ('hits', 'misses')})
+        VECTOR_DOCUMENTS.set_function(self.document_count)
         self.ai_model = config.get('ai', {}).get('model', 'qwen2.5:14b-instruct')
         self.ollama_url = "http://host.docker.internal:11434"
+        # 同时发给 Ollama 的请求数，和 OLLAMA_NUM_PARALLEL 保持一致
+        self.ollama = OllamaClient(self.ollama_url, self.ai_model,
+                                   concurrency=config.get('ai', {}).get('concurrency', 2))
         self.flow = config.get('notes', {}).get('flow', 'webui_to_notion')
         
+        self.state = get_state_store()
+        # Notion 页面本地镜像，笔记同步和向量同步共用
+        self.mirror = PageMirror(PAGE_MIRROR_PATH)
+        self.webui = WebUINoteStore(WEBUI_DB_PATH, transaction=self.state.transaction,
+                                    observe=lambda op, seconds: WEBUI_DB_SECONDS.observe(seconds, op=op))
         self.auto_summary = config.get('review', {}).get('auto_summary', False)
         self.auto_title = config.get('review', {}).get('auto_title', False)
+        self.summary_property = config.get('review', {}).get('summary_property', 'AI总结')
+
+        sync_config = config.get('sync') or {}
+        self.fetch_workers = max(1, int(sync_config.get('fetch_workers', 8)))
+        self.full_scan_interval = int(sync_config.get('full_scan_interval', 86400))
+        self.upsert_batch_size = int(sync_config.get('upsert_batch_size', 64))
+        self.chunk_size = max(1, int(sync_config.get('chunk_size', 800)))
+        overlap = int(sync_config.get('chunk_overlap', 150))
+        self.chunk_overlap = clamp_overlap(self.chunk_size, overlap)
+        if self.chunk_overlap != overlap:
+            log(f"⚠️ sync.chunk_overlap={overlap} 超出范围（0 到 chunk_size 的一半），改为 {self.chunk_overlap}")
+        # 长时间的同步每处理这么多页面 / 笔记或每隔这么多秒保存一次进度
+        self.checkpoint_pages = int(sync_config.get('checkpoint_pages', 500))
+        self.checkpoint_seconds = float(sync_config.get('checkpoint_seconds', 30))
+        # 页面内的子树获取单独用一个线程池，避免和页面级线程池互相等待
+        self.block_pool = ThreadPoolExecutor(max_workers=self.fetch_workers,
+                                             thread_name_prefix='notion-blocks')
+        blog_config = config.get('blog') or {}
+        self.blog_path = Path(blog_config.get('path', BLOG_PATH))
+        self.blog_workers = max(1, int(blog_config.get('workers', min(4, os.cpu_count() or 1))))
+        # 进度回调，由后台任务设置为 job.update(phase, database=None, **info)
+        self.progress = None
+
+    def report(self, phase, database=None, **info):
+        if self.progress:
+            self.progress(phase, database=database, **info)
+
+    # ==================== 向量库 / 模型加载 ====================
+
+    @property
+    def collection(self):
+        """notion collection，第一次访问时打开向量库"""
+        if self._collection is None:
+            with self._open_lock:
+                if self._collection is None:
+                    self.chroma = chromadb.PersistentClient(path=str(CHROMA_PATH))
+                    # 不绑定 embedding function：已有的 collection 记录的是 Chroma 默认的 default，
+                    # 换成别的会打不开。向量由 self.embedding_function 算好后随写入 / 查询传入
+                    self._collection = self.chroma.get_or_create_collection("notion")
+        return self._collection
+
+    @property
+    def blog_collection(self):
+        """blog collection（/blogs 下的 Markdown），和 notion collection 共用向量库"""
+        if self._blog_collection is None:
+            self.collection
+            with self._open_lock:
+                if self._blog_collection is None:
+                    self._blog_collection = self.chroma.get_or_create_collection("blog")
+        return self._blog_collection
+
+    def document_count(self):
+        """向量库文档数，还没打开时返回 None（不为此去打开）"""
+        return self._collection.count() if self._collection is not None else None
+
+    def warm_up(self):
+        """打开向量库并加载 embedding 模型，可重复调用
+
+        启动时在后台线程执行；同步和向量检索在模型就绪前调用它，
+        会等正在进行的加载完成（模型只加载一次），失败时抛出异常、下次调用重试。
+        """
+        if self.readiness.reached('ready'):
+            return
+        with self._warmup_lock:
+            if self.readiness.reached('ready'):
+                return
+            try:
+                started = time.monotonic()
+                self.readiness.advance('opening_index')
+                count = self.collection.count()
+                self.readiness.advance('index_ready')
+                log(f"📂 向量库已打开: {count} 条 ({time.monotonic() - started:.1f}s)")
+
+                started = time.monotonic()
+                self.readiness.advance('loading_model')
+                # 直接调用内层模型，避免命中 embedding 缓存而没有真正加载
+                self.embedding_function.inner(['预热'])
+                self.readiness.advance('ready')
+                log(f"🧠 embedding 模型已加载 ({time.monotonic() - started:.1f}s)")
+            except Exception as e:
+                self.readiness.fail(e)
+                raise
 
     # ==================== Notion API ====================
 
     def api_request(self, method, url, **kwargs):
+        """经过全局限流的 Notion 请求，429 时按 Retry-After 等待后重试"""
         kwargs['headers'] = self.headers
         kwargs['timeout'] = 30
-        try:
-            if method == 'GET':
-                return self.session.get(url, **kwargs)
-            elif method == 'POST':
-                return self.session.post(url, **kwargs)
-            elif method == 'PATCH':
-                return self.session.patch(url, **kwargs)
-            elif method == 'DELETE':
-                return self.session.delete(url, **kwargs)
-        except Exception as e:
-            log(f"    ⚠️ API 请求失败: {e}")
-            return None
+        endpoint = notion_endpoint(url)
+        response = None
+        for attempt in range(NOTION_MAX_RETRIES + 1):
+            NOTION_LIMITER.acquire()
+            self._count('requests')
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception as e:
+                self._count('failed')
+                NOTION_REQUESTS.inc(method=method, endpoint=endpoint, status='error')
+                log(f"    ⚠️ API 请求失败: {e}")
+                return None
+            NOTION_LATENCY.observe(time.monotonic() - started, method=method, endpoint=endpoint)
+            NOTION_REQUESTS.inc(method=method, endpoint=endpoint, status=response.status_code)
+
+            if response.status_code != 429:
+                return response
+
+            self._count('rate_limited')
+            NOTION_RATE_LIMITED.inc(endpoint=endpoint)
+            if attempt == NOTION_MAX_RETRIES:
+                break
+            try:
+                retry_after = float(response.headers.get('Retry-After', ''))
+            except ValueError:
+                retry_after = 2 ** attempt
+            NOTION_LIMITER.pause(retry_after)
+            self._count('retried')
+            NOTION_RETRIES.inc(endpoint=endpoint)
+
+        self._count('failed')
+        log(f"    ⚠️ API 限流，重试 {NOTION_MAX_RETRIES} 次后放弃: {method} {url}")
+        return response
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.api_stats[key] += 1
+
+    def on_vector_write(self, seconds):
+        """向量库每次实际写入后：记录耗时，版本号 +1 让搜索缓存失效"""
+        VECTOR_WRITE_SECONDS.observe(seconds)
+        with self._stats_lock:
+            self.generation += 1
+
+    def get_api_stats(self):
+        with self._stats_lock:
+            stats = dict(self.api_stats)
+        return dict(stats, limiter=NOTION_LIMITER.snapshot())
 
     def query_database_all(self, db_id):
+        return self.query_database(db_id)[0]
+
+    def query_database(self, db_id, since=None):
+        """查询数据库页面，返回 (pages, complete)，complete 含义见 iter_database"""
+        return collect(self.iter_database(db_id, since))
+
+    def iter_database(self, db_id, since=None, before=None):
+        """逐页查询数据库，边翻页边产出页面，结束时返回 complete（yield from 的值）
+
+        页面按编辑时间倒序分页。since 为 last_edited_time 水位线：只取该时间之后
+        编辑过的页面，遇到早于水位线的页面即停止翻页；before 为上界（含），
+        从检查点续跑时跳过已经处理过的更新的页面。
+        complete 为 False 表示中途请求失败，已产出的页面不完整。
+        """
         formatted_id = format_uuid(db_id)
         url = f"{NOTION_API}/databases/{formatted_id}/query"
-        all_pages = []
         has_more = True
         start_cursor = None
+        filters = []
+        if since:
+            filters.append({"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}})
+        if before:
+            filters.append({"timestamp": "last_edited_time", "last_edited_time": {"on_or_before": before}})
 
         while has_more:
-            payload = {}
+            payload = {"sorts": [{"timestamp": "last_edited_time", "direction": "descending"}]}
+            if filters:
+                payload['filter'] = filters[0] if len(filters) == 1 else {"and": filters}
             if start_cursor:
                 payload['start_cursor'] = start_cursor
             
             response = self.api_request('POST', url, json=payload)
             if not response or response.status_code != 200:
-                break
+                return False
                 
             data = response.json()
-            all_pages.extend(data.get('results', []))
+            for page in data.get('results', []):
+                if since and self.get_page_last_edited(page) < since:
+                    return True
+                yield page
             has_more = data.get('has_more', False)
             start_cursor = data.get('next_cursor')
             
-        return all_pages
+        return True
 
-    def get_page_content(self, page_id):
-        url = f"{NOTION_API}/blocks/{page_id}/children"
-        response = self.api_request('GET', url)
-        if not response or response.status_code != 200:
+    def get_page_content(self, page):
+        try:
+            return segments_text(self.page_segments(page))
+        except NotionAPIError:
             return ""
-            
-        blocks = response.json().get('results', [])
-        content = []
-        for block in blocks:
-            block_type = block.get('type')
-            if block_type in ['paragraph', 'heading_1', 'heading_2', 'heading_3',
-                               'bulleted_list_item', 'numbered_list_item', 'to_do']:
-                rich_text = block.get(block_type, {}).get('rich_text', [])
-                text = ''.join([t.get('plain_text', '') for t in rich_text])
-                if text:
-                    content.append(text)
-        return '\n'.join(content)
+
+    def page_segments(self, page):
+        """页面段落：本地镜像中 last_edited_time 一致时直接读取，否则请求 API 并更新镜像"""
+        page_id = page['id']
+        last_edited = self.get_page_last_edited(page)
+        mirrored = self.mirror.get(page_id, last_edited)
+        if mirrored is not None:
+            return mirrored['segments']
+        segments = self.fetch_page_segments(page_id)
+        self.mirror.put(page_id, last_edited, segments, segments_text(segments),
+                        title=self.get_page_title(page),
+                        category=self.get_page_category(page),
+                        database_id=page.get('parent', {}).get('database_id'))
+        return segments
+
+    def fetch_page(self, page_id):
+        """获取单个页面对象（属性和 last_edited_time，不含正文），失败返回 None"""
+        response = self.api_request('GET', f"{NOTION_API}/pages/{page_id}")
+        if response and response.status_code == 200:
+            return response.json()
+        return None
+
+    def fetch_page_content(self, page_id):
+        """获取页面正文，请求失败时抛出 NotionAPIError（区分失败和空页面）"""
+        return segments_text(self.fetch_page_segments(page_id))
+
+    def fetch_page_segments(self, page_id):
+        """获取页面的文本段落 [(block_type, text)]，保留标题等结构供分块使用"""
+        segments = []
+        for _, block in self.fetch_block_tree(page_id):
+            text = block_text(block)
+            if text:
+                segments.append((block['type'], text))
+        return segments
+
+    def fetch_block_children(self, block_id):
+        """分页获取一个 block 的全部直接子 block"""
+        url = f"{NOTION_API}/blocks/{block_id}/children"
+        blocks = []
+        start_cursor = None
+        while True:
+            params = {'page_size': 100}
+            if start_cursor:
+                params['start_cursor'] = start_cursor
+            response = self.api_request('GET', url, params=params)
+            if response is None:
+                raise NotionAPIError(f"GET blocks/{block_id} 请求失败")
+            if response.status_code != 200:
+                raise NotionAPIError(f"GET blocks/{block_id} 返回 {response.status_code}")
+
+            data = response.json()
+            blocks.extend(data.get('results', []))
+            if not data.get('has_more'):
+                return blocks
+            start_cursor = data.get('next_cursor')
+
+    def fetch_block_tree(self, block_id):
+        """按层获取整棵 block 树，返回按文档顺序展开的 [(depth, block)]
+
+        同一层所有带 has_children 的 block 并发获取子树（受全局限流约束），
+        子页面 / 子数据库是独立页面，不展开。
+        """
+        children = {block_id: self.fetch_block_children(block_id)}
+        level = [b for b in children[block_id] if has_nested_blocks(b)]
+        while level:
+            futures = [(b['id'], self.block_pool.submit(self.fetch_block_children, b['id']))
+                       for b in level]
+            level = []
+            for child_id, future in futures:
+                children[child_id] = future.result()
+                level.extend(b for b in children[child_id] if has_nested_blocks(b))
+
+        flattened = []
+        stack = [(0, b) for b in reversed(children[block_id])]
+        while stack:
+            depth, block = stack.pop()
+            flattened.append((depth, block))
+            stack.extend((depth + 1, b) for b in reversed(children.get(block['id'], [])))
+        return flattened
+
+    def fetch_contents(self, page_ids, fetch=None):
+        """并发获取多个页面内容，按输入顺序产出 (page_id, content, error)
+
+        fetch 默认为 fetch_page_content，也可以传 fetch_page_segments 等；
+        page_ids 可以是 generator，按预取窗口逐个取用，fetch 收到的就是其中的元素
+
+        线程池大小由 sync.fetch_workers 控制，预取窗口为线程数的 2 倍，
+        单个页面失败只通过 error 返回，不影响其他页面。
+        """
+        fetch = fetch or self.fetch_page_content
+        window = self.fetch_workers * 2
+        page_iter = iter(page_ids)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.fetch_workers,
+                                thread_name_prefix='notion-fetch') as pool:
+            def submit_next():
+                for page_id in page_iter:
+                    pending.append((page_id, pool.submit(fetch, page_id)))
+                    return
+
+            for _ in range(window):
+                submit_next()
+
+            while pending:
+                page_id, future = pending.popleft()
+                submit_next()
+                try:
+                    yield page_id, future.result(), None
+                except Exception as e:
+                    yield page_id, None, e
 
     def get_page_title(self, page):
         props = page.get('properties', {})
@@ -206,17 +629,12 @@ class NotionSync:
         return page.get('last_edited_time', '')
 
     def create_notion_page(self, db_id, title, content, category=None):
+        """新建页面，返回 (page_id, last_edited_time)，失败返回 (None, None)
+
+        last_edited_time 取自创建（和追加 block）的响应，不用再 GET 一次页面
+        """
         formatted_id = format_uuid(db_id)
-        blocks = []
-        for i in range(0, len(content), 2000):
-            chunk = content[i:i+2000]
-            blocks.append({
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {
-                    "rich_text": [{"type": "text", "text": {"content": chunk}}]
-                }
-            })
+        blocks = [paragraph_block(chunk) for chunk in split_content(content)]
 
         properties = {"名称": {"title": [{"text": {"content": title}}]}}
         if category:
@@ -225,158 +643,241 @@ class NotionSync:
         payload = {
             "parent": {"database_id": formatted_id},
             "properties": properties,
-            "children": blocks[:100]
+            "children": blocks[:NOTION_CHILDREN_LIMIT]
         }
 
         response = self.api_request('POST', f"{NOTION_API}/pages", json=payload)
         if response and response.status_code == 200:
-            return response.json().get('id')
-        return None
-
-    def update_notion_page(self, page_id, title, content, category=None):
-        # 更新属性
+            page = response.json()
+            page_id = page.get('id')
+            last_edited = page.get('last_edited_time', '')
+            if len(blocks) > NOTION_CHILDREN_LIMIT:
+                last_edited = max(last_edited, self.append_blocks(page_id, blocks[NOTION_CHILDREN_LIMIT:]) or '')
+            return page_id, last_edited
+        return None, None
+
+    def append_blocks(self, parent_id, blocks, after=None):
+        """分批（每批 100 个）追加子 block，after 为插入位置
+
+        返回写入响应中最新的 last_edited_time，失败返回 None
+        """
+        url = f"{NOTION_API}/blocks/{parent_id}/children"
+        last_edited = ''
+        for i in range(0, len(blocks), NOTION_CHILDREN_LIMIT):
+            payload = {"children": blocks[i:i + NOTION_CHILDREN_LIMIT]}
+            if after:
+                payload["after"] = after
+            response = self.api_request('PATCH', url, json=payload)
+            if not response or response.status_code != 200:
+                return None
+            results = response.json().get('results', [])
+            for block in results:
+                last_edited = max(last_edited, block.get('last_edited_time', ''))
+            if after and results:
+                after = results[-1]['id']
+        return last_edited
+
+    def update_notion_page(self, page_id, title, content, category=None, known=None):
+        """更新页面：只修改/插入/删除有变化的 block，属性没变时不写
+
+        旧 block 列表和新内容的 2000 字符分段做 diff，相同的段落不动，
+        替换的段落原地 PATCH，多出的删除、缺少的插入到对应位置。
+        known 是页面当前的 (标题, 分类, last_edited_time)（来自查询结果或映射表）：
+        只 PATCH 变了的属性，都没变时新的 last_edited_time 取 block 写入响应里最新的，
+        什么都没写时原样返回 known 里的时间。known 为 None 时总是写属性。
+        属性最后写：它的响应是页面对象，last_edited_time 已包含前面的 block 改动。
+        返回值记进映射表后，下次同步不会把刚写入的页面当成 Notion 侧有修改。
+        失败返回 None。
+        """
         url = f"{NOTION_API}/pages/{page_id}"
-        properties = {"名称": {"title": [{"text": {"content": title}}]}}
-        if category:
+        properties = {}
+        if known is None or known[0] != title:
+            properties["名称"] = {"title": [{"text": {"content": title}}]}
+        if category and (known is None or known[1] != category):
             properties["分类"] = {"select": {"name": category}}
-        
+
+        try:
+            existing = self.fetch_block_children(page_id)
+        except NotionAPIError as e:
+            log(f"    ⚠️ 读取 blocks 失败: {e}")
+            return None
+
+        chunks = split_content(content)
+        old_keys = [block_diff_key(b) for b in existing]
+        new_keys = [('paragraph', chunk) for chunk in chunks]
+        matcher = difflib.SequenceMatcher(a=old_keys, b=new_keys, autojunk=False)
+
+        edited = ''     # block 写入响应里最新的 last_edited_time
+
+        def write(method, write_url, **kwargs):
+            nonlocal edited
+            resp = self.api_request(method, write_url, **kwargs)
+            if resp is None or resp.status_code != 200:
+                return False
+            edited = max(edited, resp.json().get('last_edited_time', ''))
+            return True
+
+        def append(blocks, after=None):
+            nonlocal edited
+            last_edited = self.append_blocks(page_id, blocks, after=after)
+            if last_edited is None:
+                return False
+            edited = max(edited, last_edited)
+            return True
+
+        anchor = None  # 最近一个保留下来的 block，插入时放在它后面
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                anchor = existing[i2 - 1]['id']
+                continue
+
+            old_blocks, new_chunks = existing[i1:i2], chunks[j1:j2]
+
+            # 成对的段落 block 原地修改
+            patched = 0
+            while (patched < min(len(old_blocks), len(new_chunks))
+                   and old_keys[i1 + patched][0] == 'paragraph'):
+                block = old_blocks[patched]
+                if not write('PATCH', f"{NOTION_API}/blocks/{block['id']}",
+                             json={"paragraph": paragraph_block(new_chunks[patched])["paragraph"]}):
+                    return None
+                anchor = block['id']
+                patched += 1
+
+            for block in old_blocks[patched:]:
+                if not write('DELETE', f"{NOTION_API}/blocks/{block['id']}"):
+                    return None
+
+            remaining = [paragraph_block(c) for c in new_chunks[patched:]]
+            if not remaining:
+                continue
+            if anchor is None and i2 < len(existing):
+                # Notion 只能插到某个 block 之后：插在最前面时改为重写后面的全部内容
+                for block in existing[i2:]:
+                    if not write('DELETE', f"{NOTION_API}/blocks/{block['id']}"):
+                        return None
+                remaining = [paragraph_block(c) for c in chunks[j1:]]
+                if not append(remaining):
+                    return None
+                break
+
+            if not append(remaining, after=anchor):
+                return None
+
+        if not properties:
+            return edited or known[2]
         response = self.api_request('PATCH', url, json={"properties": properties})
         if not response or response.status_code != 200:
-            return False
-        
-        # 删除旧 blocks
-        blocks_url = f"{NOTION_API}/blocks/{page_id}/children"
-        blocks_response = self.api_request('GET', blocks_url)
-        if blocks_response and blocks_response.status_code == 200:
-            for block in blocks_response.json().get('results', []):
-                self.api_request('DELETE', f"{NOTION_API}/blocks/{block['id']}")
-        
-        # 添加新 blocks
-        new_blocks = []
-        for i in range(0, len(content), 2000):
-            chunk = content[i:i+2000]
-            new_blocks.append({
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {
-                    "rich_text": [{"type": "text", "text": {"content": chunk}}]
-                }
-            })
-        
-        if new_blocks:
-            self.api_request('PATCH', blocks_url, json={"children": new_blocks[:100]})
-        
-        return True
+            return None
+        return response.json().get('last_edited_time', '')
 
     def archive_notion_page(self, page_id):
         url = f"{NOTION_API}/pages/{page_id}"
         response = self.api_request('PATCH', url, json={"archived": True})
-        return response and response.status_code == 200
+        if response and response.status_code == 200:
+            self.mirror.delete([page_id])
+            return True
+        return False
 
     # ==================== WebUI Notes ====================
 
-    def get_webui_notes(self):
-        if not os.path.exists(WEBUI_DB_PATH):
-            return []
+    def load_webui_notes(self, mapping):
+        """读取 WebUI 笔记，返回 (versions, notes)，读取失败返回 (None, None)
+
+        versions 是全部笔记的 {id: updated_at}，只查两列；notes 只包含未映射、
+        或 updated_at 和映射表记录不同的笔记（已解析内容），其余视为未修改
+        """
+        if not self.webui.exists():
+            log(f"    ⚠️ WebUI 数据库不存在: {self.webui.path}")
+            return None, None
         try:
-            conn = sqlite3.connect(WEBUI_DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, user_id, title, data, created_at, updated_at FROM note")
-            rows = cursor.fetchall()
-            conn.close()
-
-            notes = []
-            for row in rows:
-                note_id, user_id, title, data_json, created_at, updated_at = row
-                content = ""
-                try:
-                    data = json.loads(data_json) if isinstance(data_json, str) else data_json
-                    content = data.get('content', {}).get('md', '') if isinstance(data, dict) else ''
-                except:
-                    pass
-                notes.append({
-                    "id": note_id,
-                    "user_id": user_id,
-                    "title": title or "",
-                    "content": content,
-                    "updated_at": updated_at
-                })
-            return notes
+            versions = self.webui.note_versions()
+            changed = [note_id for note_id, updated_at in versions.items()
+                       if note_id not in mapping or mapping[note_id].get('webui_updated_at') != updated_at]
+            return versions, self.webui.fetch_notes(changed)
         except Exception as e:
             log(f"    ❌ 读取 WebUI 笔记失败: {e}")
-            return []
+            return None, None
 
     def create_webui_note(self, user_id, title, content):
-        if not os.path.exists(WEBUI_DB_PATH):
-            return None
+        """返回 (note_id, updated_at)，失败返回 (None, None)"""
         try:
-            note_id = str(uuid.uuid4())
-            now = int(time.time() * 1_000_000_000)
-            data = json.dumps({"content": {"md": content}})
-            
-            conn = sqlite3.connect(WEBUI_DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO note (id, user_id, title, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (note_id, user_id, title, data, now, now)
-            )
-            conn.commit()
-            conn.close()
-            return note_id
+            return self.webui.create_note(user_id, title, content)
         except Exception as e:
             log(f"    ❌ 创建 WebUI 笔记失败: {e}")
-            return None
+            return None, None
 
     def update_webui_note(self, note_id, title, content):
-        if not os.path.exists(WEBUI_DB_PATH):
-            return False
+        """返回新的 updated_at，失败返回 None"""
         try:
-            now = int(time.time() * 1_000_000_000)
-            data = json.dumps({"content": {"md": content}})
-            
-            conn = sqlite3.connect(WEBUI_DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE note SET title = ?, data = ?, updated_at = ? WHERE id = ?",
-                (title, data, now, note_id)
-            )
-            conn.commit()
-            conn.close()
-            return True
+            return self.webui.update_note(note_id, title, content)
         except Exception as e:
             log(f"    ❌ 更新 WebUI 笔记失败: {e}")
-            return False
+            return None
 
     def delete_webui_note(self, note_id):
-        if not os.path.exists(WEBUI_DB_PATH):
-            return False
         try:
-            conn = sqlite3.connect(WEBUI_DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM note WHERE id = ?", (note_id,))
-            conn.commit()
-            conn.close()
-            return True
-        except:
+            return self.webui.delete_note(note_id)
+        except Exception:
             return False
 
     def get_webui_default_user_id(self):
-        if not os.path.exists(WEBUI_DB_PATH):
-            return None
         try:
-            conn = sqlite3.connect(WEBUI_DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM user LIMIT 1")
-            row = cursor.fetchone()
-            conn.close()
-            return row[0] if row else None
-        except:
+            return self.webui.default_user_id()
+        except Exception:
             return None
 
+    def link_note(self, mapping, webui_id, info):
+        """写入映射，同时删除这条笔记待确认的创建记录"""
+        mapping[webui_id] = info
+        self.state.clear_pending_note(webui_id)
+
+    def resolve_pending_notes(self, mapping, webui_notes, notion_pages):
+        """处理上次同步中断时已发出、但没来得及写进映射表的创建，返回补上的映射数
+
+        对应的笔记 / 页面已经存在就补上映射（按创建方向标记为有变化，
+        下面的更新检测会以源头为准核对一次内容），否则丢弃记录，本轮照常创建。
+        """
+        adopted = 0
+        linked = mapping.notion_index()
+        for item in self.state.pending_notes():
+            webui_id, notion_id = item['webui_id'], item['notion_id']
+            note = webui_notes.get(webui_id)
+            if webui_id in mapping or note is None:
+                self.state.clear_pending_note(webui_id)
+                continue
+            if notion_id is None:
+                # WebUI → Notion：请求超时时页面可能已经建好，按标题和创建时间找回
+                started = iso_timestamp(item['started']) - 60
+                notion_id = next((page_id for page_id, page in notion_pages.items()
+                                  if page_id not in linked
+                                  and self.get_page_title(page) == item['title']
+                                  and iso_timestamp(page.get('created_time') or item['started']) >= started),
+                                 None)
+                info = {'notion_timestamp': notion_id and self.get_page_last_edited(notion_pages[notion_id])}
+            else:
+                # Notion → WebUI：笔记已提交，映射没写上
+                info = {'webui_hash': content_hash(note['title'] + note['content']),
+                        'webui_updated_at': note['updated_at']}
+            if notion_id in notion_pages and notion_id not in linked:
+                self.link_note(mapping, webui_id, dict(info, notion_id=notion_id, title=note['title']))
+                linked[notion_id] = webui_id
+                log(f"    🔗 恢复映射: {note['title']}")
+                adopted += 1
+            else:
+                self.state.clear_pending_note(webui_id)
+        return adopted
+
     # ==================== 同步逻辑 ====================
 
     def sync_notes_bidirectional(self):
-        """双向同步笔记（使用统一映射表）"""
+        """双向同步笔记（使用统一映射表）
+
+        WebUI 写入先在内存中排队，提交时在一个短事务内写完（Notion 请求期间不持有
+        webui.db 的写锁），依赖这些写入的映射表更新通过 after_commit 在提交后才落盘。每 sync.checkpoint_pages 条或
+        sync.checkpoint_seconds 秒提交一次作为检查点，中断时已提交的部分不用重做；
+        创建请求发出前先登记，中断后由 resolve_pending_notes 补上映射，不会重复创建
+        """
         log("  🔄 双向同步笔记")
 
         ai_notes_id = self.config['notion']['databases'].get('AI笔记')
@@ -384,18 +885,20 @@ class NotionSync:
             log("    ⚠️ AI笔记数据库未配置")
             return 0
 
-        state = load_state()
-        mapping = state.get('note_mapping', {})
-        notion_index = state.get('notion_to_webui_index', {})
+        mapping = self.state.note_mapping()
 
-        # 获取两边的数据
-        webui_notes = {n['id']: n for n in self.get_webui_notes()}
+        # 获取两边的数据（WebUI 只解析有变化的笔记）
+        webui_versions, webui_notes = self.load_webui_notes(mapping)
+        if webui_versions is None:
+            return 0
         notion_pages_list = self.query_database_all(ai_notes_id)
         notion_pages = {p['id']: p for p in notion_pages_list}
         
         default_user_id = self.get_webui_default_user_id()
 
-        log(f"    WebUI: {len(webui_notes)} 条, Notion: {len(notion_pages)} 条")
+        log(f"    WebUI: {len(webui_versions)} 条（变化 {len(webui_notes)}）, Notion: {len(notion_pages)} 条")
+        self.resolve_pending_notes(mapping, webui_notes, notion_pages)
+        timer = CheckpointTimer(self.checkpoint_pages, self.checkpoint_seconds)
 
         created_to_notion = 0
         created_to_webui = 0
@@ -404,220 +907,246 @@ class NotionSync:
         deleted_from_webui = 0
         skipped = 0
 
-        # 1. 处理已映射的笔记（检测更新和删除）
-        for webui_id in list(mapping.keys()):
-            info = mapping[webui_id]
-            notion_id = info.get('notion_id')
-            
-            webui_exists = webui_id in webui_notes
-            notion_exists = notion_id in notion_pages if notion_id else False
-            
-            # 两边都删了，清理映射
-            if not webui_exists and not notion_exists:
-                del mapping[webui_id]
-                continue
-            
-            # WebUI 删了，删除 Notion
-            if not webui_exists and notion_exists:
-                if self.archive_notion_page(notion_id):
-                    log(f"    🗑️ Notion: {info.get('title', 'Unknown')}")
-                    deleted_from_notion += 1
-                del mapping[webui_id]
-                continue
-            
-            # Notion 删了，删除 WebUI
-            if webui_exists and not notion_exists:
-                if self.delete_webui_note(webui_id):
-                    log(f"    🗑️ WebUI: {info.get('title', 'Unknown')}")
-                    deleted_from_webui += 1
-                del mapping[webui_id]
-                continue
-            
-            # 两边都存在，检测更新
-            webui_note = webui_notes[webui_id]
-            notion_page = notion_pages[notion_id]
-            
-            # 计算当前状态
-            webui_hash = content_hash(webui_note['title'] + webui_note['content'])
-            notion_timestamp = self.get_page_last_edited(notion_page)
-            
-            # 获取上次同步时的状态
-            old_hash = info.get('webui_hash')
-            old_timestamp = info.get('notion_timestamp')
-            
-            # 判断是否有变化
-            webui_changed = (old_hash != webui_hash)
-            notion_changed = (old_timestamp != notion_timestamp)
-            
-            # 两边都没变，跳过
-            if not webui_changed and not notion_changed:
-                skipped += 1
-                continue
-            
-            # 只有 Notion timestamp 变了，但需要检查内容是否真的变了
-            if notion_changed and not webui_changed:
-                # 获取 Notion 当前内容
-                raw_title = self.get_page_title(notion_page)
-                category = self.get_page_category(notion_page)
-                webui_title = format_title_with_category(raw_title, category)
-                content = self.get_page_content(notion_id)
+        with self.webui.batch():
+            # 1. 处理已映射的笔记（检测更新和删除）
+            for webui_id in list(mapping.keys()):
+                if timer.tick():
+                    self.webui.commit()
+                info = mapping[webui_id]
+                notion_id = info.get('notion_id')
                 
-                if not content:
-                    # 更新 timestamp 避免下次再检查
-                    mapping[webui_id]['notion_timestamp'] = notion_timestamp
-                    skipped += 1
-                    continue
+                webui_exists = webui_id in webui_versions
+                notion_exists = notion_id in notion_pages if notion_id else False
                 
-                # 检查 Notion 内容是否和 WebUI 当前内容一样
-                notion_hash = content_hash(webui_title + content)
-                if notion_hash == webui_hash:
-                    # 内容一样，只是 timestamp 变了（可能是 Notion 内部更新）
-                    mapping[webui_id]['notion_timestamp'] = notion_timestamp
-                    skipped += 1
+                # 两边都删了，清理映射
+                if not webui_exists and not notion_exists:
+                    del mapping[webui_id]
                     continue
                 
-                # 内容真的变了，更新到 WebUI
-                if self.update_webui_note(webui_id, webui_title, content):
-                    mapping[webui_id] = {
-                        'notion_id': notion_id,
-                        'webui_hash': notion_hash,
-                        'notion_timestamp': notion_timestamp,
-                        'title': webui_title
-                    }
-                    log(f"    ✏️ → WebUI: {webui_title}")
-                    updated += 1
-                continue
-            
-            # WebUI 变了，Notion 没变，更新到 Notion
-            if webui_changed and not notion_changed:
-                category, title = parse_title_category(webui_note['title'])
-                if self.update_notion_page(notion_id, title, webui_note['content'], category):
-                    # 更新后重新获取 Notion 的 timestamp
-                    new_page = self.api_request('GET', f"{NOTION_API}/pages/{notion_id}")
-                    new_timestamp = new_page.json().get('last_edited_time', '') if new_page else notion_timestamp
-                    mapping[webui_id] = {
-                        'notion_id': notion_id,
-                        'webui_hash': webui_hash,
-                        'notion_timestamp': new_timestamp,
-                        'title': webui_note['title']
-                    }
-                    log(f"    ✏️ → Notion: {title}")
-                    updated += 1
-                continue
-            
-            # 两边都变了，比较更新时间决定以谁为准
-            if webui_changed and notion_changed:
-                # 获取 Notion 内容
-                raw_title = self.get_page_title(notion_page)
-                category = self.get_page_category(notion_page)
-                webui_title = format_title_with_category(raw_title, category)
-                notion_content = self.get_page_content(notion_id)
+                # WebUI 删了，删除 Notion（同时移出本轮列表，避免第 3 步又建回 WebUI）
+                if not webui_exists and notion_exists:
+                    if self.archive_notion_page(notion_id):
+                        log(f"    🗑️ Notion: {info.get('title', 'Unknown')}")
+                        deleted_from_notion += 1
+                    notion_pages.pop(notion_id)
+                    del mapping[webui_id]
+                    continue
                 
-                if not notion_content:
-                    skipped += 1
+                # Notion 删了，删除 WebUI
+                if webui_exists and not notion_exists:
+                    if self.delete_webui_note(webui_id):
+                        log(f"    🗑️ WebUI: {info.get('title', 'Unknown')}")
+                        deleted_from_webui += 1
+                    self.webui.after_commit(partial(mapping.__delitem__, webui_id))
                     continue
                 
-                # 检查内容是否实际相同
-                notion_hash = content_hash(webui_title + notion_content)
-                if notion_hash == webui_hash:
-                    # 内容一样，不需要同步
-                    mapping[webui_id] = {
-                        'notion_id': notion_id,
-                        'webui_hash': webui_hash,
-                        'notion_timestamp': notion_timestamp,
-                        'title': webui_note['title']
-                    }
+                # 两边都存在，检测更新；webui_note 为 None 表示 WebUI 侧 updated_at 没变
+                webui_note = webui_notes.get(webui_id)
+                notion_page = notion_pages[notion_id]
+                
+                # 获取上次同步时的状态
+                old_hash = info.get('webui_hash')
+                old_timestamp = info.get('notion_timestamp')
+                
+                # 计算当前状态
+                webui_hash = content_hash(webui_note['title'] + webui_note['content']) if webui_note else old_hash
+                webui_updated_at = webui_note['updated_at'] if webui_note else info.get('webui_updated_at')
+                notion_timestamp = self.get_page_last_edited(notion_page)
+                
+                # 判断是否有变化
+                webui_changed = (old_hash != webui_hash)
+                notion_changed = (old_timestamp != notion_timestamp)
+                
+                # 两边都没变，跳过
+                if not webui_changed and not notion_changed:
+                    if webui_note:
+                        # updated_at 变了但内容没变，记下来下次不用再读
+                        mapping.update_fields(webui_id, webui_updated_at=webui_updated_at)
                     skipped += 1
                     continue
                 
-                # 内容不同，比较更新时间
-                from datetime import datetime as dt, timezone
-                try:
-                    notion_time = dt.fromisoformat(notion_timestamp.replace('Z', '+00:00'))
-                    # 转为无时区的 UTC 时间进行比较
-                    notion_time = notion_time.replace(tzinfo=None)
-                except:
-                    notion_time = dt.min
-                
-                try:
-                    webui_time = dt.fromtimestamp(webui_note['updated_at'] / 1_000_000_000)
-                except:
-                    webui_time = dt.min
+                # 只有 Notion timestamp 变了，但需要检查内容是否真的变了
+                if notion_changed and not webui_changed:
+                    # 获取 Notion 当前内容
+                    raw_title = self.get_page_title(notion_page)
+                    category = self.get_page_category(notion_page)
+                    webui_title = format_title_with_category(raw_title, category)
+                    content = self.get_page_content(notion_page)
+                    
+                    if not content:
+                        # 更新 timestamp 避免下次再检查
+                        mapping.update_fields(webui_id, notion_timestamp=notion_timestamp,
+                                              webui_updated_at=webui_updated_at)
+                        skipped += 1
+                        continue
+                    
+                    # 检查 Notion 内容是否和 WebUI 当前内容一样
+                    notion_hash = content_hash(webui_title + content)
+                    if notion_hash == webui_hash:
+                        # 内容一样，只是 timestamp 变了（可能是 Notion 内部更新）
+                        mapping.update_fields(webui_id, notion_timestamp=notion_timestamp,
+                                              webui_updated_at=webui_updated_at)
+                        skipped += 1
+                        continue
+                    
+                    # 内容真的变了，更新到 WebUI
+                    new_updated_at = self.update_webui_note(webui_id, webui_title, content)
+                    if new_updated_at:
+                        self.webui.after_commit(partial(mapping.__setitem__, webui_id, {
+                            'notion_id': notion_id,
+                            'webui_hash': notion_hash,
+                            'notion_timestamp': notion_timestamp,
+                            'title': webui_title,
+                            'webui_updated_at': new_updated_at
+                        }))
+                        log(f"    ✏️ → WebUI: {webui_title}")
+                        updated += 1
+                    continue
                 
-                if webui_time > notion_time:
-                    # WebUI 更新，同步到 Notion
+                # WebUI 变了，Notion 没变，更新到 Notion
+                if webui_changed and not notion_changed:
                     category, title = parse_title_category(webui_note['title'])
-                    if self.update_notion_page(notion_id, title, webui_note['content'], category):
-                        new_page = self.api_request('GET', f"{NOTION_API}/pages/{notion_id}")
-                        new_timestamp = new_page.json().get('last_edited_time', '') if new_page else notion_timestamp
+                    new_timestamp = self.update_notion_page(
+                        notion_id, title, webui_note['content'], category,
+                        known=(self.get_page_title(notion_page), self.get_page_category(notion_page),
+                               notion_timestamp))
+                    if new_timestamp is not None:
                         mapping[webui_id] = {
                             'notion_id': notion_id,
                             'webui_hash': webui_hash,
                             'notion_timestamp': new_timestamp,
-                            'title': webui_note['title']
+                            'title': webui_note['title'],
+                            'webui_updated_at': webui_updated_at
                         }
-                        log(f"    ⚠️ 冲突，WebUI 较新 → Notion: {title}")
+                        log(f"    ✏️ → Notion: {title}")
                         updated += 1
-                else:
-                    # Notion 更新，同步到 WebUI
-                    if self.update_webui_note(webui_id, webui_title, notion_content):
+                    continue
+                
+                # 两边都变了，比较更新时间决定以谁为准
+                if webui_changed and notion_changed:
+                    # 获取 Notion 内容
+                    raw_title = self.get_page_title(notion_page)
+                    category = self.get_page_category(notion_page)
+                    webui_title = format_title_with_category(raw_title, category)
+                    notion_content = self.get_page_content(notion_page)
+                    
+                    if not notion_content:
+                        skipped += 1
+                        continue
+                    
+                    # 检查内容是否实际相同
+                    notion_hash = content_hash(webui_title + notion_content)
+                    if notion_hash == webui_hash:
+                        # 内容一样，不需要同步
                         mapping[webui_id] = {
                             'notion_id': notion_id,
-                            'webui_hash': notion_hash,
+                            'webui_hash': webui_hash,
                             'notion_timestamp': notion_timestamp,
-                            'title': webui_title
+                            'title': webui_note['title'],
+                            'webui_updated_at': webui_updated_at
                         }
-                        log(f"    ⚠️ 冲突，Notion 较新 → WebUI: {webui_title}")
-                        updated += 1
+                        skipped += 1
+                        continue
+                    
+                    # 内容不同，比较更新时间
+                    from datetime import datetime as dt, timezone
+                    try:
+                        notion_time = dt.fromisoformat(notion_timestamp.replace('Z', '+00:00'))
+                        # 转为无时区的 UTC 时间进行比较
+                        notion_time = notion_time.replace(tzinfo=None)
+                    except:
+                        notion_time = dt.min
+                    
+                    try:
+                        webui_time = dt.fromtimestamp(webui_note['updated_at'] / 1_000_000_000)
+                    except:
+                        webui_time = dt.min
+                    
+                    if webui_time > notion_time:
+                        # WebUI 更新，同步到 Notion
+                        category, title = parse_title_category(webui_note['title'])
+                        new_timestamp = self.update_notion_page(
+                            notion_id, title, webui_note['content'], category,
+                            known=(self.get_page_title(notion_page), self.get_page_category(notion_page),
+                                   notion_timestamp))
+                        if new_timestamp is not None:
+                            mapping[webui_id] = {
+                                'notion_id': notion_id,
+                                'webui_hash': webui_hash,
+                                'notion_timestamp': new_timestamp,
+                                'title': webui_note['title'],
+                                'webui_updated_at': webui_updated_at
+                            }
+                            log(f"    ⚠️ 冲突，WebUI 较新 → Notion: {title}")
+                            updated += 1
+                    else:
+                        # Notion 更新，同步到 WebUI
+                        new_updated_at = self.update_webui_note(webui_id, webui_title, notion_content)
+                        if new_updated_at:
+                            self.webui.after_commit(partial(mapping.__setitem__, webui_id, {
+                                'notion_id': notion_id,
+                                'webui_hash': notion_hash,
+                                'notion_timestamp': notion_timestamp,
+                                'title': webui_title,
+                                'webui_updated_at': new_updated_at
+                            }))
+                            log(f"    ⚠️ 冲突，Notion 较新 → WebUI: {webui_title}")
+                            updated += 1
+
+            # 2. 处理 WebUI 中新增的笔记
+            for webui_id, note in webui_notes.items():
+                if webui_id in mapping:
+                    continue
+                if not note['content']:
+                    continue
+                if timer.tick():
+                    self.webui.commit()
+                
+                category, title = parse_title_category(note['title'])
+                # 请求失败时保留登记：可能只是响应超时，下次同步先按标题找回
+                self.state.add_pending_note(webui_id, title=title)
+                notion_id, last_edited = self.create_notion_page(ai_notes_id, title, note['content'], category)
+                if notion_id:
+                    self.link_note(mapping, webui_id, {
+                        'notion_id': notion_id,
+                        'webui_hash': content_hash(note['title'] + note['content']),
+                        'notion_timestamp': last_edited or datetime.now().isoformat(),
+                        'title': note['title'],
+                        'webui_updated_at': note['updated_at']
+                    })
+                    log(f"    ✓ → Notion: {note['title']}")
+                    created_to_notion += 1
 
-        # 2. 处理 WebUI 中新增的笔记
-        for webui_id, note in webui_notes.items():
-            if webui_id in mapping:
-                continue
-            if not note['content']:
-                continue
-            
-            category, title = parse_title_category(note['title'])
-            notion_id = self.create_notion_page(ai_notes_id, title, note['content'], category)
-            if notion_id:
-                mapping[webui_id] = {
-                    'notion_id': notion_id,
-                    'webui_hash': content_hash(note['title'] + note['content']),
-                    'notion_timestamp': datetime.now().isoformat(),
-                    'title': note['title']
-                }
-                log(f"    ✓ → Notion: {note['title']}")
-                created_to_notion += 1
-
-        # 3. 处理 Notion 中新增的笔记
-        # 重建反向索引
-        notion_index = {info['notion_id']: wid for wid, info in mapping.items() if info.get('notion_id')}
-        
-        for notion_id, page in notion_pages.items():
-            if notion_id in notion_index:
-                continue
-            
-            raw_title = self.get_page_title(page)
-            category = self.get_page_category(page)
-            webui_title = format_title_with_category(raw_title, category)
-            content = self.get_page_content(notion_id)
-            
-            if not content:
-                continue
+            # 3. 处理 Notion 中新增的笔记
+            notion_index = mapping.notion_index()
             
-            webui_id = self.create_webui_note(default_user_id, webui_title, content)
-            if webui_id:
-                mapping[webui_id] = {
-                    'notion_id': notion_id,
-                    'webui_hash': content_hash(webui_title + content),
-                    'notion_timestamp': self.get_page_last_edited(page),
-                    'title': webui_title
-                }
-                log(f"    ✓ → WebUI: {webui_title}")
-                created_to_webui += 1
-
-        state['note_mapping'] = mapping
-        save_state(state)
+            for notion_id, page in notion_pages.items():
+                if notion_id in notion_index:
+                    continue
+                if timer.tick():
+                    self.webui.commit()
+                
+                raw_title = self.get_page_title(page)
+                category = self.get_page_category(page)
+                webui_title = format_title_with_category(raw_title, category)
+                content = self.get_page_content(page)
+                
+                if not content:
+                    continue
+                
+                webui_id, new_updated_at = self.create_webui_note(default_user_id, webui_title, content)
+                if webui_id:
+                    # 笔记提交和映射写入之间被中断时，靠这条登记补上映射
+                    self.state.add_pending_note(webui_id, notion_id=notion_id, title=webui_title)
+                    self.webui.after_commit(partial(self.link_note, mapping, webui_id, {
+                        'notion_id': notion_id,
+                        'webui_hash': content_hash(webui_title + content),
+                        'notion_timestamp': self.get_page_last_edited(page),
+                        'title': webui_title,
+                        'webui_updated_at': new_updated_at
+                    }))
+                    log(f"    ✓ → WebUI: {webui_title}")
+                    created_to_webui += 1
 
         # 统计
         stats = []
@@ -645,10 +1174,11 @@ class NotionSync:
         if not ai_notes_id:
             return 0
 
-        state = load_state()
-        mapping = state.get('note_mapping', {})
+        mapping = self.state.note_mapping()
         
-        webui_notes = {n['id']: n for n in self.get_webui_notes()}
+        webui_versions, webui_notes = self.load_webui_notes(mapping)
+        if webui_versions is None:
+            return 0
         
         created = 0
         updated = 0
@@ -657,7 +1187,7 @@ class NotionSync:
 
         # 检测删除
         for webui_id in list(mapping.keys()):
-            if webui_id not in webui_notes:
+            if webui_id not in webui_versions:
                 info = mapping[webui_id]
                 notion_id = info.get('notion_id')
                 if notion_id and self.archive_notion_page(notion_id):
@@ -665,7 +1195,8 @@ class NotionSync:
                     deleted += 1
                 del mapping[webui_id]
 
-        # 检测新增和修改
+        # 检测新增和修改（updated_at 没变的笔记不会被读取）
+        skipped += sum(1 for webui_id in webui_versions if webui_id not in webui_notes)
         for webui_id, note in webui_notes.items():
             if not note['content']:
                 continue
@@ -676,29 +1207,28 @@ class NotionSync:
             if webui_id in mapping:
                 info = mapping[webui_id]
                 if info.get('webui_hash') == current_hash:
+                    mapping.update_fields(webui_id, webui_updated_at=note['updated_at'])
                     skipped += 1
                     continue
                 
                 notion_id = info.get('notion_id')
-                if notion_id and self.update_notion_page(notion_id, title, note['content'], category):
-                    mapping[webui_id]['webui_hash'] = current_hash
-                    mapping[webui_id]['title'] = note['title']
+                if notion_id and self.update_notion_page(notion_id, title, note['content'], category) is not None:
+                    mapping.update_fields(webui_id, webui_hash=current_hash, title=note['title'],
+                                          webui_updated_at=note['updated_at'])
                     log(f"    ✏️ {title}")
                     updated += 1
             else:
-                notion_id = self.create_notion_page(ai_notes_id, title, note['content'], category)
+                notion_id, _ = self.create_notion_page(ai_notes_id, title, note['content'], category)
                 if notion_id:
                     mapping[webui_id] = {
                         'notion_id': notion_id,
                         'webui_hash': current_hash,
-                        'title': note['title']
+                        'title': note['title'],
+                        'webui_updated_at': note['updated_at']
                     }
                     log(f"    ✓ {note['title']}")
                     created += 1
 
-        state['note_mapping'] = mapping
-        save_state(state)
-        
         stats = []
         if created > 0: stats.append(f"新建 {created}")
         if updated > 0: stats.append(f"更新 {updated}")
@@ -713,12 +1243,11 @@ class NotionSync:
         log("  📥 Notion → WebUI")
         
         ai_notes_id = self.config['notion']['databases'].get('AI笔记')
-        if not ai_notes_id or not os.path.exists(WEBUI_DB_PATH):
+        if not ai_notes_id or not self.webui.exists():
             return 0
 
-        state = load_state()
-        mapping = state.get('note_mapping', {})
-        notion_index = {info['notion_id']: wid for wid, info in mapping.items() if info.get('notion_id')}
+        mapping = self.state.note_mapping()
+        notion_index = mapping.notion_index()
         
         notion_pages = {p['id']: p for p in self.query_database_all(ai_notes_id)}
         default_user_id = self.get_webui_default_user_id()
@@ -728,54 +1257,55 @@ class NotionSync:
         deleted = 0
         skipped = 0
 
-        # 检测删除
-        for webui_id in list(mapping.keys()):
-            info = mapping[webui_id]
-            notion_id = info.get('notion_id')
-            if notion_id and notion_id not in notion_pages:
-                if self.delete_webui_note(webui_id):
-                    log(f"    🗑️ {info.get('title', 'Unknown')}")
-                    deleted += 1
-                del mapping[webui_id]
-
-        # 检测新增和修改
-        for notion_id, page in notion_pages.items():
-            raw_title = self.get_page_title(page)
-            category = self.get_page_category(page)
-            webui_title = format_title_with_category(raw_title, category)
-            timestamp = self.get_page_last_edited(page)
-            
-            if notion_id in notion_index:
-                webui_id = notion_index[notion_id]
-                info = mapping.get(webui_id, {})
-                
-                if info.get('notion_timestamp') == timestamp:
-                    skipped += 1
-                    continue
+        with self.webui.batch():
+            # 检测删除
+            for webui_id in list(mapping.keys()):
+                info = mapping[webui_id]
+                notion_id = info.get('notion_id')
+                if notion_id and notion_id not in notion_pages:
+                    if self.delete_webui_note(webui_id):
+                        log(f"    🗑️ {info.get('title', 'Unknown')}")
+                        deleted += 1
+                    self.webui.after_commit(partial(mapping.__delitem__, webui_id))
+
+            # 检测新增和修改
+            for notion_id, page in notion_pages.items():
+                raw_title = self.get_page_title(page)
+                category = self.get_page_category(page)
+                webui_title = format_title_with_category(raw_title, category)
+                timestamp = self.get_page_last_edited(page)
                 
-                content = self.get_page_content(notion_id)
-                if content and self.update_webui_note(webui_id, webui_title, content):
-                    mapping[webui_id]['notion_timestamp'] = timestamp
-                    mapping[webui_id]['title'] = webui_title
-                    log(f"    ✏️ {webui_title}")
-                    updated += 1
-            else:
-                content = self.get_page_content(notion_id)
-                if not content:
-                    continue
+                if notion_id in notion_index:
+                    webui_id = notion_index[notion_id]
+                    info = mapping.get(webui_id, {})
                     
-                webui_id = self.create_webui_note(default_user_id, webui_title, content)
-                if webui_id:
-                    mapping[webui_id] = {
-                        'notion_id': notion_id,
-                        'notion_timestamp': timestamp,
-                        'title': webui_title
-                    }
-                    log(f"    ✓ {webui_title}")
-                    created += 1
-
-        state['note_mapping'] = mapping
-        save_state(state)
+                    if info.get('notion_timestamp') == timestamp:
+                        skipped += 1
+                        continue
+                    
+                    content = self.get_page_content(page)
+                    new_updated_at = self.update_webui_note(webui_id, webui_title, content) if content else None
+                    if new_updated_at:
+                        self.webui.after_commit(partial(
+                            mapping.update_fields, webui_id,
+                            notion_timestamp=timestamp, title=webui_title, webui_updated_at=new_updated_at))
+                        log(f"    ✏️ {webui_title}")
+                        updated += 1
+                else:
+                    content = self.get_page_content(page)
+                    if not content:
+                        continue
+                        
+                    webui_id, new_updated_at = self.create_webui_note(default_user_id, webui_title, content)
+                    if webui_id:
+                        self.webui.after_commit(partial(mapping.__setitem__, webui_id, {
+                            'notion_id': notion_id,
+                            'notion_timestamp': timestamp,
+                            'title': webui_title,
+                            'webui_updated_at': new_updated_at
+                        }))
+                        log(f"    ✓ {webui_title}")
+                        created += 1
         
         stats = []
         if created > 0: stats.append(f"新建 {created}")
@@ -786,65 +1316,554 @@ class NotionSync:
         
         return created + updated
 
-    def sync_database_to_vector(self, db_name, db_id, with_summary=False):
-        """同步 Notion 数据库到向量库"""
-        log(f"  📚 {db_name} → 向量库")
-        pages = self.query_database_all(db_id)
-        total = len(pages)
-        log(f"    找到 {total} 个页面")
+    def sync_database_to_vector(self, db_name, db_id, with_summary=False, buffer=None):
+        """同步 Notion 数据库到向量库
 
-        if total == 0:
-            return 0
+        buffer 由 sync_all 传入时跨数据库共用，写入由调用方负责
+        """
+        if buffer is not None:
+            return self._sync_database_to_vector(db_name, db_id, with_summary, buffer)
+        with self.upsert_buffer() as own_buffer:
+            return self._sync_database_to_vector(db_name, db_id, with_summary, own_buffer)
 
-        state = load_state()
-        page_timestamps = state.get('page_timestamps', {})
-        summary_done = state.get('summary_done', [])
+    def _sync_database_to_vector(self, db_name, db_id, with_summary, buffer):
+        """流式同步：翻页查询 → 筛出有变化的页面 → 并发取正文 → 分块 / embedding → 写入
 
-        pages_to_sync = [(p, self.get_page_last_edited(p)) for p in pages 
-                         if page_timestamps.get(p['id']) != self.get_page_last_edited(p)]
+        每一步都是 generator 或有界队列，内存占用和数据库大小无关；
+        第一页查询结果回来就开始取正文和写入，不等翻页结束。
 
-        if not pages_to_sync:
-            log(f"    ✅ 无更新，跳过 {total}")
-            return 0
-
-        log(f"    需要同步: {len(pages_to_sync)}, 跳过: {total - len(pages_to_sync)}")
+        页面按编辑时间倒序处理，每 sync.checkpoint_pages 页或 sync.checkpoint_seconds 秒
+        把进度（已处理到的编辑时间）存为检查点，检查点之前的文档全部写入向量库后才落盘。
+        进程被杀或中途请求失败时，下次同步从检查点继续，不再从头扫描。
+        """
+        log(f"  📚 {db_name} → 向量库")
+        watermark, last_full_scan = self.state.watermark(db_id)
+        checkpoint = self.state.checkpoint(db_id)
+        if checkpoint:
+            full_scan, since, before = checkpoint['full_scan'], checkpoint['since'], checkpoint['before']
+            log(f"    [{db_name}] ⏩ 从检查点继续{'全量扫描' if full_scan else '增量查询'}"
+                f" (≤ {before}，此前已扫描 {checkpoint['scanned']})")
+        else:
+            full_scan = self.needs_full_scan(last_full_scan) or not watermark
+            since, before = (None if full_scan else watermark), None
+            log(f"    [{db_name}] {'全量扫描' if full_scan else f'增量查询 (≥ {watermark})'}")
+        self.report('vector', database=db_name, status='running', full_scan=full_scan,
+                    resumed=checkpoint is not None)
+
+        # 开启自动总结时，还没写回过总结的页面也要处理（补齐存量复盘）
+        summarize = with_summary and self.auto_summary
+        summarized = {}     # 待处理页面中已写回过总结的 {page_id: content_hash}
+        scan = {"complete": False, "total": 0, "changed": 0,
+                "latest": (checkpoint['latest'] or '') if checkpoint else ''}
+        live_ids = set()    # 全量扫描时用于清理已删除页面，只存 ID
+        scanned_before = (checkpoint['scanned'] or 0) if checkpoint else 0
+        timer = CheckpointTimer(self.checkpoint_pages, self.checkpoint_seconds)
+
+        def query_pages():
+            scan["complete"] = yield from self.iter_database(db_id, since=since, before=before)
+
+        def changed_pages():
+            # 翻页在后台线程进行，按查询分页大小分批对照状态库；
+            # 检查点以 (None, 进度) 的形式和页面一起按顺序往下游传
+            pages = prefetch(query_pages(), maxsize=QUERY_PREFETCH, name=f'query-{db_name}')
+            for batch in batched(pages, NOTION_PAGE_SIZE):
+                page_ids = [p['id'] for p in batch]
+                timestamps = self.state.page_timestamps(page_ids)
+                done = self.state.summarized_pages(page_ids) if summarize else {}
+                for page in batch:
+                    last_edited = self.get_page_last_edited(page)
+                    if timer.tick():
+                        # 之前的页面编辑时间都不早于这一页，从这一页（含）续跑不会漏页
+                        yield None, {"before": last_edited, "latest": scan["latest"],
+                                     "scanned": scanned_before + scan["total"]}
+                    scan["total"] += 1
+                    scan["latest"] = max(scan["latest"], last_edited)
+                    if full_scan:
+                        live_ids.add(page['id'])
+                    if timestamps.get(page['id']) != last_edited or (summarize and page['id'] not in done):
+                        scan["changed"] += 1
+                        if page['id'] in done:
+                            summarized[page['id']] = done[page['id']]
+                        yield page, last_edited
 
         synced = 0
-        for i, (page, last_edited) in enumerate(pages_to_sync):
+        failed = 0
+        processed = 0
+        # 获取失败的页面中最早的编辑时间，水位线回退到这里
+        oldest_failed = checkpoint['unsynced'] if checkpoint else None
+        summaries = {}          # Future → (page_id, title, segments, last_edited, content_hash)
+        max_pending = self.ollama.concurrency * 4
+
+        def finish_summary(future):
+            nonlocal synced
+            page_id, title, segments, last_edited, digest = summaries.pop(future)
+            try:
+                summary = future.result() or None
+            except Exception as e:
+                log(f"    [{db_name}] ⚠️ 总结失败 {title or page_id}: {e}")
+                summary = None
+            if summary:
+                self.state.put_summary(digest, self.ai_model, summary)
+                last_edited = self.write_summary(page_id, digest, summary, summarized, last_edited)
+            if self.upsert_page_chunks(buffer, db_name, page_id, title, segments, last_edited, summary):
+                synced += 1
+
+        def save_checkpoint(progress):
+            # 总结还没生成完的页面和获取失败的一样，续跑后水位线回退到它们
+            pending = [info[3] for info in summaries.values()]
+            unsynced = min([t for t in (oldest_failed, *pending) if t], default=None)
+            buffer.defer(partial(self.state.save_checkpoint, db_id, dict(
+                progress, full_scan=full_scan, since=since, unsynced=unsynced)))
+
+        contents = self.fetch_contents(
+            changed_pages(), lambda item: self.page_segments(item[0]) if item[0] else None)
+        for (page, last_edited), segments, error in contents:
+            if page is None:
+                save_checkpoint(last_edited)
+                continue
             page_id = page['id']
             title = self.get_page_title(page)
-            
-            if (i + 1) % 10 == 0 or (i + 1) == len(pages_to_sync):
-                log(f"    同步中: {i + 1}/{len(pages_to_sync)}")
-            
-            content = self.get_page_content(page_id)
-            if not content:
-                page_timestamps[page_id] = last_edited
+
+            processed += 1
+            if processed % 10 == 0:
+                log(f"    [{db_name}] 同步中: {processed}（已扫描 {scan['total']}）")
+                self.report('vector', database=db_name, done=processed, scanned=scan['total'])
+
+            if error:
+                # 不记录 timestamp，水位线回退到该页面，下次同步重试
+                log(f"    [{db_name}] ⚠️ 获取失败 {title or page_id}: {error}")
+                oldest_failed = min(oldest_failed or last_edited, last_edited)
+                failed += 1
                 continue
 
-            doc_id = f"notion_{page_id.replace('-', '')}"
-            self.collection.upsert(
-                ids=[doc_id],
-                documents=[content],
-                metadatas=[{
-                    "title": title or "无标题",
-                    "source": "notion",
-                    "database": db_name,
-                    "page_id": page_id,
-                    "updated_at": datetime.now().isoformat()
-                }]
-            )
-            
-            page_timestamps[page_id] = last_edited
-            synced += 1
+            summary = None
+            if summarize:
+                digest, summary = self.cached_summary(segments)
+                if summary is None:
+                    # 没有缓存的总结交给 Ollama 并发生成，生成后再写入向量库；
+                    # 排队的总结数有上限，满了先处理已完成的
+                    future = self.ollama.submit(summary_prompt(segments_text(segments)), num_predict=200)
+                    summaries[future] = (page_id, title, segments, last_edited, digest)
+                    if len(summaries) >= max_pending:
+                        for done_future in wait(summaries, return_when=FIRST_COMPLETED).done:
+                            finish_summary(done_future)
+                    continue
+                last_edited = self.write_summary(page_id, digest, summary, summarized, last_edited)
+
+            if self.upsert_page_chunks(buffer, db_name, page_id, title, segments, last_edited, summary):
+                synced += 1
+
+        if summaries:
+            log(f"    [{db_name}] 🤖 等待总结: {len(summaries)} 篇")
+            for done, future in enumerate(as_completed(list(summaries)), 1):
+                finish_summary(future)
+                if done % 10 == 0:
+                    self.report('summary', database=db_name, done=done)
+
+        total, changed = scan["total"], scan["changed"]
+        if scan["complete"] and full_scan:
+            if checkpoint:
+                # 续跑时没有看到检查点之前的页面，不能据此清理；也不算一次完整的全量扫描
+                log(f"    [{db_name}] 续跑的全量扫描不清理已删除页面，下次同步重新核对")
+            else:
+                self.state.set_last_full_scan(db_id, datetime.now().isoformat())
+                self.sweep_orphans(db_name, db_id, live_ids, buffer)
+        # 新水位线要等本库的文档全部写入向量库后才生效，同时删除检查点；
+        # 查询中途失败时保留检查点，下次从那里继续
+        if scan["complete"] and (total or checkpoint):
+            new_watermark = max(watermark or '', scan["latest"])
+            if oldest_failed:
+                new_watermark = min(new_watermark, oldest_failed)
+
+            def finish_scan():
+                self.state.set_watermark(db_id, new_watermark)
+                self.state.clear_checkpoint(db_id)
+
+            buffer.defer(finish_scan)
+
+        SYNC_PAGES.inc(total - changed, database=db_name, result='skipped')
+        SYNC_PAGES.inc(changed - failed, database=db_name, result='fetched')
+        SYNC_PAGES.inc(synced, database=db_name, result='upserted')
+        SYNC_PAGES.inc(failed, database=db_name, result='failed')
+        if not changed:
+            log(f"    [{db_name}] ✅ 无更新，跳过 {total}")
+        else:
+            log(f"    [{db_name}] ✅ 扫描 {total}, 同步 {synced}, 跳过 {total - changed}"
+                + (f", 失败 {failed}" if failed else ""))
+        self.report('vector', database=db_name, status='done', pages=total, synced=synced, failed=failed)
+        return synced
 
-        state['page_timestamps'] = page_timestamps
-        state['summary_done'] = summary_done
-        save_state(state)
+    def sweep_orphans(self, db_name, db_id, live_ids, buffer):
+        """全量扫描后清理已在 Notion 删除 / 归档的页面
+
+        向量库中属于该数据库、但页面不在 live_ids 里的块分批删除（BM25 索引随之删除），
+        状态库的页面记录和本地镜像在删除写入后一起清理。
+        向量库按 ID 分页读取（不取 metadata）；从旧版 JSON 导入、没有所属数据库的页面记录
+        按向量库里的归属补上 database，之后同样能被清理。
+        """
+        if not live_ids:
+            # 查询结果为空多半是权限或配置问题，不据此清空整个数据库
+            return
+        orphans = []
+        orphan_pages = set()
+        stored_pages = set()
+        offset = 0
+        while True:
+            batch = self.collection.get(where={"database": db_name}, include=[], limit=1000, offset=offset)
+            if not batch['ids']:
+                break
+            offset += len(batch['ids'])
+            for doc_id in batch['ids']:
+                # 块 ID 为 notion_<page_id 去掉横线>_<哈希>，旧版整页文档为 notion_<page_id 去掉横线>
+                page_id = format_uuid(doc_id[len('notion_'):].split('_')[0])
+                stored_pages.add(page_id)
+                if page_id not in live_ids:
+                    orphans.append(doc_id)
+                    orphan_pages.add(page_id)
+        unassigned = self.state.unassigned_pages() & stored_pages
+        if unassigned:
+            self.state.assign_database(unassigned, db_name)
+        orphan_pages.update(p for p in self.state.database_pages(db_name) if p not in live_ids)
+        mirror_pages = [p for p in self.mirror.page_ids(format_uuid(db_id)) if p not in live_ids]
+        if not orphans and not orphan_pages and not mirror_pages:
+            return
+
+        reclaimed = 0
+        for i in range(0, len(orphans), 500):
+            batch = self.collection.get(ids=orphans[i:i + 500], include=['documents', 'embeddings'])
+            reclaimed += sum(len((doc or '').encode()) for doc in batch['documents'])
+            reclaimed += sum(4 * len(embedding) for embedding in batch['embeddings'] if embedding is not None)
+        buffer.delete(orphans)
+        buffer.defer(partial(self.state.forget_pages, orphan_pages))
+        buffer.defer(partial(self.mirror.delete, orphan_pages.union(mirror_pages)))
+
+        with self._stats_lock:
+            self.gc_stats["vectors"] += len(orphans)
+            self.gc_stats["bytes"] += reclaimed
+            self.gc_stats["pages"] += len(orphan_pages)
+            self.gc_stats["last_run"] = datetime.now().isoformat()
+        log(f"    [{db_name}] 🧹 清理已删除页面 {len(orphan_pages)} 个，向量 {len(orphans)} 条"
+            f"（约 {reclaimed / 1024:.1f} KB）")
+        self.report('gc', database=db_name, pages=len(orphan_pages), vectors=len(orphans), bytes=reclaimed)
+
+    def cached_summary(self, segments):
+        """返回 (内容哈希, 已缓存的总结)；没有缓存时总结为 None，空页面为空字符串"""
+        text = segments_text(segments)
+        digest = content_hash(text)
+        if not text.strip():
+            return digest, ''
+        return digest, self.state.get_summary(digest, self.ai_model)
+
+    def write_summary(self, page_id, digest, summary, summarized, last_edited):
+        """把总结写回 Notion 页面的 review.summary_property 属性，同一份内容只写一次
+
+        写回会更新页面的 last_edited_time：返回 PATCH 响应里的新时间（没有写回时原样返回
+        last_edited），调用方用它记录同步状态，本地镜像也改用新时间，
+        下次同步不会因为自己写的总结再拉一遍正文。
+        """
+        if summarized.get(page_id) == digest:
+            return last_edited
+        if summary:
+            url = f"{NOTION_API}/pages/{page_id}"
+            payload = {"properties": {self.summary_property: {
+                "rich_text": [{"type": "text", "text": {"content": summary[:2000]}}]
+            }}}
+            response = self.api_request('PATCH', url, json=payload)
+            if not response or response.status_code != 200:
+                log(f"    ⚠️ 总结写回失败: {response.status_code if response else '请求失败'}")
+                return last_edited
+            new_last_edited = response.json().get('last_edited_time')
+            if new_last_edited and new_last_edited != last_edited:
+                self.mirror.retime(page_id, last_edited, new_last_edited)
+                last_edited = new_last_edited
+        self.state.mark_summarized(page_id, digest)
+        summarized[page_id] = digest
+        return last_edited
+
+    def upsert_page_chunks(self, buffer, db_name, page_id, title, segments, last_edited, summary=None):
+        """分块写入一个页面，只对内容变化的块做 embedding，返回新写入的块数
+
+        块 ID 由内容哈希生成（见 modules/chunker.py），已存在的块只更新 metadata，
+        不再出现的块和旧版整页文档（notion_<page_id>）会被删除。
+        summary 不为空时写入每个块的 metadata。
+        """
+        prefix = f"notion_{page_id.replace('-', '')}"
+        old_ids = self.state.page_chunks(page_id)
+        if old_ids is None:
+            # 分块之前整页存为一个文档
+            old_ids = [prefix]
+
+        chunks = chunk_segments(segments, self.chunk_size, self.chunk_overlap)
+        new_ids = chunk_ids(prefix, chunks)
+        existing = set(old_ids)
+        updated_at = datetime.now().isoformat()
+        last_edited_ts = iso_timestamp(last_edited) if last_edited else None
+
+        embedded = 0
+        for index, (doc_id, text) in enumerate(zip(new_ids, chunks)):
+            metadata = {
+                "title": title or "无标题",
+                "source": "notion",
+                "database": db_name,
+                "page_id": page_id,
+                "chunk_index": index,
+                "chunk_hash": chunk_hash(text),
+                "updated_at": updated_at
+            }
+            if last_edited_ts is not None:
+                metadata["last_edited_ts"] = last_edited_ts
+            if summary:
+                metadata["summary"] = summary
+            if doc_id in existing:
+                buffer.update_metadata(doc_id, metadata)
+            else:
+                buffer.add(doc_id, text, metadata)
+                embedded += 1
+
+        stale = existing - set(new_ids)
+        if stale:
+            buffer.delete(stale)
+        # 全部写入向量库后才记录为已同步
+        buffer.defer(partial(self.state.mark_page_synced, page_id, last_edited, db_name, new_ids))
+        return embedded
+
+    def upsert_buffer(self):
+        return UpsertBuffer(self.collection, self.upsert_batch_size,
+                            transaction=self.state.transaction, indexes=[self.lexical],
+                            on_write=self.on_vector_write, embed=self.embedding_function)
+
+    def sync_blogs(self, paths=None):
+        """增量索引 blog.path（默认 /blogs）下的 Markdown 到 blog collection，返回写入的文件数
+
+        manifest 里 size 和 mtime 都没变的文件不读；变化的文件在进程池里解析，
+        内容哈希没变的只更新 manifest，其余按块增量写入（同 upsert_page_chunks）；
+        已删除的文件删除全部向量。manifest 在对应的写入完成后才更新。
+        paths 为文件监听报告的相对路径（文件或目录），只检查这些路径
+        """
+        if not self.blog_path.is_dir():
+            log(f"  📰 博客目录不存在，跳过: {self.blog_path}")
+            return 0
+        started = time.monotonic()
+        manifest = self.state.blog_manifest()
+        if paths is None:
+            files = scan_markdown(self.blog_path)
+        else:
+            files, covers = scan_paths(self.blog_path, paths)
+            manifest = {path: info for path, info in manifest.items() if covers(path)}
+        changed, removed = diff_manifest(files, manifest)
+        if not changed and not removed:
+            if paths is None:
+                log(f"  📰 博客: {len(files)} 篇无变化（{time.monotonic() - started:.2f}s）")
+            return 0
+        log(f"  📰 博客: {len(files)} 篇，变化 {len(changed)}，删除 {len(removed)}")
 
-        log(f"    ✅ 同步 {synced}")
+        synced = 0
+        failed = 0
+        updated_at = datetime.now().isoformat()
+        with UpsertBuffer(self.blog_collection, self.upsert_batch_size, transaction=self.state.transaction,
+                          on_write=self.on_vector_write, embed=self.embedding_function) as buffer:
+            for i, (path, parsed) in enumerate(parse_files(self.blog_path, changed, self.blog_workers), 1):
+                if i % 50 == 0:
+                    self.report('blog', done=i, total=len(changed))
+                size, mtime_ns = files[path]
+                if 'error' in parsed:
+                    log(f"    ⚠️ 读取失败 {path}: {parsed['error']}")
+                    failed += 1
+                    continue
+                old = manifest.get(path)
+                if old and old['content_hash'] == parsed['content_hash']:
+                    self.state.put_blog_file(path, size, mtime_ns, parsed['content_hash'])
+                    continue
+
+                chunks = chunk_segments(parsed['segments'], self.chunk_size, self.chunk_overlap)
+                new_ids = chunk_ids(f"blog_{content_hash(path)[:16]}", chunks)
+                existing = set(old['chunk_ids']) if old else set()
+                for index, (doc_id, text) in enumerate(zip(new_ids, chunks)):
+                    metadata = {
+                        "title": parsed['title'],
+                        "source": "blog",
+                        "path": path,
+                        "chunk_index": index,
+                        "chunk_hash": chunk_hash(text),
+                        "last_edited_ts": mtime_ns / 1e9,
+                        "updated_at": updated_at
+                    }
+                    if doc_id in existing:
+                        buffer.update_metadata(doc_id, metadata)
+                    else:
+                        buffer.add(doc_id, text, metadata)
+                stale = existing - set(new_ids)
+                if stale:
+                    buffer.delete(stale)
+                buffer.defer(partial(self.state.put_blog_file, path, size, mtime_ns,
+                                     parsed['content_hash'], new_ids))
+                synced += 1
+
+            for path in removed:
+                buffer.delete(manifest[path]['chunk_ids'])
+            if removed:
+                buffer.defer(partial(self.state.forget_blog_files, removed))
+
+        log(f"    ✅ 博客: 写入 {synced} 篇，删除 {len(removed)} 篇"
+            + (f"，失败 {failed}" if failed else "") + f"（{time.monotonic() - started:.1f}s）")
         return synced
 
+    def backfill_search_metadata(self):
+        """给按 updated_after 过滤之前写入的文档补上 last_edited_ts，只执行一次"""
+        if self.state.get('metadata_version', 1) >= 2:
+            return
+        total = self.collection.count()
+        log(f"  🏷️ 补全向量库 metadata: {total} 条")
+        with self.upsert_buffer() as buffer:
+            for offset in range(0, total, 1000):
+                batch = self.collection.get(limit=1000, offset=offset, include=['metadatas'])
+                metadatas = [m or {} for m in batch['metadatas']]
+                timestamps = self.state.page_timestamps(
+                    {m['page_id'] for m in metadatas if m.get('page_id') and 'last_edited_ts' not in m})
+                for doc_id, metadata in zip(batch['ids'], metadatas):
+                    last_edited = timestamps.get(metadata.get('page_id'))
+                    if last_edited and 'last_edited_ts' not in metadata:
+                        buffer.update_metadata(doc_id, dict(metadata, last_edited_ts=iso_timestamp(last_edited)))
+            buffer.defer(partial(self.state.set, 'metadata_version', 2))
+
+    def ensure_lexical_index(self):
+        """BM25 索引和向量库文档数不一致时（首次启用、索引文件被删、旧版索引没有过滤字段）从向量库重建"""
+        total = self.collection.count()
+        if self.lexical.count() == total:
+            return
+        log(f"  🔤 重建关键词索引: {total} 条")
+        self.lexical.clear()
+        for offset in range(0, total, 1000):
+            batch = self.collection.get(limit=1000, offset=offset, include=['documents', 'metadatas'])
+            self.lexical.upsert(batch['ids'], batch['documents'], batch['metadatas'])
+
+    def needs_full_scan(self, last_full_scan):
+        """距上次全量扫描超过 sync.full_scan_interval 时需要全量核对"""
+        if not last_full_scan:
+            return True
+        try:
+            elapsed = datetime.now() - datetime.fromisoformat(last_full_scan)
+        except ValueError:
+            return True
+        return elapsed.total_seconds() >= self.full_scan_interval
+
+    def sync_notes(self):
+        """按 notes.flow 同步笔记"""
+        if self.flow == 'bidirectional':
+            return self.sync_notes_bidirectional()
+        if self.flow == 'webui_to_notion':
+            return self.sync_webui_to_notion_only()
+        if self.flow == 'notion_to_webui':
+            return self.sync_notion_to_webui_only()
+        return 0
+
+    def notion_unchanged(self, notion_id, info):
+        """映射的 Notion 页面在上次同步之后没有被修改（已归档、读取失败都算修改过）
+
+        编辑时间和映射表不同时再核对内容：和上次同步的内容相同也算没改
+        （旧版双向同步新建页面时记的是本地时间）
+        """
+        page = self.fetch_page(notion_id)
+        if not page or page.get('archived'):
+            return False
+        if self.get_page_last_edited(page) == info.get('notion_timestamp'):
+            return True
+        title = format_title_with_category(self.get_page_title(page), self.get_page_category(page))
+        return content_hash(title + self.get_page_content(page)) == info.get('webui_hash')
+
+    def sync_webui_changes(self):
+        """只把 WebUI 侧变化的笔记推到 Notion（webui.db 变化时由文件监听触发），返回写入数
+
+        不查询整个 Notion 数据库：新笔记直接建页面，修改过的笔记逐个读取对应页面，
+        页面在上次同步之后也被改过（冲突）或已归档时跳过，留给完整同步按更新时间处理；
+        有待确认创建记录的笔记同样留给完整同步（resolve_pending_notes）。
+        Notion → WebUI 方向仍由定时的完整同步负责。
+        """
+        if self.flow not in ('bidirectional', 'webui_to_notion'):
+            return 0
+        ai_notes_id = self.config['notion']['databases'].get('AI笔记')
+        if not ai_notes_id:
+            return 0
+
+        mapping = self.state.note_mapping()
+        webui_versions, webui_notes = self.load_webui_notes(mapping)
+        if webui_versions is None:
+            return 0
+        removed = [webui_id for webui_id in mapping.keys() if webui_id not in webui_versions]
+        if not webui_notes and not removed:
+            return 0
+        log(f"  👀 WebUI 笔记变化 → Notion: 修改 {len(webui_notes)}，删除 {len(removed)}")
+        pending = {item['webui_id'] for item in self.state.pending_notes()}
+
+        created = 0
+        updated = 0
+        deleted = 0
+        deferred = 0
+
+        for webui_id in removed:
+            info = mapping[webui_id]
+            notion_id = info.get('notion_id')
+            if notion_id and self.archive_notion_page(notion_id):
+                log(f"    🗑️ Notion: {info.get('title', 'Unknown')}")
+                deleted += 1
+            del mapping[webui_id]
+
+        for webui_id, note in webui_notes.items():
+            if not note['content'] or webui_id in pending:
+                continue
+            current_hash = content_hash(note['title'] + note['content'])
+            category, title = parse_title_category(note['title'])
+            info = mapping.get(webui_id)
+
+            if info is None:
+                self.state.add_pending_note(webui_id, title=title)
+                notion_id, last_edited = self.create_notion_page(ai_notes_id, title, note['content'], category)
+                if notion_id:
+                    # 记下页面真实的编辑时间（创建响应里的），之后再改这条笔记时不会被当成冲突
+                    self.link_note(mapping, webui_id, {
+                        'notion_id': notion_id,
+                        'webui_hash': current_hash,
+                        'notion_timestamp': last_edited or datetime.now().isoformat(),
+                        'title': note['title'],
+                        'webui_updated_at': note['updated_at']
+                    })
+                    log(f"    ✓ → Notion: {note['title']}")
+                    created += 1
+                continue
+
+            if info.get('webui_hash') == current_hash:
+                mapping.update_fields(webui_id, webui_updated_at=note['updated_at'])
+                continue
+
+            notion_id = info.get('notion_id')
+            if self.flow == 'bidirectional' and not self.notion_unchanged(notion_id, info):
+                log(f"    ⏭️ Notion 侧也有变化，留给完整同步: {title}")
+                deferred += 1
+                continue
+            known = None
+            if self.flow == 'bidirectional':
+                # 上面确认过 Notion 侧没改，页面的标题和分类就是映射表里上次同步的
+                known_category, known_title = parse_title_category(info.get('title') or '')
+                known = (known_title, known_category, info.get('notion_timestamp'))
+            new_timestamp = self.update_notion_page(notion_id, title, note['content'], category, known=known)
+            if new_timestamp is not None:
+                mapping.update_fields(webui_id, webui_hash=current_hash, notion_timestamp=new_timestamp,
+                                      title=note['title'], webui_updated_at=note['updated_at'])
+                log(f"    ✏️ → Notion: {title}")
+                updated += 1
+
+        stats = []
+        if created > 0: stats.append(f"新建 {created}")
+        if updated > 0: stats.append(f"更新 {updated}")
+        if deleted > 0: stats.append(f"删除 {deleted}")
+        if deferred > 0: stats.append(f"留给完整同步 {deferred}")
+        log(f"    ✅ {', '.join(stats) if stats else '无变化'}")
+
+        # AI笔记 的向量按水位线增量同步，只会查询到刚写入的页面
+        if created or updated:
+            self.sync_database_to_vector('AI笔记', ai_notes_id)
+        return created + updated
+
     def sync_all(self):
         log("🔄 开始同步...")
         flow_desc = {
@@ -853,91 +1872,418 @@ class NotionSync:
             'webui_to_notion': 'WebUI → Notion'
         }
         log(f"  📋 模式: {flow_desc.get(self.flow, self.flow)}")
+        self.warm_up()
+        self.ensure_lexical_index()
+        self.backfill_search_metadata()
         
-        results = {'notes': 0, 'vector': 0}
-
-        # 笔记同步
-        if self.flow == 'bidirectional':
-            results['notes'] = self.sync_notes_bidirectional()
-        elif self.flow == 'webui_to_notion':
-            results['notes'] = self.sync_webui_to_notion_only()
-        elif self.flow == 'notion_to_webui':
-            results['notes'] = self.sync_notion_to_webui_only()
-
-        # 向量库同步
-        log("  📊 Notion → 向量库")
-        for db_name, db_id in self.config['notion'].get('databases', {}).items():
-            results['vector'] += self.sync_database_to_vector(db_name, db_id, db_name == '复盘')
-
-        state = load_state()
-        state['last_sync'] = datetime.now().isoformat()
-        save_state(state)
+        # 笔记同步和各数据库的向量同步作为任务图并发执行，共用 Notion 限流器和写入缓冲；
+        # 笔记同步会写 AI笔记 数据库，所以 AI笔记 的向量同步排在它之后
+        databases = self.config['notion'].get('databases', {})
+        graph = TaskGraph()
+        graph.add('notes', self.sync_notes)
+        graph.add('blog', self.sync_blogs)
+        buffer = self.upsert_buffer()
+        for db_name, db_id in databases.items():
+            deps = ['notes'] if db_name == 'AI笔记' else []
+            graph.add(f'vector:{db_name}',
+                      partial(self.sync_database_to_vector, db_name, db_id,
+                              db_name == '复盘', buffer=buffer),
+                      deps=deps)
+            self.report('vector', database=db_name, status='pending')
+
+        def task_phase(name):
+            phase, _, db_name = name.partition(':')
+            return phase, db_name or None
+
+        def on_start(name):
+            phase, db_name = task_phase(name)
+            self.report(phase, database=db_name, status='running')
+
+        def on_done(name, outcome):
+            SYNC_LAST_DURATION.set(round(outcome.seconds, 3), task=name)
+            phase, db_name = task_phase(name)
+            info = {"status": "done", "seconds": round(outcome.seconds, 2)}
+            if outcome.error is not None:
+                info.update(status='failed', error=str(outcome.error))
+            self.report(phase, database=db_name, **info)
+
+        # 全部任务结束（包括失败）后写入缓冲里剩余的文档
+        started = time.monotonic()
+        with buffer:
+            tasks = graph.run(on_start=on_start, on_done=on_done)
+        SYNC_LAST_DURATION.set(round(time.monotonic() - started, 3), task='total')
+
+        results = {
+            'notes': tasks['notes'].result or 0,
+            'blog': tasks['blog'].result or 0,
+            'vector': sum(r.result or 0 for name, r in tasks.items() if name.startswith('vector:'))
+        }
+        failed = {name: r.error for name, r in tasks.items() if r.error is not None}
 
         log("=" * 50)
-        log("✅ 同步完成!")
+        log("✅ 同步完成!" if not failed else f"⚠️ 同步完成，{len(failed)} 个任务失败")
         log(f"  📝 笔记: {results['notes']} 条")
         log(f"  📊 向量库: {results['vector']} 页")
+        log(f"  📰 博客: {results['blog']} 篇")
         log(f"  📁 总计: {self.collection.count()} 条")
-        
-        return results['notes'] + results['vector']
-
-    def search(self, query, limit=5):
+        log("  ⏱️ 耗时: " + ", ".join(f"{name} {r.seconds:.1f}s" for name, r in tasks.items()))
+        for name, error in failed.items():
+            log(f"  ❌ {name}: {error}")
+
+        if failed:
+            SYNC_RUNS.inc(result='failed')
+            raise RuntimeError(f"同步任务失败: {', '.join(failed)}")
+        SYNC_RUNS.inc(result='success')
+        SYNC_LAST_SUCCESS.set(time.time())
+        self.state.set('last_sync', datetime.now().isoformat())
+        return results['notes'] + results['vector'] + results['blog']
+
+    def search(self, query, limit=5, mode='vector', filters=None, offset=0):
         try:
-            results = self.collection.query(query_texts=[query], n_results=limit)
-            items = []
-            if results and results['documents']:
-                for i, doc in enumerate(results['documents'][0]):
-                    meta = results['metadatas'][0][i] if results['metadatas'] else {}
-                    items.append({
-                        "title": meta.get('title', 'Untitled'),
-                        "content": doc[:1000],
-                        "database": meta.get('database', ''),
-                    })
-            return items
+            return self.search_batch([query], limit, mode, filters, offset)[0]
         except:
             return []
 
+    def search_batch(self, queries, limit=5, mode='vector', filters=None, offset=0):
+        """多个查询一起检索，返回每个查询的结果列表
+
+        mode: vector 向量检索 / bm25 关键词检索 / hybrid 两者并行后按 RRF 融合
+        filters 见 search_where()，下推到 Chroma 的 where 执行；offset / limit 按页面分页。
+        结果按 (query, limit, offset, mode, filters) 缓存，向量库有写入后失效。
+        """
+        started = time.monotonic()
+        where = search_where(filters)
+        generation = self.generation
+        keys = [(query, limit, offset, mode, repr(where)) for query in queries]
+        results = [self.search_results.get(key, generation) for key in keys]
+        todo = [i for i, items in enumerate(results) if items is MISSING]
+        if todo:
+            computed = self._search([queries[i] for i in todo], limit, offset, mode, where)
+            for i, items in zip(todo, computed):
+                results[i] = items
+                self.search_results.put(keys[i], items, generation)
+        elapsed = time.monotonic() - started
+        self.search_latency["miss" if todo else "hit"].record(elapsed)
+        SEARCH_SECONDS.observe(elapsed, cache="miss" if todo else "hit")
+        return results
+
+    def _search(self, queries, limit, offset, mode, where):
+        # 一个页面可能命中多个块，多取一些再按页面去重
+        n = (offset + limit) * 3
+        if mode in ('vector', 'hybrid'):
+            vector_future = self.search_pool.submit(self.vector_search, queries, n, where)
+        lexical = [[doc_id for doc_id, _ in self.lexical.search(query, n, where)] for query in queries] \
+            if mode in ('bm25', 'hybrid') else None
+
+        if mode == 'hybrid':
+            docs = vector_future.result()
+            rankings = [rrf_fuse([list(d), ids]) for d, ids in zip(docs, lexical)]
+        elif mode == 'bm25':
+            docs = [{} for _ in queries]
+            rankings = lexical
+        else:
+            docs = vector_future.result()
+            rankings = [list(d) for d in docs]
+
+        # BM25 命中而向量检索没返回的块：一次取回（BM25 已按同样的条件过滤，这里再核对一次）
+        missing = {doc_id for d, ranked in zip(docs, rankings) for doc_id in ranked if doc_id not in d}
+        extra = {}
+        if missing:
+            found = self.collection.get(ids=list(missing), include=['documents', 'metadatas'],
+                                        **({'where': where} if where else {}))
+            extra = dict(zip(found['ids'], zip(found['documents'], found['metadatas'])))
+
+        return [self._page_results(ranked, d, extra, limit, offset) for d, ranked in zip(docs, rankings)]
+
+    def _page_results(self, ranked, docs, extra, limit, offset):
+        items = []
+        seen_pages = set()
+        for doc_id in ranked:
+            if len(items) >= offset + limit:
+                break
+            doc = docs.get(doc_id) or extra.get(doc_id)
+            if doc is None:
+                continue
+            doc, meta = doc
+            meta = meta or {}
+            page_key = meta.get('page_id') or doc_id
+            if page_key in seen_pages:
+                continue
+            seen_pages.add(page_key)
+            items.append({
+                "title": meta.get('title', 'Untitled'),
+                "content": doc[:1000],
+                "database": meta.get('database', ''),
+            })
+        return items[offset:]
+
+    def query_embedding_batch(self, queries):
+        """查询向量，没缓存的一次性交给 embedding 模型"""
+        embeddings = {query: self.query_embeddings.get(query) for query in queries}
+        missing = [query for query, embedding in embeddings.items() if embedding is MISSING]
+        if missing:
+            self.warm_up()
+            for query, embedding in zip(missing, self.embedding_function(missing)):
+                embeddings[query] = embedding
+                self.query_embeddings.put(query, embedding)
+        return [embeddings[query] for query in queries]
+
+    def vector_search(self, queries, n, where=None):
+        """每个查询返回 {doc_id: (document, metadata)}，按相似度排序"""
+        results = self.collection.query(query_embeddings=self.query_embedding_batch(queries), n_results=n,
+                                        **({'where': where} if where else {}))
+        output = []
+        for i in range(len(queries)):
+            ids = results['ids'][i] if results and results['ids'] else []
+            documents = results['documents'][i] if results['documents'] else [''] * len(ids)
+            metadatas = results['metadatas'][i] if results['metadatas'] else [None] * len(ids)
+            output.append(dict(zip(ids, zip(documents, metadatas))))
+        return output
+
 
 # ==================== Flask API ====================
 
 syncer = None
+job_runner = None
+startup_job = None
+_init_lock = threading.Lock()
+watchers = {}           # 名称 → DirectoryWatcher
+_blog_changes = set()   # 文件监听报告、还没被博客任务处理的路径
+_watch_lock = threading.Lock()
 
 def get_syncer():
     global syncer
-    if syncer is None:
-        config = load_config()
-        if config:
-            syncer = NotionSync(config)
+    with _init_lock:
+        if syncer is None:
+            config = load_config()
+            if config:
+                syncer = NotionSync(config)
     return syncer
 
+def run_sync_job(job):
+    s = get_syncer()
+    if not s:
+        raise RuntimeError("配置不存在")
+    s.progress = job.update
+    try:
+        return {"synced": s.sync_all()}
+    finally:
+        s.progress = None
+
+def run_blog_job(job):
+    """文件监听触发：只检查监听报告的路径，没有积攒的路径时做一次完整的增量扫描"""
+    s = get_syncer()
+    if not s:
+        raise RuntimeError("配置不存在")
+    with _watch_lock:
+        paths = set(_blog_changes)
+        _blog_changes.clear()
+    return {"synced": s.sync_blogs(paths or None)}
+
+def run_notes_job(job):
+    s = get_syncer()
+    if not s:
+        raise RuntimeError("配置不存在")
+    return {"synced": s.sync_webui_changes()}
+
+def start_watchers(config):
+    """监听 /blogs 和 webui.db，变化去抖后提交对应的后台任务
+
+    提交时不合并到正在执行的同类任务（它可能已经读过变化之前的内容），
+    只合并到还在排队的任务；同一时间仍只有一个任务在执行
+    """
+    watch_config = config.get('watch') or {}
+    if not watch_config.get('enabled', True):
+        return []
+    options = {
+        "mode": watch_config.get('mode', 'auto'),
+        "debounce": float(watch_config.get('debounce', 2)),
+        "max_delay": float(watch_config.get('max_delay', 30)),
+        "poll_interval": float(watch_config.get('poll_interval', 5)),
+        "log": log
+    }
+    runner = get_job_runner()
+
+    def on_blog_change(paths):
+        with _watch_lock:
+            _blog_changes.update(paths)
+        runner.submit('blog', source='watch', merge_running=False)
+
+    def on_webui_change(paths):
+        runner.submit('notes', source='watch', merge_running=False)
+
+    webui_db = Path(WEBUI_DB_PATH)
+    webui_files = {webui_db.name, f"{webui_db.name}-wal"}
+    targets = [
+        ('blog', Path((config.get('blog') or {}).get('path', BLOG_PATH)), on_blog_change,
+         dict(recursive=True, match=lambda name: name.lower().endswith(MARKDOWN_SUFFIXES))),
+        ('webui', webui_db.parent, on_webui_change,
+         dict(recursive=False, match=webui_files.__contains__)),
+    ]
+    for name, root, on_change, kwargs in targets:
+        if not root.is_dir():
+            log(f"⚠️ 监听目录不存在，跳过: {root}")
+            continue
+        try:
+            watcher = DirectoryWatcher(root, on_change, name=f'watch-{name}', **kwargs, **options).start()
+        except OSError as e:
+            log(f"❌ 启动监听失败 {root}: {e}")
+            continue
+        watchers[name] = watcher
+        log(f"👀 监听 {root}（{watcher.backend_name}）")
+    return list(watchers.values())
+
+def warm_up_in_background(s):
+    def run():
+        try:
+            s.warm_up()
+        except Exception as e:
+            log(f"❌ 预热失败: {e}")
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
+
+def index_not_ready(s):
+    """向量库还没打开时返回 503 响应，否则返回 None"""
+    if s.readiness.reached('index_ready'):
+        return None
+    response = jsonify({"error": "索引加载中，请稍后重试", "readiness": s.readiness.snapshot()})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def get_job_runner():
+    """后台任务队列：同步在工作线程里执行，同一时间只有一个任务
+
+    sync 为完整同步；blog / notes 由文件监听提交，只处理变化的博客文件和 WebUI 笔记
+    """
+    global job_runner
+    with _init_lock:
+        if job_runner is None:
+            job_runner = JobRunner({'sync': run_sync_job, 'blog': run_blog_job,
+                                    'notes': run_notes_job}, log=log).start()
+    return job_runner
+
 @app.route('/')
 def index():
     return jsonify({"status": "ok", "version": "2.4"})
 
 @app.route('/sync', methods=['POST'])
 def do_sync():
-    s = get_syncer()
-    if not s:
+    """提交同步任务并立即返回任务 ID；已有同步在排队或执行时合并到该任务
+
+    ?wait=1 时等待任务完成再返回（旧版的同步调用方式）
+    """
+    if not load_config():
         return jsonify({"error": "配置不存在"}), 500
-    return jsonify({"success": True, "synced": s.sync_all()})
+    job, coalesced = get_job_runner().submit('sync')
+    if request.args.get('wait'):
+        job.wait()
+        return jsonify(dict(job.to_dict(), success=job.status == 'done'))
+    return jsonify({"success": True, "job_id": job.id, "status": job.status,
+                    "coalesced": coalesced}), 202
+
+@app.route('/jobs')
+def list_jobs():
+    return jsonify({"jobs": [
+        {k: v for k, v in job.to_dict().items() if k != 'progress'}
+        for job in reversed(get_job_runner().jobs())
+    ]})
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = get_job_runner().get(job_id)
+    if not job:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/search', methods=['POST'])
 def do_search():
     s = get_syncer()
     if not s:
         return jsonify({"error": "配置不存在"}), 500
+    not_ready = index_not_ready(s)
+    if not_ready:
+        return not_ready
+    data = request.json or {}
+    error = check_search_args(data)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify({"results": s.search(data.get('query', ''), int(data.get('limit', 5)),
+                                        data.get('mode', 'vector'), data.get('filters'),
+                                        int(data.get('offset', 0)))})
+
+@app.route('/search/batch', methods=['POST'])
+def do_search_batch():
+    """{"queries": [...], "limit": 5, "offset": 0, "mode": "vector",
+        "filters": {"database": "复盘", "updated_after": "2024-01-01"}}"""
+    s = get_syncer()
+    if not s:
+        return jsonify({"error": "配置不存在"}), 500
+    not_ready = index_not_ready(s)
+    if not_ready:
+        return not_ready
     data = request.json or {}
-    return jsonify({"results": s.search(data.get('query', ''), data.get('limit', 5))})
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return jsonify({"error": "queries 必须是字符串列表"}), 400
+    if len(queries) > SEARCH_BATCH_MAX:
+        return jsonify({"error": f"一次最多 {SEARCH_BATCH_MAX} 个查询"}), 400
+    error = check_search_args(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    limit = int(data.get('limit', 5))
+    offset = int(data.get('offset', 0))
+    try:
+        results = s.search_batch(queries, limit, data.get('mode', 'vector'), data.get('filters'), offset)
+    except Exception as e:
+        log(f"❌ 批量搜索失败: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": [
+        {"query": query, "results": items,
+         "next_offset": offset + limit if len(items) == limit else None}
+        for query, items in zip(queries, results)
+    ]})
+
+def check_search_args(data):
+    """检查 /search 和 /search/batch 的公共参数，返回错误信息或 None"""
+    if data.get('mode', 'vector') not in SEARCH_MODES:
+        return f"mode 只能是 {', '.join(SEARCH_MODES)}"
+    try:
+        if int(data.get('limit', 5)) < 1 or int(data.get('offset', 0)) < 0:
+            return "limit 必须 ≥ 1，offset 必须 ≥ 0"
+        search_where(data.get('filters'))
+    except (TypeError, ValueError) as e:
+        return f"参数错误: {e}"
+    return None
+
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/status')
 def status():
-    state = load_state()
     config = load_config()
     s = get_syncer()
+    active = [job.id for job in get_job_runner().jobs() if job.active]
+    initial = startup_job.to_dict() if startup_job else None
     return jsonify({
-        "last_sync": state.get('last_sync'),
-        "documents": s.collection.count() if s else 0,
-        "flow": config.get('notes', {}).get('flow') if config else None
+        "last_sync": get_state_store().get('last_sync'),
+        "readiness": s.readiness.snapshot() if s else None,
+        "initial_sync": {k: initial[k] for k in ('id', 'status', 'error')} if initial else None,
+        "active_jobs": active,
+        "documents": s.document_count() if s else 0,
+        "flow": config.get('notes', {}).get('flow') if config else None,
+        "notion_api": s.get_api_stats() if s else None,
+        "embedding_cache": s.embedding_cache.snapshot() if s else None,
+        "page_mirror": s.mirror.snapshot() if s else None,
+        "ollama": s.ollama.snapshot() if s else None,
+        "gc": dict(s.gc_stats) if s else None,
+        "watchers": {name: dict(w.stats, backend=w.backend_name) for name, w in watchers.items()},
+        "search_cache": {
+            "generation": s.generation,
+            "results": s.search_results.snapshot(),
+            "embeddings": s.query_embeddings.snapshot(),
+            "latency": {k: v.snapshot() for k, v in s.search_latency.items()}
+        } if s else None
     })
 
 
@@ -948,14 +2294,16 @@ if __name__ == '__main__':
         log(f"📄 数据库: {list(config['notion']['databases'].keys())}")
         flow = config.get('notes', {}).get('flow', 'webui_to_notion')
         log(f"🔄 模式: {flow}")
-        
-        try:
-            s = get_syncer()
-            if s:
-                s.sync_all()
-        except Exception as e:
-            log(f"❌ 初始同步失败: {e}")
-            import traceback
-            traceback.print_exc()
+
+        # 先起 HTTP 服务：向量库和模型在后台加载，初始同步作为后台任务执行
+        warm_up_in_background(get_syncer())
+        runner = get_job_runner()
+        startup_job, _ = runner.submit('sync', source='startup')
+        log(f"📋 初始同步任务: {startup_job.id}")
+
+        interval = int((config.get('sync') or {}).get('interval', 3600))
+        if runner.schedule('sync', interval):
+            log(f"⏰ 定时同步: 每 {interval} 秒")
+        start_watchers(config)
 
     app.run(host='0.0.0.0', port=5100, debug=False)
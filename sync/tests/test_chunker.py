@@ -0,0 +1,47 @@
+"""
+modules/chunker.py 的 overlap 范围检查与块边界稳定性
+
+在 sync/ 目录下运行：python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.chunker import chunk_ids, chunk_segments, clamp_overlap
+
+
+def test_clamp_overlap():
+    assert clamp_overlap(800, 150) == 150
+    assert clamp_overlap(800, 800) == 400
+    assert clamp_overlap(800, 5000) == 400
+    assert clamp_overlap(800, -10) == 0
+
+
+def test_overlap_not_smaller_than_chunk_size():
+    text = ''.join(chr(ord('a') + i % 26) for i in range(10_000))
+    for overlap in (100, 101, 500):
+        chunks = chunk_segments([('paragraph', text)], max_chars=100, overlap=overlap)
+        # 窗口每次至少前进 max_chars // 2，而不是退化成一个字符
+        assert len(chunks) <= 2 * len(text) // 100
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert chunks[0] == text[:100] and text.endswith(chunks[-1])
+
+
+def test_sections_with_large_overlap():
+    segments = [('heading_1', '标题')] + [('paragraph', f'段落 {i} ' * 10) for i in range(50)]
+    chunks = chunk_segments(segments, max_chars=200, overlap=1000)
+    assert chunks == chunk_segments(segments, max_chars=200, overlap=100)
+
+
+def test_edit_keeps_distant_chunk_ids():
+    paragraphs = [f'第 {i} 段：' + f'内容{i} ' * (15 + i % 7) for i in range(60)]
+    before = chunk_ids('page', chunk_segments([('paragraph', p) for p in paragraphs], max_chars=800, overlap=150))
+
+    paragraphs[2] += ' 新增' * 100   # 第 2 段加长约 300 字
+    after = chunk_ids('page', chunk_segments([('paragraph', p) for p in paragraphs], max_chars=800, overlap=150))
+
+    assert len(before) > 8
+    # 只有改动附近到下一个内容切分点的几块变化，后面的块 ID 都保持不变
+    assert len(set(before) - set(after)) <= 3
+    assert before[3:] == after[-(len(before) - 3):]
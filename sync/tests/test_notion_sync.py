@@ -0,0 +1,134 @@
+"""
+sync_service.NotionSync 对 Notion 的写入和向量同步，跑在 bench/fake_notion.py 的替身上
+
+需要 chromadb / requests 等运行依赖（容器里都有），缺少时跳过。
+在 sync/ 目录下运行：python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip('chromadb')
+pytest.importorskip('requests')
+
+from bench.fake_notion import FakeNotion
+from bench.run import make_syncer
+
+
+def start_syncer(notion, workdir):
+    args = SimpleNamespace(embedding='hash', verbose=False, notion_rate=1000, workers=4,
+                           checkpoint_pages=5, checkpoint_seconds=3600)
+    syncer = make_syncer(args, notion.url, notion.databases, workdir)
+    # 记下每个请求的 (方法, URL, 请求体)
+    syncer.calls = []
+    api_request = syncer.api_request
+
+    def recording(method, url, **kwargs):
+        syncer.calls.append((method, url.replace(notion.url, ''), kwargs.get('json')))
+        return api_request(method, url, **kwargs)
+
+    syncer.api_request = recording
+    return syncer
+
+
+@pytest.fixture
+def notion():
+    with FakeNotion(pages=40, seed=7) as fake:
+        yield fake
+
+
+@pytest.fixture
+def syncer(notion, tmp_path):
+    return start_syncer(notion, tmp_path)
+
+
+def writes(syncer):
+    return [(method, url.split('/')[1], body) for method, url, body in syncer.calls if method != 'GET']
+
+
+# ==================== update_notion_page ====================
+
+def paragraphs(*texts):
+    return ''.join(text.ljust(2000, '.') for text in texts)
+
+
+def test_update_only_writes_changed_blocks(notion, syncer):
+    content = paragraphs('一', '二', '三', '四')
+    page_id, created = syncer.create_notion_page(notion.databases['AI笔记'], '标题', content, '读书')
+
+    syncer.calls.clear()
+    last_edited = syncer.update_notion_page(page_id, '标题', paragraphs('一', '二改', '三', '四'), '读书',
+                                            known=('标题', '读书', created))
+    # 只 PATCH 改了的段落，标题和分类没变不写属性
+    assert [(method, kind) for method, kind, _ in writes(syncer)] == [('PATCH', 'blocks')]
+    assert last_edited == syncer.fetch_page(page_id)['last_edited_time']
+
+
+def test_update_only_patches_changed_properties(notion, syncer):
+    content = paragraphs('一', '二')
+    page_id, created = syncer.create_notion_page(notion.databases['AI笔记'], '标题', content, '读书')
+
+    syncer.calls.clear()
+    last_edited = syncer.update_notion_page(page_id, '新标题', content, '读书', known=('标题', '读书', created))
+    assert writes(syncer) == [('PATCH', 'pages', {"properties": {"名称": {"title": [{"text": {"content": "新标题"}}]}}})]
+    page = syncer.fetch_page(page_id)
+    assert syncer.get_page_title(page) == '新标题' and syncer.get_page_category(page) == '读书'
+    assert last_edited == page['last_edited_time']
+
+    syncer.calls.clear()
+    assert syncer.update_notion_page(page_id, '新标题', content, '读书',
+                                     known=('新标题', '读书', last_edited)) == last_edited
+    assert writes(syncer) == []
+
+
+def test_update_without_known_writes_properties(notion, syncer):
+    page_id, _ = syncer.create_notion_page(notion.databases['AI笔记'], '标题', paragraphs('一'), '读书')
+
+    syncer.calls.clear()
+    syncer.update_notion_page(page_id, '标题', paragraphs('一'), '读书')
+    assert [(method, kind) for method, kind, _ in writes(syncer)] == [('PATCH', 'pages')]
+
+
+# ==================== 检查点续跑 ====================
+
+def fetched_pages(syncer, page_ids):
+    """取过正文的页面（GET /blocks/{page_id}/children，不算 toggle 等子 block）"""
+    return {url.split('/')[2] for method, url, _ in syncer.calls if url.endswith('/children')} & page_ids
+
+
+def test_resume_from_checkpoint(tmp_path):
+    # 1100 页时 目标 库有 110 页，查询要翻两页（每页 100）
+    with FakeNotion(pages=1100, seed=7) as notion:
+        db_id = notion.databases['目标']
+        syncer = start_syncer(notion, tmp_path)
+        pages = syncer.query_database_all(db_id)
+        page_ids = {page['id'] for page in pages}
+        assert len(page_ids) == 110
+        api_request = syncer.api_request
+
+        def second_page_fails(method, url, **kwargs):
+            if url.endswith('/query') and 'start_cursor' in (kwargs.get('json') or {}):
+                return None
+            return api_request(method, url, **kwargs)
+
+        syncer.api_request = second_page_fails
+        syncer.sync_database_to_vector('目标', db_id)
+        checkpoint = syncer.state.checkpoint(db_id)
+        assert checkpoint is not None and checkpoint['full_scan']
+        assert syncer.state.watermark(db_id)[0] is None
+        first_run = fetched_pages(syncer, page_ids)
+        assert len(first_run) == 100
+
+        # 新进程从检查点继续：检查点之前写入向量库的页面不再取正文
+        syncer = start_syncer(notion, tmp_path)
+        syncer.sync_database_to_vector('目标', db_id)
+        second_run = fetched_pages(syncer, page_ids)
+        assert page_ids - first_run <= second_run
+        assert len(second_run) <= 10 + syncer.checkpoint_pages
+        assert syncer.state.checkpoint(db_id) is None
+        assert syncer.state.watermark(db_id)[0] == max(syncer.get_page_last_edited(page) for page in pages)
+        assert len(syncer.state.page_timestamps(page_ids)) == 110
@@ -0,0 +1,93 @@
+"""
+modules/state_store.py 的旧版 sync_state.json 导入
+
+在 sync/ 目录下运行：python -m pytest -q tests
+"""
+import json
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.state_store import StateStore
+
+LEGACY_STATE = {
+    "note_mapping": {
+        "note-1": {"notion_id": "page-1", "webui_hash": "h1",
+                   "notion_timestamp": "2024-03-01T08:00:00.000Z", "title": "一",
+                   "webui_updated_at": 1709280000},
+        "note-2": {"notion_id": "page-2", "webui_hash": "h2",
+                   "notion_timestamp": "2024-03-02T09:30:00.000Z", "title": "二"}
+    },
+    "page_timestamps": {"page-1": "2024-03-01T08:00:00.000Z", "page-3": "2024-02-28T23:59:00.000Z"},
+    "page_chunks": {"page-1": ["notion_page1_a", "notion_page1_b"]},
+    "db_watermarks": {"db-1": "2024-03-02T09:30:00.000Z"},
+    "last_full_scan": {"db-1": "2024-03-01T00:00:00"},
+    "summary_done": ["page-1"],
+    "last_sync": "2024-03-02T10:00:00"
+}
+
+
+def snapshot(store):
+    return {
+        "notes": dict(store.note_mapping().items()),
+        "timestamps": store.page_timestamps(["page-1", "page-3"]),
+        "chunks": store.page_chunks("page-1"),
+        "watermark": tuple(store.watermark("db-1")),
+        "summarized": store.summarized_pages(["page-1"]),
+        "last_sync": store.get("last_sync")
+    }
+
+
+def write_legacy(tmp_path):
+    path = tmp_path / "sync_state.json"
+    path.write_text(json.dumps(LEGACY_STATE, ensure_ascii=False, indent=2))
+    return path
+
+
+def test_import_preserves_timestamps(tmp_path):
+    legacy = write_legacy(tmp_path)
+    store = StateStore(tmp_path / "sync_state.db", legacy_json=legacy)
+
+    state = snapshot(store)
+    assert state["notes"]["note-1"]["notion_timestamp"] == "2024-03-01T08:00:00.000Z"
+    assert state["notes"]["note-1"]["webui_updated_at"] == 1709280000
+    assert state["notes"]["note-2"]["notion_timestamp"] == "2024-03-02T09:30:00.000Z"
+    assert state["timestamps"] == LEGACY_STATE["page_timestamps"]
+    assert state["chunks"] == ["notion_page1_a", "notion_page1_b"]
+    assert state["watermark"] == ("2024-03-02T09:30:00.000Z", "2024-03-01T00:00:00")
+    assert "page-1" in state["summarized"]
+    assert state["last_sync"] == "2024-03-02T10:00:00"
+    # 导入页面不知道所属数据库，留给全量扫描补上
+    assert store.unassigned_pages() == {"page-1", "page-3"}
+    assert not legacy.exists() and legacy.with_name("sync_state.json.migrated").exists()
+
+
+def test_import_is_idempotent(tmp_path):
+    legacy = write_legacy(tmp_path)
+    store = StateStore(tmp_path / "sync_state.db", legacy_json=legacy)
+    first = snapshot(store)
+
+    # 导入后、重命名前被杀：下次启动同一份 JSON 再导入一遍，结果不变
+    shutil.copy(legacy.with_name("sync_state.json.migrated"), legacy)
+    store = StateStore(tmp_path / "sync_state.db", legacy_json=legacy)
+    assert snapshot(store) == first
+    assert not legacy.exists()
+
+
+def test_import_keeps_newer_progress(tmp_path):
+    legacy = write_legacy(tmp_path)
+    store = StateStore(tmp_path / "sync_state.db", legacy_json=legacy)
+    store.mark_page_synced("page-1", "2024-04-01T00:00:00.000Z", database="笔记", chunk_ids=["notion_page1_c"])
+    store.set_watermark("db-1", "2024-04-01T00:00:00.000Z")
+    store.note_mapping().update_fields("note-1", notion_timestamp="2024-04-01T00:00:00.000Z")
+
+    shutil.copy(legacy.with_name("sync_state.json.migrated"), legacy)
+    store = StateStore(tmp_path / "sync_state.db", legacy_json=legacy)
+    state = snapshot(store)
+    assert state["timestamps"]["page-1"] == "2024-04-01T00:00:00.000Z"
+    assert state["chunks"] == ["notion_page1_c"]
+    assert state["watermark"][0] == "2024-04-01T00:00:00.000Z"
+    assert state["notes"]["note-1"]["notion_timestamp"] == "2024-04-01T00:00:00.000Z"
+    assert store.unassigned_pages() == {"page-3"}